@@ -0,0 +1,180 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from auth.cache import get_bus
+
+logger = logging.getLogger(__name__)
+
+ALERT_KINDS = ("above", "below", "change")
+
+
+def alert_threshold(kind: str, threshold: Optional[float], percent: Optional[float],
+                    base_price: Optional[float]) -> Tuple[str, float]:
+    """(direction, absolute price) a rule fires at; ``change`` rules are fixed against their base price."""
+    if kind == "change":
+        target = base_price * (1 + percent / 100)
+        return ("above" if percent >= 0 else "below"), round(target, 4)
+    return kind, threshold
+
+
+class ThresholdIndex:
+    """Per item, ``(threshold, rule_id)`` pairs kept sorted for each direction.
+
+    A price update finds every rule it triggers with one binary search per
+    direction: ``above`` rules are the prefix with threshold <= price,
+    ``below`` rules the suffix with threshold >= price.
+    """
+
+    def __init__(self):
+        self._above: Dict[str, List[Tuple[float, int]]] = {}
+        self._below: Dict[str, List[Tuple[float, int]]] = {}
+
+    def _side(self, direction: str) -> Dict[str, List[Tuple[float, int]]]:
+        return self._above if direction == "above" else self._below
+
+    def add(self, key: str, direction: str, threshold: float, rule_id: int):
+        insort(self._side(direction).setdefault(key, []), (threshold, rule_id))
+
+    def remove(self, key: str, direction: str, threshold: float, rule_id: int):
+        side = self._side(direction)
+        entries = side.get(key)
+        if not entries:
+            return
+        index = bisect_left(entries, (threshold, rule_id))
+        if index < len(entries) and entries[index] == (threshold, rule_id):
+            del entries[index]
+        if not entries:
+            del side[key]
+
+    def triggered(self, key: str, price: float) -> List[Tuple[str, float, int]]:
+        fired = []
+        above = self._above.get(key)
+        if above:
+            end = bisect_right(above, (price, float("inf")))
+            fired += [("above", threshold, rule_id) for threshold, rule_id in above[:end]]
+        below = self._below.get(key)
+        if below:
+            start = bisect_left(below, (price, float("-inf")))
+            fired += [("below", threshold, rule_id) for threshold, rule_id in below[start:]]
+        return fired
+
+    def __len__(self) -> int:
+        return sum(len(entries) for side in (self._above, self._below) for entries in side.values())
+
+
+class AlertEngine:
+    """User price alert rules (``price_alerts``) evaluated through a :class:`ThresholdIndex`.
+
+    Rules are one-shot: a triggered rule is marked in SQLite and appended to
+    ``alert_events``. The conditional update makes each rule fire once even if
+    several workers hold it in their index.
+    """
+
+    def __init__(self, database: str):
+        self.bus = get_bus(database)
+        self.index = ThresholdIndex()
+        self._rules: Dict[int, Tuple[str, str, float]] = {}
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        conn = self.bus.connection()
+        rows = conn.execute("""
+            SELECT id, appid, market_hash_name, kind, threshold, percent, base_price, triggered_at
+            FROM price_alerts WHERE id > ? ORDER BY id
+        """, (self._last_id,)).fetchall()
+        for rule_id, appid, market_hash_name, kind, threshold, percent, base_price, triggered_at in rows:
+            self._last_id = rule_id
+            if triggered_at is not None:
+                continue
+            key = f"{appid}:{market_hash_name}"
+            direction, target = alert_threshold(kind, threshold, percent, base_price)
+            self.index.add(key, direction, target, rule_id)
+            self._rules[rule_id] = (key, direction, target)
+
+    def _forget(self, rule_id: int):
+        rule = self._rules.pop(rule_id, None)
+        if rule is not None:
+            self.index.remove(rule[0], rule[1], rule[2], rule_id)
+
+    def create(self, steam_id: str, appid: str, market_hash_name: str, kind: str, threshold: Optional[float],
+               percent: Optional[float], base_price: Optional[float]) -> Dict[str, Any]:
+        _, target = alert_threshold(kind, threshold, percent, base_price)
+        conn = self.bus.connection()
+        with conn:
+            cursor = conn.execute("""
+                INSERT INTO price_alerts
+                    (steam_id, appid, market_hash_name, kind, threshold, percent, base_price, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (steam_id, appid, market_hash_name, kind, target, percent, base_price, time.time()))
+        with self._lock:
+            self._sync()
+        return {"id": cursor.lastrowid, "appid": appid, "market_hash_name": market_hash_name, "kind": kind,
+                "threshold": target, "percent": percent, "base_price": base_price}
+
+    def delete(self, steam_id: str, alert_id: int) -> bool:
+        conn = self.bus.connection()
+        with conn:
+            deleted = conn.execute(
+                "DELETE FROM price_alerts WHERE id = ? AND steam_id = ?", (alert_id, steam_id)).rowcount
+        if deleted:
+            with self._lock:
+                self._forget(alert_id)
+        return bool(deleted)
+
+    def rules(self, steam_id: str) -> List[Dict[str, Any]]:
+        conn = self.bus.connection()
+        rows = conn.execute("""
+            SELECT id, appid, market_hash_name, kind, threshold, percent, base_price, created_at, triggered_at
+            FROM price_alerts WHERE steam_id = ? ORDER BY id
+        """, (steam_id,)).fetchall()
+        columns = ["id", "appid", "market_hash_name", "kind", "threshold", "percent", "base_price",
+                   "created_at", "triggered_at"]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def evaluate(self, appid: str, prices: Iterable[Tuple[str, float]]) -> int:
+        fired = []
+        with self._lock:
+            self._sync()
+            if not self._rules:
+                return 0
+            for market_hash_name, price in prices:
+                key = f"{appid}:{market_hash_name}"
+                for _, _, rule_id in self.index.triggered(key, price):
+                    fired.append((rule_id, market_hash_name, price))
+                    self._forget(rule_id)
+        if not fired:
+            return 0
+
+        now = time.time()
+        conn = self.bus.connection()
+        delivered = 0
+        with conn:
+            for rule_id, market_hash_name, price in fired:
+                claimed = conn.execute(
+                    "UPDATE price_alerts SET triggered_at = ? WHERE id = ? AND triggered_at IS NULL",
+                    (now, rule_id)).rowcount
+                if not claimed:
+                    continue
+                conn.execute("""
+                    INSERT INTO alert_events (alert_id, steam_id, appid, market_hash_name, kind, threshold, price,
+                                              created_at)
+                    SELECT id, steam_id, appid, market_hash_name, kind, threshold, ?, ?
+                    FROM price_alerts WHERE id = ?
+                """, (price, now, rule_id))
+                delivered += 1
+        if delivered:
+            logger.info(f"{delivered} price alerts triggered for appid {appid}")
+        return delivered
+
+    def events(self, steam_id: str, since_id: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+        conn = self.bus.connection()
+        rows = conn.execute("""
+            SELECT id, alert_id, appid, market_hash_name, kind, threshold, price, created_at
+            FROM alert_events WHERE steam_id = ? AND id > ? ORDER BY id LIMIT ?
+        """, (steam_id, since_id, limit)).fetchall()
+        columns = ["id", "alert_id", "appid", "market_hash_name", "kind", "threshold", "price", "created_at"]
+        return [dict(zip(columns, row)) for row in rows]
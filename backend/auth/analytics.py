@@ -0,0 +1,138 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DATE_FORMAT = "%b %d %Y %H: +0"
+SMA_WINDOWS = (7, 30)
+RSI_PERIOD = 14
+VOLATILITY_WINDOW = 30
+INDICATORS = ["sma_7", "sma_30", "volatility_30d", "rsi_14", "drawdown", "volume_trend"]
+
+
+def aggregate_daily(points: List[List]) -> pd.DataFrame:
+    """Last price and summed volume per calendar day, gaps filled forward like the forecast input."""
+    frame = pd.DataFrame(points, columns=["timestamp", "price", "volume"])
+    frame["timestamp"] = pd.to_datetime(frame["timestamp"], format=HISTORY_DATE_FORMAT, errors="coerce")
+    frame["price"] = pd.to_numeric(frame["price"], errors="coerce")
+    frame["volume"] = pd.to_numeric(frame["volume"].astype(str).str.replace(",", ""), errors="coerce").fillna(0)
+    frame = frame.dropna(subset=["timestamp", "price"])
+    if frame.empty:
+        return pd.DataFrame(columns=["price", "volume"], index=pd.DatetimeIndex([], name="day"))
+
+    frame["day"] = frame["timestamp"].dt.normalize()
+    daily = frame.groupby("day").agg(price=("price", "last"), volume=("volume", "sum"))
+    full_range = pd.date_range(daily.index[0], daily.index[-1], freq="D", name="day")
+    daily = daily.reindex(full_range)
+    daily["price"] = daily["price"].ffill()
+    daily["volume"] = daily["volume"].fillna(0)
+    return daily
+
+
+def compute_indicators(daily: pd.DataFrame) -> pd.DataFrame:
+    price = daily["price"]
+    volume = daily["volume"]
+    result = daily.copy()
+
+    for window in SMA_WINDOWS:
+        result[f"sma_{window}"] = price.rolling(window, min_periods=window).mean()
+
+    log_returns = np.log(price).diff()
+    result["volatility_30d"] = log_returns.rolling(VOLATILITY_WINDOW, min_periods=5).std()
+
+    delta = price.diff()
+    average_gain = delta.clip(lower=0).ewm(alpha=1 / RSI_PERIOD, adjust=False, min_periods=RSI_PERIOD).mean()
+    average_loss = (-delta.clip(upper=0)).ewm(alpha=1 / RSI_PERIOD, adjust=False, min_periods=RSI_PERIOD).mean()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = 100 - 100 / (1 + average_gain / average_loss)
+    result["rsi_14"] = rsi.where(average_loss != 0, 100.0).where(average_gain.notna())
+
+    result["drawdown"] = price / price.cummax() - 1
+    result["volume_trend"] = (volume.rolling(7, min_periods=7).mean()
+                              / volume.rolling(30, min_periods=30).mean().replace(0, np.nan) - 1)
+    return result
+
+
+def _day_key(point: List) -> str:
+    # "Oct 01 2024 01: +0" -> "Oct 01 2024"
+    return str(point[0])[:11]
+
+
+def analyze_history(history: List[List], version: float, state: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Daily aggregates plus indicators for one item, reusing ``state`` when the history only grew.
+
+    Steam appends points to ``line1``, so when the previously seen prefix is
+    unchanged only the new points (and the last, possibly partial, day) are
+    parsed and aggregated. Indicators are then recomputed over the daily series,
+    which is at most a few thousand rows.
+    """
+    raw_count = len(history)
+    extendable = (state is not None and 0 < state["raw_count"] <= raw_count
+                  and history[state["raw_count"] - 1][0] == state["last_raw"])
+
+    if extendable:
+        tail_start = state["raw_count"] - state["tail_count"]
+        new_daily = aggregate_daily(history[tail_start:])
+        daily = pd.DataFrame({"price": state["price"], "volume": state["volume"]},
+                             index=pd.DatetimeIndex(state["days"], name="day"))
+        daily = pd.concat([daily[daily.index < new_daily.index[0]] if len(new_daily) else daily, new_daily])
+        daily = daily.asfreq("D")
+        daily["price"] = daily["price"].ffill()
+        daily["volume"] = daily["volume"].fillna(0)
+    else:
+        daily = aggregate_daily(history)
+
+    last_day = _day_key(history[-1]) if history else None
+    tail_count = 0
+    for point in reversed(history):
+        if _day_key(point) != last_day:
+            break
+        tail_count += 1
+
+    indicators = compute_indicators(daily)
+    return {
+        "version": version,
+        "raw_count": raw_count,
+        "last_raw": history[-1][0] if history else None,
+        "tail_count": tail_count,
+        "extended": extendable,
+        "days": [day.date().isoformat() for day in indicators.index],
+        "price": _clean(indicators["price"]),
+        "volume": _clean(indicators["volume"]),
+        **{name: _clean(indicators[name]) for name in INDICATORS},
+    }
+
+
+def _clean(series: pd.Series) -> List[Optional[float]]:
+    values = series.to_numpy(dtype=float)
+    return [None if np.isnan(value) else round(float(value), 4) for value in values]
+
+
+def _max_drawdown(price: List[float]) -> Optional[float]:
+    # Peak-to-trough within the requested window; the stored drawdown series runs from the first point.
+    if not price:
+        return None
+    peak = price[0]
+    worst = 0.0
+    for value in price:
+        peak = max(peak, value)
+        if peak:
+            worst = min(worst, value / peak - 1)
+    return round(worst, 4)
+
+
+def summarize(state: Dict[str, Any], days: int) -> Dict[str, Any]:
+    window = slice(-days, None) if days > 0 else slice(None)
+    price = [value for value in state["price"] if value is not None]
+    volume = state["volume"]
+    latest = {name: state[name][-1] if state[name] else None for name in ["price"] + INDICATORS}
+    latest["max_drawdown"] = _max_drawdown([value for value in state["price"][window] if value is not None])
+    latest["volume_7d"] = sum(volume[-7:])
+    latest["volume_30d"] = sum(volume[-30:])
+    latest["change_7d"] = round(price[-1] / price[-8] - 1, 4) if len(price) > 7 and price[-8] else None
+
+    series = {name: state[name][window] for name in ["days", "price", "volume"] + INDICATORS}
+    return {"version": state["version"], "points": len(state["days"]), "latest": latest, "series": series}
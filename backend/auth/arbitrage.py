@@ -0,0 +1,129 @@
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from auth.price_books import PriceBookStore
+
+logger = logging.getLogger(__name__)
+
+# Share of the sale price a seller loses on each marketplace.
+SELL_FEES = {
+    "market_csgo": 0.05,
+    "market_dota2": 0.05,
+    "lis_skins_730": 0.03,
+    "lis_skins_570": 0.03,
+}
+
+APPID_SOURCES = {
+    "730": ["market_csgo", "lis_skins_730"],
+    "570": ["market_dota2", "lis_skins_570"],
+}
+
+COLUMNS = ["market_hash_name", "buy_source", "sell_source", "buy_price", "sell_price",
+           "profit", "spread", "buy_volume", "sell_volume"]
+
+
+def book_frame(rows: List[Tuple[str, float, int]]) -> pd.DataFrame:
+    frame = pd.DataFrame(rows, columns=["market_hash_name", "price", "volume"])
+    return frame.set_index("market_hash_name")
+
+
+def compute_spreads(books: Dict[str, pd.DataFrame], fees: Dict[str, float]) -> pd.DataFrame:
+    """Every profitable (buy, sell) pair of sources per item, best spread first.
+
+    The books are aligned on item name once; each source pair is then a few
+    array operations over the whole catalog.
+    """
+    books = {source: book for source, book in books.items() if not book.empty}
+    if len(books) < 2:
+        return pd.DataFrame(columns=COLUMNS)
+
+    sources = list(books)
+    prices = pd.concat({source: book["price"] for source, book in books.items()}, axis=1)
+    volumes = pd.concat({source: book["volume"] for source, book in books.items()}, axis=1)
+    names = prices.index.to_numpy()
+    price_matrix = prices.to_numpy(dtype=float)
+    volume_matrix = volumes.fillna(0).to_numpy(dtype=np.int64)
+
+    frames = []
+    for i, buy_source in enumerate(sources):
+        for j, sell_source in enumerate(sources):
+            if i == j:
+                continue
+            buy = price_matrix[:, i]
+            sell = price_matrix[:, j]
+            net = sell * (1 - fees.get(sell_source, 0.0))
+            with np.errstate(invalid="ignore"):
+                mask = (buy > 0) & (net > buy)
+            profit = net[mask] - buy[mask]
+            frames.append(pd.DataFrame({
+                "market_hash_name": names[mask],
+                "buy_source": buy_source,
+                "sell_source": sell_source,
+                "buy_price": buy[mask],
+                "sell_price": sell[mask],
+                "profit": profit,
+                "spread": profit / buy[mask],
+                "buy_volume": volume_matrix[mask, i],
+                "sell_volume": volume_matrix[mask, j],
+            }))
+
+    result = pd.concat(frames, ignore_index=True)
+    return result.sort_values("spread", ascending=False, ignore_index=True)
+
+
+class ArbitrageScanner:
+    """Keeps the per-source books and the computed spreads keyed by book version.
+
+    When one dump refreshes only that source is reloaded from SQLite before the
+    spreads are recomputed; unchanged appids are served from memory.
+    """
+
+    def __init__(self, store: PriceBookStore, appid_sources: Dict[str, List[str]] = APPID_SOURCES,
+                 fees: Dict[str, float] = SELL_FEES):
+        self.store = store
+        self.appid_sources = appid_sources
+        self.fees = fees
+        self._books: Dict[str, Tuple[int, pd.DataFrame]] = {}
+        self._spreads: Dict[str, Tuple[Tuple[Optional[int], ...], pd.DataFrame]] = {}
+        self._lock = threading.Lock()
+
+    def _book(self, source: str, version: Optional[int]) -> pd.DataFrame:
+        if version is None:
+            return book_frame([])
+        cached = self._books.get(source)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        frame = book_frame(self.store.rows(source))
+        self._books[source] = (version, frame)
+        logger.debug(f"Loaded price book {source} version {version}: {len(frame)} items")
+        return frame
+
+    def spreads(self, appid: str) -> pd.DataFrame:
+        sources = self.appid_sources[appid]
+        with self._lock:
+            infos = {source: self.store.info(source) for source in sources}
+            versions = tuple(info.version if info else None for info in infos.values())
+            cached = self._spreads.get(appid)
+            if cached is not None and cached[0] == versions:
+                return cached[1]
+
+            books = {source: self._book(source, version) for source, version in zip(sources, versions)}
+            spreads = compute_spreads(books, self.fees)
+            self._spreads[appid] = (versions, spreads)
+            logger.info(f"Arbitrage spreads for appid {appid} recomputed: {len(spreads)} opportunities")
+            return spreads
+
+    def scan(self, appid: str, min_price: float = 0.0, min_volume: int = 0, min_spread: float = 0.0,
+             sources: Optional[List[str]] = None, limit: int = 50) -> Tuple[int, pd.DataFrame]:
+        spreads = self.spreads(appid)
+        mask = ((spreads["buy_price"] >= min_price)
+                & (np.minimum(spreads["buy_volume"], spreads["sell_volume"]) >= min_volume)
+                & (spreads["spread"] >= min_spread))
+        if sources:
+            mask &= spreads["buy_source"].isin(sources) & spreads["sell_source"].isin(sources)
+        matches = spreads[mask]
+        return len(matches), matches.head(limit)
@@ -0,0 +1,460 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from auth.metrics import cache_requests
+from auth.serialization import decode_value, encode_value
+from auth.upstream import BACKGROUND, upstream_priority
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_RETENTION_SECONDS = 3600
+PRUNE_EVERY_WRITES = 500
+BACKGROUND_REFRESH_WORKERS = 4
+# Larger invalidations are published namespace-wide rather than key by key.
+PUBLISH_KEYS_LIMIT = 100
+
+_MISSING = object()
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    updated_at: float
+
+    def age(self) -> float:
+        return time.time() - self.updated_at
+
+    def is_stale(self, ttl: float) -> bool:
+        return self.age() > ttl
+
+
+def init_shared_state(database: str):
+    conn = sqlite3.connect(database, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cache_invalidations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            namespace TEXT NOT NULL,
+            cache_key TEXT,
+            created_at REAL NOT NULL,
+            origin TEXT
+        )
+    """)
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(cache_invalidations)")}
+    if "origin" not in columns:
+        cursor.execute("ALTER TABLE cache_invalidations ADD COLUMN origin TEXT")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS item_properties (
+            cache_key TEXT PRIMARY KEY,
+            properties TEXT NOT NULL
+        )
+    """)
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cache_invalidations_created_at ON cache_invalidations(created_at)")
+
+    conn.commit()
+    conn.close()
+
+
+class InvalidationBus:
+    """Cross-process invalidation signal for the shared SQLite cache.
+
+    Every write appends a row to ``cache_invalidations``, tagged with the
+    writing process so it can skip its own rows. Each worker replays
+    the rows after the last id it processed (shared by all of its threads)
+    when ``PRAGMA data_version`` reports a commit from another connection, or
+    on a thread's first poll, and evicts the affected keys from its local copies.
+    """
+
+    def __init__(self, database: str):
+        self.database = database
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._caches: Dict[str, "SharedCache"] = {}
+        self._instance = uuid.uuid4().hex
+        self._writes = 0
+        self._last_poll = time.monotonic()
+        conn = self.connection()
+        row = conn.execute("SELECT COALESCE(MAX(id), 0) FROM cache_invalidations").fetchone()
+        self._last_seen_id = row[0]
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.database, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            # Unknown until the first poll, which replays everything after the shared
+            # ``_last_seen_id``: commits made before this connection existed do not
+            # change its data_version, but may not have been processed yet.
+            self._local.data_version = None
+        return conn
+
+    @property
+    def origin(self) -> str:
+        # The pid keeps workers forked after the bus was created apart.
+        return f"{self._instance}:{os.getpid()}"
+
+    def register(self, cache: "SharedCache"):
+        self._caches[cache.namespace] = cache
+
+    def publish(self, conn: sqlite3.Connection, namespace: str, cache_key: Optional[str] = None):
+        # Runs inside the caller's transaction, so a rollback takes the row with it.
+        conn.execute(
+            "INSERT INTO cache_invalidations (namespace, cache_key, created_at, origin) VALUES (?, ?, ?, ?)",
+            (namespace, cache_key, time.time(), self.origin))
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % PRUNE_EVERY_WRITES == 0
+        if prune:
+            conn.execute("DELETE FROM cache_invalidations WHERE created_at < ?",
+                         (time.time() - INVALIDATION_RETENTION_SECONDS,))
+
+    def poll(self):
+        conn = self.connection()
+        now = time.monotonic()
+        if now - self._last_poll > INVALIDATION_RETENTION_SECONDS / 2:
+            # The log may have been pruned past what we have seen; start over.
+            for cache in self._caches.values():
+                cache.evict_local()
+        self._last_poll = now
+
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._local.data_version:
+            return
+        self._local.data_version = data_version
+
+        with self._lock:
+            origin = self.origin
+            rows = conn.execute(
+                "SELECT id, namespace, cache_key, origin FROM cache_invalidations WHERE id > ? ORDER BY id",
+                (self._last_seen_id,)).fetchall()
+            for row_id, namespace, cache_key, row_origin in rows:
+                self._last_seen_id = max(self._last_seen_id, row_id)
+                if row_origin == origin:
+                    continue
+                cache = self._caches.get(namespace)
+                if cache is not None:
+                    cache.evict_local(cache_key)
+
+
+_buses: Dict[str, InvalidationBus] = {}
+
+
+def get_bus(database: str) -> InvalidationBus:
+    bus = _buses.get(database)
+    if bus is None:
+        bus = _buses[database] = InvalidationBus(database)
+    return bus
+
+
+class SharedCache:
+    """Key/value cache table shared by every worker on the host.
+
+    SQLite is the source of truth; each process only keeps a bounded LRU of
+    decoded values that is kept coherent through the :class:`InvalidationBus`.
+    """
+
+    def __init__(self, database: str, table: str, key_column: str, value_column: str,
+                 max_local_entries: int = 1024):
+        self.database = database
+        self.namespace = table
+        self.table = table
+        self.key_column = key_column
+        self.value_column = value_column
+        self.max_local_entries = max_local_entries
+        self._local: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bus = get_bus(database)
+        self.bus.register(self)
+        self._ensure_updated_at_column()
+
+    def _ensure_updated_at_column(self):
+        conn = self.bus.connection()
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({self.table})").fetchall()]
+        if "updated_at" not in columns:
+            with conn:
+                conn.execute(f"ALTER TABLE {self.table} ADD COLUMN updated_at REAL NOT NULL DEFAULT 0")
+            logger.info(f"Added updated_at column to {self.table}")
+
+    def _remember(self, key: str, entry: CacheEntry):
+        with self._lock:
+            self._local[key] = entry
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_local_entries:
+                self._local.popitem(last=False)
+
+    def evict_local(self, key: Optional[str] = None):
+        with self._lock:
+            if key is None:
+                self._local.clear()
+            else:
+                self._local.pop(key, None)
+
+    def get_entry(self, key: str) -> Optional[CacheEntry]:
+        self.bus.poll()
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                self._local.move_to_end(key)
+        if entry is not None:
+            cache_requests.inc(namespace=self.namespace, result="hit")
+            return entry
+
+        conn = self.bus.connection()
+        row = conn.execute(
+            f"SELECT {self.value_column}, updated_at FROM {self.table} WHERE {self.key_column} = ?",
+            (key,)).fetchone()
+        if row is None:
+            cache_requests.inc(namespace=self.namespace, result="miss")
+            return None
+        cache_requests.inc(namespace=self.namespace, result="hit")
+        entry = CacheEntry(decode_value(row[0]), row[1])
+        self._remember(key, entry)
+        return entry
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self.get_entry(key)
+        return default if entry is None else entry.value
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        self.bus.poll()
+        result = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                entry = self._local.get(key)
+                if entry is None:
+                    missing.append(key)
+                else:
+                    result[key] = entry.value
+
+        local_hits = len(result)
+        conn = self.bus.connection()
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT {self.key_column}, {self.value_column}, updated_at FROM {self.table} "
+                f"WHERE {self.key_column} IN ({placeholders})", chunk).fetchall()
+            for key, stored, updated_at in rows:
+                entry = CacheEntry(decode_value(stored), updated_at)
+                self._remember(key, entry)
+                result[key] = entry.value
+
+        cache_requests.inc(len(result), namespace=self.namespace, result="hit")
+        cache_requests.inc(local_hits + len(missing) - len(result), namespace=self.namespace, result="miss")
+        return result
+
+    def set(self, key: str, value: Any, updated_at: Optional[float] = None):
+        self.set_many({key: value}, updated_at)
+
+    def set_many(self, values: Dict[str, Any], updated_at: Optional[float] = None):
+        if not values:
+            return
+        if updated_at is None:
+            updated_at = time.time()
+        conn = self.bus.connection()
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} ({self.key_column}, {self.value_column}, updated_at) "
+                f"VALUES (?, ?, ?)",
+                [(key, encode_value(value), updated_at) for key, value in values.items()])
+            if len(values) == 1:
+                self.bus.publish(conn, self.namespace, next(iter(values)))
+            else:
+                self.bus.publish(conn, self.namespace)
+        if len(values) == 1:
+            for key, value in values.items():
+                self._remember(key, CacheEntry(value, updated_at))
+        else:
+            self.evict_local()
+
+    def delete(self, key: str):
+        conn = self.bus.connection()
+        with conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE {self.key_column} = ?", (key,))
+            self.bus.publish(conn, self.namespace, key)
+        self.evict_local(key)
+
+    def invalidate(self, keys: Optional[Iterable[str]] = None, prefix: Optional[str] = None) -> List[str]:
+        """Mark entries stale (``updated_at = 0``) without dropping their values; returns the keys marked.
+
+        Readers keep serving the old value and revalidate it, so invalidating a
+        hot key never turns it into a cold miss.
+        """
+        conn = self.bus.connection()
+        with conn:
+            if keys is not None:
+                keys = list(keys)
+                found = []
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    found += [row[0] for row in conn.execute(
+                        f"SELECT {self.key_column} FROM {self.table} "
+                        f"WHERE {self.key_column} IN ({placeholders}) AND updated_at != 0", chunk).fetchall()]
+            else:
+                found = [row[0] for row in conn.execute(
+                    f"SELECT {self.key_column} FROM {self.table} "
+                    f"WHERE {self.key_column} LIKE ? ESCAPE '\\' AND updated_at != 0",
+                    (_like_prefix(prefix or ""),)).fetchall()]
+            if not found:
+                return []
+            conn.executemany(f"UPDATE {self.table} SET updated_at = 0 WHERE {self.key_column} = ?",
+                             [(key,) for key in found])
+            if len(found) <= PUBLISH_KEYS_LIMIT:
+                for key in found:
+                    self.bus.publish(conn, self.namespace, key)
+            else:
+                self.bus.publish(conn, self.namespace)
+        if len(found) <= PUBLISH_KEYS_LIMIT:
+            for key in found:
+                self.evict_local(key)
+        else:
+            self.evict_local()
+        return found
+
+    def clear(self):
+        conn = self.bus.connection()
+        with conn:
+            conn.execute(f"DELETE FROM {self.table}")
+            self.bus.publish(conn, self.namespace)
+        self.evict_local()
+
+    def count(self, prefix: str = "") -> int:
+        conn = self.bus.connection()
+        row = conn.execute(
+            f"SELECT COUNT(*) FROM {self.table} WHERE {self.key_column} LIKE ? ESCAPE '\\'",
+            (_like_prefix(prefix),)).fetchone()
+        return row[0]
+
+    def keys(self, prefix: str = "") -> List[str]:
+        conn = self.bus.connection()
+        rows = conn.execute(
+            f"SELECT {self.key_column} FROM {self.table} WHERE {self.key_column} LIKE ? ESCAPE '\\'",
+            (_like_prefix(prefix),)).fetchall()
+        return [row[0] for row in rows]
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        self.set(key, value)
+
+    def __delitem__(self, key: str):
+        self.delete(key)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+
+def _like_prefix(prefix: str) -> str:
+    return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+class PropertiesMap:
+    """Read-mostly per-appid view over the shared ``item_properties`` table."""
+
+    def __init__(self, cache: SharedCache, appid: str):
+        self.cache = cache
+        self.appid = appid
+
+    def _key(self, normalized_name: str) -> str:
+        return f"{self.appid}:{normalized_name}"
+
+    def get(self, normalized_name: str, default: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        properties = self.cache.get(self._key(normalized_name))
+        if properties is None:
+            return default
+        return dict(properties)
+
+    def get_many(self, normalized_names: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        prefix_len = len(self.appid) + 1
+        found = self.cache.get_many([self._key(name) for name in normalized_names])
+        return {key[prefix_len:]: dict(properties) for key, properties in found.items()}
+
+    def replace(self, properties_map: Dict[str, Dict[str, Any]]):
+        self.cache.set_many({self._key(name): properties for name, properties in properties_map.items()})
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        conn = self.cache.bus.connection()
+        rows = conn.execute(
+            "SELECT cache_key, properties FROM item_properties WHERE cache_key LIKE ? ESCAPE '\\'",
+            (_like_prefix(f"{self.appid}:"),)).fetchall()
+        prefix_len = len(self.appid) + 1
+        return [(key[prefix_len:], decode_value(stored)) for key, stored in rows]
+
+    def __len__(self) -> int:
+        return self.cache.count(f"{self.appid}:")
+
+    def __contains__(self, normalized_name: str) -> bool:
+        return self._key(normalized_name) in self.cache
+
+
+_refresh_executor = ThreadPoolExecutor(max_workers=BACKGROUND_REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+_refreshing: set = set()
+_refreshing_lock = threading.Lock()
+
+
+def run_in_background(token: Any, job: Callable[[], Any]) -> bool:
+    """Run ``job`` on the refresh pool unless a job with the same token is already running.
+
+    Upstream calls made by the job are scheduled at background priority.
+    """
+    with _refreshing_lock:
+        if token in _refreshing:
+            return False
+        _refreshing.add(token)
+
+    def run():
+        try:
+            with upstream_priority(BACKGROUND):
+                job()
+        except Exception as e:
+            logger.warning(f"Background job {token} failed: {e}")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(token)
+
+    _refresh_executor.submit(run)
+    return True
+
+
+def refresh_in_background(cache: SharedCache, key: str, fetch: Callable[[], Any]) -> bool:
+    """Recompute ``key`` off the request path; ``fetch`` returning None keeps the old value."""
+    def refresh():
+        value = fetch()
+        if value is not None:
+            cache.set(key, value)
+            logger.debug(f"Background refresh of {cache.namespace}[{key}] finished")
+
+    return run_in_background((cache.namespace, key), refresh)
+
+
+def start_periodic_job(name: str, interval: float, job: Callable[[], Any]) -> threading.Thread:
+    """Run ``job`` every ``interval`` seconds on a daemon thread, first run after one interval."""
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                with upstream_priority(BACKGROUND):
+                    job()
+            except Exception as e:
+                logger.error(f"Periodic job {name} failed: {e}")
+
+    thread = threading.Thread(target=loop, name=name, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,44 @@
+import hashlib
+from typing import Any, Optional
+
+from fastapi import Request, Response
+
+# Authenticated payloads are per user (the token is in the query string) and must
+# be revalidated on every use; revalidation is cheap thanks to the ETag.
+PRIVATE_REVALIDATE = "private, no-cache"
+
+
+def make_etag(*parts: Any) -> str:
+    """Weak ETag over the version parts of a response (cache entry timestamps, row ids)."""
+    digest = hashlib.blake2b("\x1f".join(str(part) for part in parts).encode(), digest_size=8).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+def tag(response: Response, etag: str, cache_control: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+
+
+def not_modified(request: Request, response: Response, etag: str, cache_control: str,
+                 vary: Optional[str] = None) -> Optional[Response]:
+    """A bodiless 304 when the client already holds ``etag``; otherwise tags ``response`` and returns None.
+
+    ``vary`` names the request headers the representation is negotiated on; a
+    304 has to carry the same ``Vary`` as the 200 it revalidates.
+    """
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        headers = {"ETag": etag, "Cache-Control": cache_control}
+        if vary:
+            headers["Vary"] = vary
+        return Response(status_code=304, headers=headers)
+    tag(response, etag, cache_control)
+    return None
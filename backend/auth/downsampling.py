@@ -0,0 +1,59 @@
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+HISTORY_DATE_FORMAT = "%b %d %Y %H: +0"
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the points kept by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept; every bucket in between keeps
+    the point forming the largest triangle with the previously kept point and
+    the average of the next bucket, which preserves peaks and troughs.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        average_x = x[next_start:next_end].mean()
+        average_y = y[next_start:next_end].mean()
+
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        areas = np.abs((x[previous] - average_x) * (bucket_y - y[previous])
+                       - (x[previous] - bucket_x) * (average_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def downsample_history(history: List[List], points: int, start: Optional[float] = None,
+                       end: Optional[float] = None) -> List[List]:
+    """``line1`` points between ``start`` and ``end`` (unix seconds), reduced to at most ``points``."""
+    if not history:
+        return []
+    timestamps = pd.to_datetime([point[0] for point in history], format=HISTORY_DATE_FORMAT, errors="coerce")
+    x = timestamps.to_numpy().astype("datetime64[s]").astype(np.int64).astype(float)
+    y = pd.to_numeric(pd.Series([point[1] for point in history]), errors="coerce").to_numpy(dtype=float)
+
+    mask = ~np.isnan(y) & ~timestamps.isna()
+    if start is not None:
+        mask &= x >= start
+    if end is not None:
+        mask &= x <= end
+    positions = np.flatnonzero(mask)
+    if len(positions) == 0:
+        return []
+
+    kept = lttb(x[positions], y[positions], points)
+    return [history[index] for index in positions[kept]]
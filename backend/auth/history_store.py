@@ -0,0 +1,300 @@
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from auth.cache import CacheEntry, SharedCache
+
+logger = logging.getLogger(__name__)
+
+# Raw line1 points are kept for this many days before today (UTC, like Steam's labels);
+# everything older is stored as one OHLC + volume row per day.
+RAW_HISTORY_DAYS = 7
+# Rollup prices are stored as integers (Steam reports at most three decimals).
+PRICE_SCALE = 1000
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+MONTH_NUMBERS = {name: number for number, name in enumerate(MONTHS, start=1)}
+EPOCH = date(1970, 1, 1)
+
+# (day number since 1970-01-01, open, high, low, close, volume, hour of the close)
+RollupRow = Tuple[int, int, int, int, int, int, int]
+
+
+def init_history_tiers(database: str):
+    conn = sqlite3.connect(database, timeout=30)
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS history_items (
+            id INTEGER PRIMARY KEY,
+            cache_key TEXT NOT NULL UNIQUE,
+            first_raw_day INTEGER,
+            last_raw_day INTEGER
+        )
+    """)
+    # Day range of the raw points as last written, so compaction can pick entries without decoding them.
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(history_items)")}
+    for column in ("first_raw_day", "last_raw_day"):
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE history_items ADD COLUMN {column} INTEGER")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS history_daily (
+            item_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            open INTEGER NOT NULL,
+            high INTEGER NOT NULL,
+            low INTEGER NOT NULL,
+            close INTEGER NOT NULL,
+            volume INTEGER NOT NULL,
+            close_hour INTEGER NOT NULL,
+            PRIMARY KEY (item_id, day)
+        ) WITHOUT ROWID
+    """)
+
+    conn.commit()
+    conn.close()
+
+
+def parse_label(label: str) -> Tuple[int, int]:
+    """``"Oct 01 2024 01: +0"`` -> (day number, hour)."""
+    day = date(int(label[7:11]), MONTH_NUMBERS[label[:3]], int(label[4:6]))
+    return (day - EPOCH).days, int(label[12:14])
+
+
+def format_label(day: int, hour: int) -> str:
+    value = EPOCH + timedelta(days=day)
+    return f"{MONTHS[value.month - 1]} {value.day:02d} {value.year} {hour:02d}: +0"
+
+
+def today_number() -> int:
+    """Today's day number in the same UTC calendar as ``parse_label``."""
+    return (datetime.now(timezone.utc).date() - EPOCH).days
+
+
+def _volume(value: Any) -> int:
+    try:
+        return int(str(value).replace(",", ""))
+    except ValueError:
+        return 0
+
+
+def raw_day_range(history: List[List]) -> Tuple[int, int]:
+    """First and last day of the points with a readable timestamp; (0, 0) when there are none."""
+    days = []
+    for point in history:
+        try:
+            days.append(parse_label(point[0])[0])
+        except (KeyError, ValueError, TypeError, IndexError):
+            continue
+    return (min(days), max(days)) if days else (0, 0)
+
+
+def split_history(history: List[List], raw_days: int = RAW_HISTORY_DAYS, after_day: Optional[int] = None,
+                  today: Optional[int] = None) -> Tuple[List[RollupRow], List[List]]:
+    """Daily rollups of the points older than the raw window, and the points inside it.
+
+    The window is the ``raw_days`` days before ``today`` (default: the current
+    day), so points age out of it even when the item gets no new ones.
+    Days up to ``after_day`` are already rolled up and are only dropped.
+    Points with an unreadable timestamp are kept raw.
+    """
+    parsed = []
+    for point in history:
+        try:
+            parsed.append(parse_label(point[0]))
+        except (KeyError, ValueError, TypeError, IndexError):
+            parsed.append(None)
+    if all(value is None for value in parsed):
+        return [], history
+    cutoff = (today_number() if today is None else today) - raw_days
+
+    rollups: Dict[int, List[int]] = {}
+    recent = []
+    for point, value in zip(history, parsed):
+        if value is None or value[0] >= cutoff:
+            recent.append(point)
+            continue
+        day, hour = value
+        if after_day is not None and day <= after_day:
+            continue
+        price = round(float(point[1]) * PRICE_SCALE)
+        row = rollups.get(day)
+        if row is None:
+            rollups[day] = [day, price, price, price, price, _volume(point[2]), hour]
+        else:
+            row[2] = max(row[2], price)
+            row[3] = min(row[3], price)
+            row[4] = price
+            row[5] += _volume(point[2])
+            row[6] = hour
+    return [tuple(row) for _, row in sorted(rollups.items())], recent
+
+
+def merge_history(rollups: List[Tuple[int, int, int, int]], recent: List[List]) -> List[List]:
+    """``line1``-shaped history: one point per rolled-up day (at its close), then the raw points.
+
+    Daily last price and summed volume come out the same as from the raw points,
+    which is all ``prepare_prediction_data`` and the analytics use.
+    """
+    return [[format_label(day, close_hour), close / PRICE_SCALE, str(volume)]
+            for day, close, volume, close_hour in rollups] + recent
+
+
+def load_rollups(conn: sqlite3.Connection, keys: Iterable[str]) -> Dict[str, List[Tuple[int, int, int, int]]]:
+    """``(day, close, volume, close_hour)`` rollup rows per cache key, oldest first."""
+    keys = list(keys)
+    result: Dict[str, List[Tuple[int, int, int, int]]] = {}
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(f"""
+            SELECT i.cache_key, d.day, d.close, d.volume, d.close_hour
+            FROM history_items i JOIN history_daily d ON d.item_id = i.id
+            WHERE i.cache_key IN ({placeholders})
+            ORDER BY i.cache_key, d.day
+        """, chunk).fetchall()
+        for cache_key, day, close, volume, close_hour in rows:
+            result.setdefault(cache_key, []).append((day, close, volume, close_hour))
+    return result
+
+
+class TieredHistory:
+    """Price histories as raw recent points in a :class:`SharedCache` plus daily rollups.
+
+    Exposes the same interface as the cache it wraps, with values being the
+    merged history, so readers never see the tiers. Writes roll up everything
+    older than the raw window incrementally: only days newer than the last
+    stored rollup are aggregated, and record the day range of the raw points
+    they keep. Points also age out as the days pass; ``compact_all`` moves
+    those of entries that are not being rewritten.
+    """
+
+    def __init__(self, raw: SharedCache, raw_days: int = RAW_HISTORY_DAYS):
+        self.raw = raw
+        self.namespace = raw.namespace
+        self.bus = raw.bus
+        self.raw_days = raw_days
+        self._merged: "OrderedDict[str, Tuple[Tuple, List[List]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _merge(self, key: str, entry: CacheEntry) -> CacheEntry:
+        version = (entry.updated_at, len(entry.value), entry.value[0][0] if entry.value else None)
+        with self._lock:
+            memo = self._merged.get(key)
+            if memo is not None and memo[0] == version:
+                self._merged.move_to_end(key)
+                return CacheEntry(memo[1], entry.updated_at)
+
+        rollups = load_rollups(self.bus.connection(), [key]).get(key)
+        merged = merge_history(rollups, entry.value) if rollups else entry.value
+        with self._lock:
+            self._merged[key] = (version, merged)
+            while len(self._merged) > self.raw.max_local_entries:
+                self._merged.popitem(last=False)
+        return CacheEntry(merged, entry.updated_at)
+
+    def get_entry(self, key: str) -> Optional[CacheEntry]:
+        entry = self.raw.get_entry(key)
+        return None if entry is None else self._merge(key, entry)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self.get_entry(key)
+        return default if entry is None else entry.value
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        values = self.raw.get_many(keys)
+        rollups = load_rollups(self.bus.connection(), values)
+        return {key: merge_history(rollups[key], value) if key in rollups else value
+                for key, value in values.items()}
+
+    def _store_rollups(self, key: str, history: List[List], today: Optional[int] = None) -> List[List]:
+        conn = self.bus.connection()
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO history_items (cache_key) VALUES (?)", (key,))
+            item_id = conn.execute("SELECT id FROM history_items WHERE cache_key = ?", (key,)).fetchone()[0]
+            last_day = conn.execute("SELECT MAX(day) FROM history_daily WHERE item_id = ?", (item_id,)).fetchone()[0]
+            rollups, recent = split_history(history, self.raw_days, after_day=last_day, today=today)
+            conn.executemany("""
+                INSERT OR IGNORE INTO history_daily (item_id, day, open, high, low, close, volume, close_hour)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(item_id, *row) for row in rollups])
+            conn.execute("UPDATE history_items SET first_raw_day = ?, last_raw_day = ? WHERE id = ?",
+                         (*raw_day_range(recent), item_id))
+        return recent
+
+    def set(self, key: str, value: List[List], updated_at: Optional[float] = None):
+        recent = self._store_rollups(key, value)
+        self.raw.set(key, recent, updated_at)
+
+    def compact(self, key: str, today: Optional[int] = None) -> bool:
+        """Move points that aged out of the raw window into rollups, keeping the entry's version."""
+        entry = self.raw.get_entry(key)
+        if entry is None:
+            return False
+        recent = self._store_rollups(key, entry.value, today)
+        if len(recent) == len(entry.value):
+            return False
+        self.raw.set(key, recent, entry.updated_at)
+        return True
+
+    def compact_all(self, today: Optional[int] = None) -> int:
+        """Compact every entry with raw points older than the raw window as of ``today``.
+
+        Entries are picked by the day range recorded on write, so only those
+        that need compacting are decoded, plus once each entry stored before
+        the range was recorded. A first day of 0 means no dated raw points.
+        """
+        today = today_number() if today is None else today
+        conn = self.bus.connection()
+        keys = [key for (key,) in conn.execute(
+            f"SELECT h.{self.raw.key_column} FROM {self.raw.table} h "
+            f"LEFT JOIN history_items i ON i.cache_key = h.{self.raw.key_column} "
+            "WHERE i.last_raw_day IS NULL OR (i.first_raw_day > 0 AND i.first_raw_day < ?)",
+            (today - self.raw_days,))]
+        compacted = 0
+        for key in keys:
+            if self.compact(key, today):
+                compacted += 1
+        if compacted:
+            logger.info(f"Compacted {compacted} histories into daily rollups")
+        return compacted
+
+    def delete(self, key: str):
+        conn = self.bus.connection()
+        with conn:
+            conn.execute("DELETE FROM history_daily WHERE item_id IN (SELECT id FROM history_items WHERE cache_key = ?)",
+                         (key,))
+        self.raw.delete(key)
+
+    def clear(self):
+        conn = self.bus.connection()
+        with conn:
+            conn.execute("DELETE FROM history_daily")
+        self.raw.clear()
+
+    def invalidate(self, keys: Optional[Iterable[str]] = None, prefix: Optional[str] = None) -> List[str]:
+        return self.raw.invalidate(keys=keys, prefix=prefix)
+
+    def count(self, prefix: str = "") -> int:
+        return self.raw.count(prefix)
+
+    def keys(self, prefix: str = "") -> List[str]:
+        return self.raw.keys(prefix)
+
+    def __getitem__(self, key: str) -> Any:
+        entry = self.get_entry(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry.value
+
+    def __setitem__(self, key: str, value: List[List]):
+        self.set(key, value)
+
+    def __delitem__(self, key: str):
+        self.delete(key)
+
+    def __contains__(self, key: str) -> bool:
+        return self.raw.get_entry(key) is not None
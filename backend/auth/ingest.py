@@ -0,0 +1,114 @@
+import codecs
+import json
+import logging
+import re
+from typing import Any, Iterable, Iterator, List, Optional
+
+from auth.upstream import upstream_get
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_BATCH_SIZE = 5000
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"[\s,]*")
+
+
+class StreamFormatError(ValueError):
+    pass
+
+
+def iter_json_array(chunks: Iterable[bytes], array_key: Optional[str] = None) -> Iterator[Any]:
+    """Yield the elements of one JSON array from a byte stream without loading the whole document.
+
+    With ``array_key`` the first array stored under that key is used (for example
+    ``{"success": true, "items": [...]}``); otherwise the document itself must be an array.
+    """
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    chunk_iter = iter(chunks)
+    buffer = ""
+    eof = False
+
+    def read_more() -> bool:
+        nonlocal buffer, eof
+        for chunk in chunk_iter:
+            if chunk:
+                buffer += text_decoder.decode(chunk)
+                return True
+        buffer += text_decoder.decode(b"", final=True)
+        eof = True
+        return False
+
+    if array_key is None:
+        start_pattern = re.compile(r"^\s*\[")
+    else:
+        start_pattern = re.compile(r'"' + re.escape(array_key) + r'"\s*:\s*\[')
+    keep_tail = len(array_key or "") + 64
+
+    while True:
+        match = start_pattern.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        if eof:
+            raise StreamFormatError(f"JSON array {array_key or '<root>'} not found in stream")
+        if array_key is not None and len(buffer) > keep_tail:
+            buffer = buffer[-keep_tail:]
+        read_more()
+
+    position = 0
+    while True:
+        position = _whitespace.match(buffer, position).end()
+        if position >= len(buffer):
+            if eof:
+                raise StreamFormatError("Stream ended inside JSON array")
+            buffer = buffer[position:]
+            position = 0
+            read_more()
+            continue
+
+        if buffer[position] == "]":
+            return
+
+        try:
+            value, end = _decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            buffer = buffer[position:]
+            position = 0
+            read_more()
+            continue
+
+        if end >= len(buffer) and not eof:
+            # A scalar may continue in the next chunk; decode it again with more data.
+            buffer = buffer[position:]
+            position = 0
+            read_more()
+            continue
+
+        yield value
+        position = end
+        if position > CHUNK_SIZE:
+            buffer = buffer[position:]
+            position = 0
+
+
+def batched(items: Iterable[Any], batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_json_array(url: str, array_key: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                      timeout: int = 30, **kwargs) -> Iterator[List[Any]]:
+    with upstream_get(url, stream=True, timeout=timeout, **kwargs) as response:
+        response.raise_for_status()
+        logger.debug(f"Streaming {url} ({response.headers.get('Content-Length', 'unknown')} bytes)")
+        yield from batched(iter_json_array(response.iter_content(CHUNK_SIZE), array_key), batch_size)
@@ -0,0 +1,289 @@
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from auth.logging_setup import RateLimitedLog
+
+logger = logging.getLogger(__name__)
+item_log = RateLimitedLog(logger, limit=5, interval=60)
+
+
+def normalize_market_hash_name(name: str) -> str:
+    return re.sub(r'\s+', ' ', name.strip().lower())
+
+
+def build_item_properties(item: Dict[str, Any], appid: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    market_hash_name = item.get("market_hash_name", item.get("name", ""))
+    if not market_hash_name:
+        return None
+
+    normalized_key = normalize_market_hash_name(market_hash_name)
+    properties = {}
+
+    if appid == "730":
+        item_type = item.get("item_type", "")
+        if "weapon_" in item.get("defindex", ""):
+            if "knife" in item_type.lower():
+                item_type = "Knife"
+            elif "pistol" in item_type.lower():
+                item_type = "Pistol"
+            elif "rifle" in item_type.lower():
+                item_type = "Rifle"
+            elif "smg" in item_type.lower():
+                item_type = "SMG"
+            elif "sniper" in item_type.lower():
+                item_type = "Sniper Rifle"
+            elif "shotgun" in item_type.lower():
+                item_type = "Shotgun"
+            elif "machinegun" in item_type.lower():
+                item_type = "Machine Gun"
+        elif "gloves" in item_type.lower():
+            item_type = "Gloves"
+        properties["type"] = item_type
+
+        rarity = item.get("rarity", "")
+        if rarity:
+            if "common" in rarity.lower():
+                rarity = "Consumer Grade"
+            elif "uncommon" in rarity.lower():
+                rarity = "Industrial Grade"
+            elif "rare" in rarity.lower():
+                rarity = "Mil-Spec"
+            elif "mythical" in rarity.lower():
+                rarity = "Restricted"
+            elif "legendary" in rarity.lower():
+                rarity = "Classified"
+            elif "ancient" in rarity.lower():
+                rarity = "Covert"
+        properties["rarity"] = rarity
+
+        wear = []
+        if "wear" in item:
+            wear = item["wear"]
+        elif "Factory New" in market_hash_name:
+            wear = ["Factory New"]
+        elif "Minimal Wear" in market_hash_name:
+            wear = ["Minimal Wear"]
+        elif "Field-Tested" in market_hash_name:
+            wear = ["Field-Tested"]
+        elif "Well-Worn" in market_hash_name:
+            wear = ["Well-Worn"]
+        elif "Battle-Scarred" in market_hash_name:
+            wear = ["Battle-Scarred"]
+        properties["wear"] = wear
+
+        attributes = []
+        if "StatTrak" in market_hash_name or any(
+                attr.get("name", "").lower() == "stattrak" for attr in item.get("attributes", [])):
+            attributes.append("stattrak_available")
+        properties["attributes"] = attributes
+
+    elif appid == "570":
+        properties["rarity"] = ""
+
+        slot = item.get("slot", "")
+        properties["slot"] = slot if slot else ""
+
+        quality = item.get("quality", "")
+        if quality:
+            if "normal" in quality.lower():
+                quality = "Normal"
+            elif "inscribed" in quality.lower():
+                quality = "Inscribed"
+            elif "autographed" in quality.lower():
+                quality = "Autographed"
+            elif "genuine" in quality.lower():
+                quality = "Genuine"
+        properties["quality"] = quality
+
+        hero = item.get("hero", "")
+        for attr in item.get("attributes", []):
+            if "hero" in attr.get("name", "").lower():
+                hero = attr.get("value", "")
+                break
+        properties["hero"] = hero if hero else ""
+
+    return normalized_key, properties
+
+
+def build_properties_map(schema_data: List[Dict[str, Any]], appid: str) -> Dict[str, Dict[str, Any]]:
+    properties_map = {}
+
+    for item in schema_data:
+        entry = build_item_properties(item, appid)
+        if entry:
+            properties_map[entry[0]] = entry[1]
+
+    logger.info(f"Properties map for appid {appid} built with {len(properties_map)} items")
+    return properties_map
+
+
+def classify_inventory(data: Dict[str, Any], appid: str, properties_map) -> List[Dict[str, Any]]:
+    items = []
+    for asset in data['assets']:
+        for desc in data['descriptions']:
+            if desc['classid'] == asset['classid']:
+                market_hash_name = desc.get('market_hash_name', desc.get('name', ''))
+                if "Graffiti" in desc.get('name', '') and "Sealed" not in market_hash_name:
+                    market_hash_name = f"Sealed {market_hash_name}"
+
+                normalized_key = normalize_market_hash_name(market_hash_name)
+                properties = properties_map.get(normalized_key)
+                properties = dict(properties) if properties is not None else {
+                    "type": "",
+                    "rarity": "",
+                    "wear": [],
+                    "attributes": [],
+                    "slot": "",
+                    "quality": "",
+                    "hero": ""
+                }
+
+                if appid == "730":
+                    if not properties["wear"]:
+                        if "Factory New" in market_hash_name:
+                            properties["wear"] = ["Factory New"]
+                        elif "Minimal Wear" in market_hash_name:
+                            properties["wear"] = ["Minimal Wear"]
+                        elif "Field-Tested" in market_hash_name:
+                            properties["wear"] = ["Field-Tested"]
+                        elif "Well-Worn" in market_hash_name:
+                            properties["wear"] = ["Well-Worn"]
+                        elif "Battle-Scarred" in market_hash_name:
+                            properties["wear"] = ["Battle-Scarred"]
+                    if "StatTrak" in market_hash_name:
+                        properties["attributes"] = ["stattrak_available"]
+                    if not properties["type"]:
+                        name_lower = market_hash_name.lower()
+                        if any(w in name_lower for w in [
+                            "glock", "usp-s", "usp", "p2000", "p250", "cz75", "cz75-auto", "cz75a", "deagle",
+                            "desert eagle",
+                            "tec-9", "tec9", "five-seven", "fiveseven", "dual berettas", "dual beretta",
+                            "berettas", "r8 revolver", "revolver"
+                        ]):
+                            properties["type"] = "Pistol"
+                        elif any(w in name_lower for w in [
+                            "ak-47", "ak47", "m4a1-s", "m4a1", "m4a4", "aug", "famas", "galil ar", "galilar",
+                            "sg 553", "sg553"
+                        ]):
+                            properties["type"] = "Rifle"
+                        elif any(w in name_lower for w in [
+                            "ssg 08", "ssg08", "g3sg1", "scar-20", "awp"
+                        ]):
+                            properties["type"] = "Sniper Rifle"
+                        elif any(w in name_lower for w in [
+                            "mp7", "mp9", "mp5-sd", "mp5", "mac-10", "mac10", "ump-45", "ump45", "p90",
+                            "pp-bizon", "bizon"
+                        ]):
+                            properties["type"] = "SMG"
+                        elif any(w in name_lower for w in [
+                            "nova", "xm1014", "mag-7", "mag7", "sawed-off", "sawedoff"
+                        ]):
+                            properties["type"] = "Shotgun"
+                        elif any(w in name_lower for w in [
+                            "negev", "m249"
+                        ]):
+                            properties["type"] = "Machine Gun"
+                        elif any(w in name_lower for w in [
+                            "knife", "karambit", "bayonet", "bowie", "butterfly", "classic knife", "falchion",
+                            "flip knife", "gut knife",
+                            "huntsman", "kukri", "m9 bayonet", "navaja", "nomad", "paracord", "shadow daggers",
+                            "skeleton", "stiletto",
+                            "survival", "talon", "ursus", "canis", "widowmaker", "gypsy", "outdoor", "push"
+                        ]) or "★" in market_hash_name:
+                            properties["type"] = "Knife"
+                        elif "zeus" in name_lower:
+                            properties["type"] = "Zeus"
+                        elif "gloves" in name_lower:
+                            properties["type"] = "Gloves"
+
+                    if not properties["rarity"]:
+                        for tag in desc.get("tags", []):
+                            if tag.get("category") == "Rarity":
+                                rarity_value = tag.get("internal_name", "").lower()
+                                rarity_mapping = {
+                                    "rarity_common_weapon": "Consumer Grade",
+                                    "rarity_uncommon_weapon": "Industrial Grade",
+                                    "rarity_rare_weapon": "Mil-Spec",
+                                    "rarity_mythical_weapon": "Restricted",
+                                    "rarity_legendary_weapon": "Classified",
+                                    "rarity_ancient_weapon": "Covert",
+                                    "rarity_contraband": "Contraband"
+                                }
+                                mapped_rarity = rarity_mapping.get(rarity_value, "")
+                                if mapped_rarity:
+                                    properties["rarity"] = mapped_rarity
+                                    break
+                                rarity_value = tag.get("localized_tag_name", "").lower()
+                                rarity_mapping_localized = {
+                                    "consumer grade": "Consumer Grade",
+                                    "industrial grade": "Industrial Grade",
+                                    "mil-spec": "Mil-Spec",
+                                    "restricted": "Restricted",
+                                    "classified": "Classified",
+                                    "covert": "Covert",
+                                    "contraband": "Contraband"
+                                }
+                                mapped_rarity = rarity_mapping_localized.get(rarity_value, rarity_value.title())
+                                properties["rarity"] = mapped_rarity
+                                break
+
+                if appid == "570":
+                    for tag in desc.get("tags", []):
+                        category = tag.get("category")
+                        if category == "Rarity" and not properties["rarity"]:
+                            rarity_value = tag.get("internal_name", "").lower()
+                            rarity_mapping = {
+                                "rarity_common": "Common",
+                                "rarity_uncommon": "Uncommon",
+                                "rarity_rare": "Rare",
+                                "rarity_mythical": "Mythical",
+                                "rarity_legendary": "Legendary",
+                                "rarity_immortal": "Immortal",
+                                "rarity_arcana": "Arcana",
+                                "rarity_ancient": "Ancient",
+                                "common": "Common",
+                                "uncommon": "Uncommon",
+                                "rare": "Rare",
+                                "mythical": "Mythical",
+                                "legendary": "Legendary",
+                                "immortal": "Immortal",
+                                "arcana": "Arcana",
+                                "ancient": "Ancient"
+                            }
+                            mapped_rarity = rarity_mapping.get(rarity_value,
+                                                               tag.get("localized_tag_name", "").title())
+                            properties["rarity"] = mapped_rarity.title()
+                    if not properties["hero"]:
+                        for desc_item in desc.get("descriptions", []):
+                            if "Used By:" in desc_item.get("value", ""):
+                                hero = desc_item["value"].replace("Used By: ", "").strip()
+                                properties["hero"] = hero
+                                break
+                    if not properties["slot"]:
+                        name_lower = market_hash_name.lower()
+                        if "head" in name_lower:
+                            properties["slot"] = "Head"
+                        elif "arms" in name_lower:
+                            properties["slot"] = "Arms"
+                        elif "legs" in name_lower:
+                            properties["slot"] = "Legs"
+                        elif "weapon" in name_lower:
+                            properties["slot"] = "Weapon"
+                        elif "shoulders" in name_lower:
+                            properties["slot"] = "Shoulders"
+                    item_log.debug("dota2_item", "Dota 2 item: %s, Rarity: %s, Hero: %s",
+                                   market_hash_name, properties["rarity"], properties["hero"])
+
+                items.append({
+                    "name": desc.get('name', 'Unknown Item'),
+                    "appid": appid,
+                    "icon_url": f"https://steamcommunity-a.akamaihd.net/economy/image/{desc.get('icon_url', '')}",
+                    "price": None,
+                    "classid": desc['classid'],
+                    "market_hash_name": market_hash_name,
+                    "properties": properties
+                })
+                break
+
+    return items
@@ -0,0 +1,119 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRIBUTES and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def parse_logger_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for part in spec.split(","):
+        if "=" in part:
+            name, level = part.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging():
+    """Route all records through a queue so handlers never run on the request thread.
+
+    ``LOG_LEVEL`` sets the root level, ``LOG_LEVELS`` overrides single loggers
+    (``auth.steam=DEBUG,urllib3=WARNING``) and ``LOG_FORMAT=json`` switches to
+    structured one-line JSON records.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler()
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    levels = {"urllib3": "WARNING"}
+    levels.update(parse_logger_levels(os.getenv("LOG_LEVELS", "")))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+
+class RateLimitedLog:
+    """Lets at most ``limit`` records per key through every ``interval`` seconds.
+
+    The first record after a suppressed window reports how many were dropped.
+    """
+
+    def __init__(self, logger: logging.Logger, limit: int = 5, interval: float = 60.0):
+        self.logger = logger
+        self.limit = limit
+        self.interval = interval
+        self._windows: Dict[str, Tuple[float, int, int]] = {}
+        self._lock = threading.Lock()
+
+    def _allow(self, key: str) -> Tuple[bool, int]:
+        now = time.monotonic()
+        with self._lock:
+            started, emitted, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - started >= self.interval:
+                started, emitted = now, 0
+            if emitted < self.limit:
+                self._windows[key] = (started, emitted + 1, 0)
+                return True, suppressed
+            self._windows[key] = (started, emitted, suppressed + 1)
+            return False, 0
+
+    def log(self, level: int, key: str, message: str, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        allowed, suppressed = self._allow(key)
+        if not allowed:
+            return
+        if suppressed:
+            message = f"{message} ({suppressed} similar messages suppressed)"
+        self.logger.log(level, message, *args)
+
+    def debug(self, key: str, message: str, *args):
+        self.log(logging.DEBUG, key, message, *args)
+
+    def info(self, key: str, message: str, *args):
+        self.log(logging.INFO, key, message, *args)
+
+    def warning(self, key: str, message: str, *args):
+        self.log(logging.WARNING, key, message, *args)
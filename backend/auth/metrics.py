@@ -0,0 +1,289 @@
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Gauges from workers that have not flushed for this long are left out of the totals.
+GAUGE_STALE_SECONDS = 60
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Any]:
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(snapshots: List[Dict[Tuple[str, ...], Any]]) -> Dict[Tuple[str, ...], Any]:
+        merged: Dict[Tuple[str, ...], Any] = {}
+        for snapshot in snapshots:
+            for key, value in snapshot.items():
+                merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def samples(self, values: Dict[Tuple[str, ...], Any], merged: Dict[str, Dict]) -> List[str]:
+        raise NotImplementedError
+
+    def render(self, values: Dict[Tuple[str, ...], Any], merged: Dict[str, Dict]) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples(values, merged))
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._label_values(labels), 0)
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        return self.snapshot()
+
+    def samples(self, values: Dict[Tuple[str, ...], float], merged: Dict[str, Dict]) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_number(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 collect: Optional[Callable[[Dict[str, Dict]], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._collect = collect
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._label_values(labels)] = value
+
+    def samples(self, values: Dict[Tuple[str, ...], float], merged: Dict[str, Dict]) -> List[str]:
+        if self._collect is not None:
+            values = dict(values)
+            values.update(self._collect(merged))
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_number(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._label_values(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket counts, then +Inf count and sum
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], List[float]]:
+        with self._lock:
+            return {key: list(state) for key, state in self._values.items()}
+
+    @staticmethod
+    def merge(snapshots: List[Dict[Tuple[str, ...], List[float]]]) -> Dict[Tuple[str, ...], List[float]]:
+        merged: Dict[Tuple[str, ...], List[float]] = {}
+        for snapshot in snapshots:
+            for key, state in snapshot.items():
+                total = merged.get(key)
+                merged[key] = list(state) if total is None else [a + b for a, b in zip(total, state)]
+        return merged
+
+    def samples(self, values: Dict[Tuple[str, ...], List[float]], merged: Dict[str, Dict]) -> List[str]:
+        lines = []
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, ("le", _format_number(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_number(state[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+registry: List[Metric] = []
+
+
+def register(metric: Metric) -> Metric:
+    registry.append(metric)
+    return metric
+
+
+_store: Optional[str] = None
+
+
+def init_metrics_store(database: str):
+    """Share metrics between worker processes through ``metric_snapshots`` in ``database``.
+
+    Each worker writes its own totals under its pid (see ``flush``) and ``render``
+    adds up every worker's rows, so one scrape covers the whole server. Counters and
+    histograms of exited workers are kept; a restarted worker reusing a pid replaces
+    them, which Prometheus reads as a counter reset.
+    """
+    global _store
+    conn = sqlite3.connect(database, timeout=30)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS metric_snapshots (
+            pid INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            samples TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (pid, name)
+        )
+    """)
+    conn.commit()
+    conn.close()
+    _store = database
+
+
+def _encode(snapshot: Dict[Tuple[str, ...], Any]) -> str:
+    return json.dumps([[list(key), value] for key, value in snapshot.items()])
+
+
+def _decode(samples: str) -> Dict[Tuple[str, ...], Any]:
+    return {tuple(key): value for key, value in json.loads(samples)}
+
+
+def flush():
+    """Write this worker's metrics to the shared store."""
+    if _store is None:
+        return
+    now = time.time()
+    pid = os.getpid()
+    rows = [(pid, metric.name, _encode(metric.snapshot()), now) for metric in registry]
+    conn = sqlite3.connect(_store, timeout=30)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO metric_snapshots (pid, name, samples, updated_at) VALUES (?, ?, ?, ?)", rows)
+    finally:
+        conn.close()
+
+
+def _collect_all() -> Dict[str, Dict[Tuple[str, ...], Any]]:
+    if _store is None:
+        return {metric.name: metric.snapshot() for metric in registry}
+    flush()
+    conn = sqlite3.connect(_store, timeout=30)
+    try:
+        rows = conn.execute("SELECT name, samples, updated_at FROM metric_snapshots").fetchall()
+    finally:
+        conn.close()
+    gauges = {metric.name for metric in registry if isinstance(metric, Gauge)}
+    stale_before = time.time() - GAUGE_STALE_SECONDS
+    snapshots: Dict[str, List[Dict[Tuple[str, ...], Any]]] = {}
+    for name, samples, updated_at in rows:
+        # A gauge is a current reading, so only workers that are still alive count.
+        if name in gauges and updated_at < stale_before:
+            continue
+        snapshots.setdefault(name, []).append(_decode(samples))
+    return {metric.name: metric.merge(snapshots.get(metric.name, [])) for metric in registry}
+
+
+def render() -> str:
+    merged = _collect_all()
+    return "\n".join(metric.render(merged[metric.name], merged) for metric in registry) + "\n"
+
+
+http_request_duration = register(Histogram(
+    "http_request_duration_seconds", "Latency of API requests by route.", ["method", "route", "status"]))
+
+upstream_requests = register(Counter(
+    "upstream_requests_total",
+    "Upstream HTTP calls by host and response status code (or error, queue_timeout, circuit_open).",
+    ["host", "status"]))
+upstream_request_duration = register(Histogram(
+    "upstream_request_duration_seconds", "Latency of upstream HTTP calls by host.", ["host"]))
+
+upstream_queue_depth = register(Gauge(
+    "upstream_queue_depth", "Upstream calls waiting for a scheduler slot by priority.", ["priority"]))
+upstream_in_flight = register(Gauge(
+    "upstream_in_flight", "Upstream calls in progress by priority.", ["priority"]))
+upstream_queue_wait = register(Histogram(
+    "upstream_queue_wait_seconds", "Time upstream calls spent queued in the scheduler by priority.", ["priority"]))
+
+cache_requests = register(Counter(
+    "cache_requests_total", "Cache lookups by namespace and result.", ["namespace", "result"]))
+
+
+def _cache_hit_ratios(merged: Dict[str, Dict]) -> Dict[Tuple[str, ...], float]:
+    totals: Dict[str, List[float]] = {}
+    for (namespace, result), value in merged[cache_requests.name].items():
+        hits_and_total = totals.setdefault(namespace, [0, 0])
+        if result == "hit":
+            hits_and_total[0] += value
+        hits_and_total[1] += value
+    return {(namespace,): hits / total for namespace, (hits, total) in totals.items() if total}
+
+
+cache_hit_ratio = register(Gauge(
+    "cache_hit_ratio", "Share of cache lookups answered from cache since start.", ["namespace"],
+    collect=_cache_hit_ratios))
+
+model_inference_duration = register(Histogram(
+    "model_inference_seconds", "Time spent in price model inference.", ["appid"]))
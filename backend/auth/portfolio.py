@@ -0,0 +1,131 @@
+import logging
+import sqlite3
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from auth.cache import get_bus
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_DAYS = 90
+HISTORY_DATE_FORMAT = "%b %d %Y %H: +0"
+
+
+def init_portfolio(database: str):
+    conn = sqlite3.connect(database, timeout=30)
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS portfolio_snapshots (
+            steam_id TEXT NOT NULL,
+            appid TEXT NOT NULL,
+            day TEXT NOT NULL,
+            value REAL NOT NULL,
+            item_count INTEGER NOT NULL,
+            priced_count INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (steam_id, appid, day)
+        )
+    """)
+
+    conn.commit()
+    conn.close()
+
+
+def daily_price_matrix(histories: Dict[str, List], start: date, end: date) -> pd.DataFrame:
+    """Median sale price per day (rows) and item (columns) over ``start..end``.
+
+    Days without sales carry the previous price forward, including the last
+    sale before ``start``.
+    """
+    days = pd.date_range(start, end, freq="D")
+    frames = [pd.DataFrame({"name": name, "date": [point[0] for point in history],
+                            "price": [point[1] for point in history]})
+              for name, history in histories.items() if history]
+    if not frames:
+        return pd.DataFrame(index=days)
+
+    points = pd.concat(frames, ignore_index=True)
+    points["day"] = pd.to_datetime(points["date"], format=HISTORY_DATE_FORMAT, errors="coerce").dt.normalize()
+    points["price"] = pd.to_numeric(points["price"], errors="coerce")
+    points = points.dropna(subset=["day", "price"])
+
+    daily = points.groupby(["day", "name"])["price"].median().unstack("name")
+    daily = daily.reindex(daily.index.union(days)).ffill()
+    return daily.reindex(days)
+
+
+def snapshot_rows(holdings: Dict[str, int], daily_prices: pd.DataFrame,
+                  current_prices: Dict[str, float]) -> List[Tuple[str, float, int, int]]:
+    names = list(holdings)
+    counts = np.array([holdings[name] for name in names], dtype=float)
+    # A copy: the frame's own buffer is read-only under pandas copy-on-write.
+    matrix = daily_prices.reindex(columns=names).to_numpy(dtype=float, copy=True)
+    if not len(matrix):
+        return []
+
+    # The last row is today: the freshest known price beats the last recorded sale.
+    current = np.array([current_prices.get(name, np.nan) for name in names], dtype=float)
+    matrix[-1] = np.where(np.isnan(current), matrix[-1], current)
+
+    priced = ~np.isnan(matrix)
+    values = np.nansum(matrix * counts, axis=1)
+    priced_counts = (priced * counts).sum(axis=1)
+    item_count = int(counts.sum())
+    return [(day.date().isoformat(), round(float(value), 2), item_count, int(priced_count))
+            for day, value, priced_count in zip(daily_prices.index, values, priced_counts)]
+
+
+class PortfolioStore:
+    def __init__(self, database: str):
+        self.bus = get_bus(database)
+
+    def last_snapshot(self, steam_id: str, appid: str) -> Optional[Tuple[str, float]]:
+        conn = self.bus.connection()
+        return conn.execute(
+            "SELECT day, updated_at FROM portfolio_snapshots WHERE steam_id = ? AND appid = ? "
+            "ORDER BY day DESC LIMIT 1", (steam_id, appid)).fetchone()
+
+    def series(self, steam_id: str, appid: str, since: str) -> List[Dict[str, Any]]:
+        conn = self.bus.connection()
+        rows = conn.execute(
+            "SELECT day, value, item_count, priced_count FROM portfolio_snapshots "
+            "WHERE steam_id = ? AND appid = ? AND day >= ? ORDER BY day", (steam_id, appid, since)).fetchall()
+        return [{"day": day, "value": value, "item_count": item_count, "priced_count": priced_count}
+                for day, value, item_count, priced_count in rows]
+
+    def write(self, steam_id: str, appid: str, rows: List[Tuple[str, float, int, int]]):
+        now = time.time()
+        conn = self.bus.connection()
+        with conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO portfolio_snapshots
+                    (steam_id, appid, day, value, item_count, priced_count, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [(steam_id, appid, day, value, item_count, priced_count, now)
+                  for day, value, item_count, priced_count in rows])
+
+
+def update_portfolio(store: PortfolioStore, steam_id: str, appid: str, items: List[Dict[str, Any]],
+                     histories: Dict[str, List], current_prices: Dict[str, float],
+                     today: Optional[date] = None) -> int:
+    """Writes the daily values from the last stored day (rewritten, it may be partial) up to today.
+
+    Only the latest inventory snapshot is known, so backfilled and missed days
+    value the current holdings at that day's prices.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    last = store.last_snapshot(steam_id, appid)
+    start = date.fromisoformat(last[0]) if last else today - timedelta(days=BACKFILL_DAYS)
+
+    holdings = Counter(item["market_hash_name"] for item in items)
+    daily_prices = daily_price_matrix(histories, start, today)
+    rows = snapshot_rows(holdings, daily_prices, current_prices)
+    store.write(steam_id, appid, rows)
+    logger.debug(f"Portfolio {steam_id}:{appid} updated for {len(rows)} days from {start}")
+    return len(rows)
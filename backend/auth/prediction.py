@@ -0,0 +1,88 @@
+import logging
+from datetime import timedelta
+from typing import Dict, List
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Model inputs, in column order; the models predict the next day's pct_change_1d.
+FEATURES = ["pct_change_1d", "pct_change_7d", "day_of_week", "hour", "event", "volume"]
+
+
+def prepare_prediction_data(history_data: List[List]) -> pd.DataFrame:
+    if not history_data or len(history_data) < 50:
+        logger.error(f"Insufficient history data: {len(history_data)} entries")
+        return None
+
+    df = pd.DataFrame(history_data, columns=["timestamp", "price", "volume"])
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="%b %d %Y %H: +0")
+    df["price"] = df["price"].astype(float)
+    df["volume"] = df["volume"].str.replace(",", "").astype(int)
+
+    df["date"] = df["timestamp"].dt.date
+    df_daily = df.groupby("date").agg({
+        "timestamp": "last",
+        "price": "last",
+        "volume": "sum"
+    }).reset_index()
+
+    df_daily.set_index("timestamp", inplace=True)
+
+    df_daily = df_daily.asfreq("D", method="ffill").reset_index()
+
+    df_daily["pct_change_1d"] = df_daily["price"].pct_change(periods=1) * 100
+    df_daily["pct_change_7d"] = df_daily["price"].pct_change(periods=7) * 100
+
+    df_daily["day_of_week"] = df_daily["timestamp"].dt.dayofweek
+    df_daily["hour"] = df_daily["timestamp"].dt.hour
+
+    df_daily["event"] = 0
+
+    df_daily = df_daily.dropna()
+
+    if len(df_daily) < 10:
+        logger.error(f"Too few data points after processing: {len(df_daily)} entries")
+        return None
+
+    return df_daily
+
+def predict_price(model, data: pd.DataFrame, horizon: int) -> Dict:
+    last_row = data.tail(1).copy()
+    last_price = last_row["price"].iloc[0]
+    last_date = last_row["timestamp"].iloc[0]
+
+    predictions = []
+    current_features = last_row[FEATURES].copy()
+
+    for day in range(1, horizon + 1):
+        X = current_features[FEATURES].values
+        predicted_pct_change = model.predict(X)[0]
+
+        new_price = last_price * (1 + predicted_pct_change / 100)
+
+        new_date = last_date + timedelta(days=day)
+
+        predictions.append({
+            "date": new_date.strftime("%Y-%m-%d"),
+            "predicted_price": round(new_price, 2),
+            "predicted_pct_change": round(predicted_pct_change, 3)
+        })
+
+        current_features["pct_change_1d"] = predicted_pct_change
+        current_features["pct_change_7d"] = (
+            (new_price - data["price"].iloc[-7]) / data["price"].iloc[-7] * 100
+            if len(data) >= 7 else predicted_pct_change
+        )
+        current_features["day_of_week"] = new_date.dayofweek
+        current_features["hour"] = new_date.hour
+        current_features["event"] = 0
+        current_features["volume"] = last_row["volume"].iloc[0]
+
+        last_price = new_price
+
+    return {
+        "last_known_price": round(last_row["price"].iloc[0], 2),
+        "last_known_date": last_row["timestamp"].iloc[0].strftime("%Y-%m-%d"),
+        "predictions": predictions
+    }
@@ -0,0 +1,221 @@
+import logging
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from auth.cache import get_bus
+from auth.metrics import cache_requests
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "market_prices"
+# Staged rows older than this belong to an ingestion whose process died and are dropped.
+STAGING_MAX_AGE_SECONDS = 3600
+
+
+class PriceBookInfo(NamedTuple):
+    source: str
+    version: int
+    updated_at: float
+    item_count: int
+
+    def is_stale(self, ttl: float) -> bool:
+        return time.time() - self.updated_at > ttl
+
+
+def init_price_books(database: str):
+    conn = sqlite3.connect(database, timeout=30)
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS market_prices (
+            source TEXT NOT NULL,
+            market_hash_name TEXT NOT NULL,
+            price REAL NOT NULL,
+            volume INTEGER NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (source, market_hash_name)
+        )
+    """)
+
+    # Rows of an ingestion in progress, moved into market_prices in one transaction when it completes.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS market_prices_staging (
+            source TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            market_hash_name TEXT NOT NULL,
+            price REAL NOT NULL,
+            volume INTEGER NOT NULL,
+            PRIMARY KEY (source, version, market_hash_name)
+        ) WITHOUT ROWID
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS price_book_versions (
+            source TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            item_count INTEGER NOT NULL
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS steam_prices (
+            appid TEXT NOT NULL,
+            market_hash_name TEXT NOT NULL,
+            price REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (appid, market_hash_name)
+        )
+    """)
+
+    conn.commit()
+    conn.close()
+
+
+def parse_price_text(text: Any) -> Optional[float]:
+    """``"$1,234.56"`` -> ``1234.56``; anything unparsable (``"N/A"``) -> None."""
+    if isinstance(text, (int, float)):
+        return float(text)
+    if not isinstance(text, str):
+        return None
+    try:
+        return float(text.replace("$", "").replace(",", "").replace("USD", "").strip())
+    except ValueError:
+        return None
+
+
+def parse_price_book_rows(items: List[Dict[str, Any]], name_field: str) -> List[Tuple[str, float, int]]:
+    rows = []
+    for item in items:
+        name = item.get(name_field)
+        try:
+            price = float(item["price"])
+            volume = int(float(item.get("volume") or item.get("count") or 1))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if name:
+            rows.append((name, price, volume))
+    return rows
+
+
+class PriceBookStore:
+    """Bulk price dumps stored one row per item instead of one JSON blob per source.
+
+    Rows of the same ingestion run that share a name are merged into the lowest
+    price and the summed volume, so listing dumps become per-item order books.
+    A run is staged batch by batch and replaces the source's book in one
+    transaction at the end, so readers only ever see a complete version.
+    """
+
+    def __init__(self, database: str):
+        self.database = database
+        self.bus = get_bus(database)
+
+    def info(self, source: str) -> Optional[PriceBookInfo]:
+        conn = self.bus.connection()
+        row = conn.execute(
+            "SELECT source, version, updated_at, item_count FROM price_book_versions WHERE source = ?",
+            (source,)).fetchone()
+        return PriceBookInfo(*row) if row else None
+
+    def get_price(self, source: str, market_hash_name: str) -> Optional[float]:
+        conn = self.bus.connection()
+        row = conn.execute(
+            "SELECT price FROM market_prices WHERE source = ? AND market_hash_name = ?",
+            (source, market_hash_name)).fetchone()
+        cache_requests.inc(namespace=NAMESPACE, result="hit" if row else "miss")
+        return row[0] if row else None
+
+    def get_prices(self, source: str, market_hash_names: Iterable[str]) -> Dict[str, float]:
+        names = list(market_hash_names)
+        conn = self.bus.connection()
+        prices = {}
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT market_hash_name, price FROM market_prices "
+                f"WHERE source = ? AND market_hash_name IN ({placeholders})", [source] + chunk).fetchall()
+            prices.update(rows)
+        return prices
+
+    def rows(self, source: str) -> List[Tuple[str, float, int]]:
+        conn = self.bus.connection()
+        return conn.execute(
+            "SELECT market_hash_name, price, volume FROM market_prices WHERE source = ?", (source,)).fetchall()
+
+    def set_steam_prices(self, appid: str, prices: Iterable[Tuple[str, float]]):
+        now = time.time()
+        rows = [(appid, name, price, now) for name, price in prices]
+        if not rows:
+            return
+        conn = self.bus.connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO steam_prices (appid, market_hash_name, price, updated_at) VALUES (?, ?, ?, ?)",
+                rows)
+
+    def get_steam_prices(self, appid: str, market_hash_names: Iterable[str]) -> Dict[str, float]:
+        names = list(market_hash_names)
+        conn = self.bus.connection()
+        prices = {}
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT market_hash_name, price FROM steam_prices "
+                f"WHERE appid = ? AND market_hash_name IN ({placeholders})", [appid] + chunk).fetchall()
+            prices.update(rows)
+        return prices
+
+    def _drop_staged(self, conn: sqlite3.Connection, source: str, version: int):
+        with conn:
+            conn.execute("DELETE FROM market_prices_staging WHERE source = ? AND version = ?", (source, version))
+
+    def ingest(self, source: str, batches: Iterable[List[Tuple[str, float, int]]]) -> int:
+        version = time.time_ns()
+        conn = self.bus.connection()
+        with conn:
+            conn.execute("DELETE FROM market_prices_staging WHERE source = ? AND version < ?",
+                         (source, version - STAGING_MAX_AGE_SECONDS * 10 ** 9))
+        count = 0
+        try:
+            for batch in batches:
+                with conn:
+                    conn.executemany("""
+                        INSERT INTO market_prices_staging (source, version, market_hash_name, price, volume)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT(source, version, market_hash_name) DO UPDATE SET
+                            price = MIN(market_prices_staging.price, excluded.price),
+                            volume = market_prices_staging.volume + excluded.volume
+                    """, [(source, version, name, price, volume) for name, price, volume in batch])
+                count += len(batch)
+        except Exception:
+            self._drop_staged(conn, source, version)
+            raise
+
+        if not count:
+            logger.warning(f"Price book {source} was empty, keeping the previous version")
+            return 0
+
+        try:
+            with conn:
+                conn.execute("DELETE FROM market_prices WHERE source = ?", (source,))
+                item_count = conn.execute("""
+                    INSERT INTO market_prices (source, market_hash_name, price, volume, version)
+                    SELECT source, market_hash_name, price, volume, version FROM market_prices_staging
+                    WHERE source = ? AND version = ?
+                """, (source, version)).rowcount
+                conn.execute("DELETE FROM market_prices_staging WHERE source = ? AND version = ?", (source, version))
+                conn.execute("""
+                    INSERT OR REPLACE INTO price_book_versions (source, version, updated_at, item_count)
+                    VALUES (?, ?, ?, ?)
+                """, (source, version, time.time(), item_count))
+                self.bus.publish(conn, NAMESPACE, source)
+        except Exception:
+            self._drop_staged(conn, source, version)
+            raise
+
+        logger.info(f"Price book {source} ingested: {count} rows, {item_count} items")
+        return item_count
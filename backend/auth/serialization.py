@@ -0,0 +1,156 @@
+"""Encoding of cached values and API responses.
+
+JSON goes through orjson when it is installed, which serializes NumPy
+scalars and arrays natively; otherwise the standard library is used with a
+NumPy fallback. Stored values of at least ``COMPRESS_MIN_BYTES`` become
+binary blobs of compressed JSON, with zstd when zstandard is installed and
+zlib otherwise. On price histories this is about 4x smaller than JSON text
+and cheaper to write and read back than ``json.dumps``/``json.loads``;
+MessagePack compressed no better and decoded no faster, so it is only
+offered to API clients that ask for it. A blob starts with a two-byte
+header naming its format and compression, and rows written as plain JSON
+text stay readable. zstd blobs need zstandard on every node sharing the
+database; zlib ones need nothing extra.
+"""
+import json
+import logging
+import os
+import zlib
+from typing import Any, Optional, Union
+
+import numpy as np
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# "compressed" stores large values as binary blobs, "json" keeps every value as
+# JSON text (readable from the sqlite3 shell).
+CACHE_BLOBS = os.getenv("CACHE_BLOBS", "compressed")
+COMPRESS_MIN_BYTES = 1024
+# Higher levels cost several times the CPU for 10-20% smaller blobs.
+ZSTD_LEVEL = 1
+ZLIB_LEVEL = 1
+
+BLOB_VERSION = 1
+COMPRESSION_NONE, COMPRESSION_ZLIB, COMPRESSION_ZSTD = 0, 1, 2
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, tuple):
+        # NamedTuples, which orjson does not serialize by itself.
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """Compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(value, default=_default, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _pack(value: Any) -> bytes:
+    return msgpack.packb(value, default=_default, use_bin_type=True)
+
+
+def encode_value(value: Any) -> Union[str, bytes]:
+    """What a cache table stores for ``value``: JSON text when small, else a compressed blob."""
+    text = dumps(value)
+    if CACHE_BLOBS != "compressed" or len(text) < COMPRESS_MIN_BYTES:
+        return text.decode()
+    if zstandard is not None:
+        return bytes((BLOB_VERSION, COMPRESSION_ZSTD)) + zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(text)
+    return bytes((BLOB_VERSION, COMPRESSION_ZLIB)) + zlib.compress(text, ZLIB_LEVEL)
+
+
+def decode_value(stored: Union[str, bytes, None]) -> Any:
+    """Inverse of :func:`encode_value`; also reads rows written as plain JSON text."""
+    if stored is None:
+        return None
+    if isinstance(stored, str):
+        return loads(stored)
+    version, compression = stored[0], stored[1]
+    if version != BLOB_VERSION:
+        raise ValueError(f"Unsupported cache blob version {version}")
+    payload = memoryview(stored)[2:]
+    if compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise ValueError("Cache blob is zstd-compressed but zstandard is not installed")
+        return loads(zstandard.ZstdDecompressor().decompress(payload))
+    if compression == COMPRESSION_ZLIB:
+        return loads(zlib.decompress(payload))
+    return loads(bytes(payload))
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered by :func:`dumps`, so NumPy values need no conversion pass."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class MsgPackResponse(Response):
+    media_type = "application/msgpack"
+
+    def render(self, content: Any) -> bytes:
+        return _pack(content)
+
+
+def wants_msgpack(request: Request) -> bool:
+    if msgpack is None:
+        return False
+    accept = request.headers.get("accept", "").lower()
+    return any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+
+def negotiated_media_type(request: Request) -> str:
+    """Media type :func:`negotiated_response` answers ``request`` with, e.g. to key ETags on."""
+    return MsgPackResponse.media_type if wants_msgpack(request) else FastJSONResponse.media_type
+
+
+def negotiated_response(request: Request, content: Any, response: Optional[Response] = None,
+                        status_code: int = 200) -> Response:
+    """``content`` as MessagePack when the client accepts it, JSON otherwise.
+
+    Headers already set on the endpoint's injected ``response`` (ETag,
+    Cache-Control) are carried over, since a returned response replaces it.
+    """
+    response_class = MsgPackResponse if wants_msgpack(request) else FastJSONResponse
+    result = response_class(content, status_code=status_code)
+    if response is not None:
+        for name, value in response.headers.items():
+            if name not in ("content-length", "content-type"):
+                result.headers[name] = value
+    result.headers["Vary"] = "Accept"
+    return result
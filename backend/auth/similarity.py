@@ -0,0 +1,285 @@
+import heapq
+import logging
+import math
+import threading
+import time
+import warnings
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+from sklearn.neighbors import BallTree
+
+from auth.cache import get_bus, run_in_background
+from auth.items import build_item_properties, normalize_market_hash_name
+from auth.serialization import decode_value
+
+logger = logging.getLogger(__name__)
+
+CATEGORICAL_FIELDS = ("type", "rarity", "wear", "hero", "slot", "quality", "attributes")
+NUMERIC_FIELDS = ("log_price", "volatility_30d", "change_7d", "log_volume_7d")
+# Euclidean distance contribution of a mismatch in each field (numeric fields: per standard deviation).
+FEATURE_WEIGHTS = {
+    "type": 1.0, "rarity": 1.0, "wear": 0.5, "hero": 1.0, "slot": 1.0, "quality": 0.5, "attributes": 0.5,
+    "log_price": 1.5, "volatility_30d": 0.5, "change_7d": 0.25, "log_volume_7d": 0.5,
+}
+# Changed items are searched brute force next to the tree until they outgrow
+# this share of the index, then the tree is rebuilt in the background.
+REBUILD_FRACTION = 0.05
+REBUILD_MIN_CHANGES = 500
+LEAF_SIZE = 40
+# Properties only change when a schema is ingested, and finding changed rows
+# scans the appid's properties, so they are checked less often than trends.
+PROPERTIES_SYNC_INTERVAL = 60
+
+
+class CatalogItem(NamedTuple):
+    # As Steam spells it, for responses; the catalog itself is keyed by the normalized name.
+    market_hash_name: str
+    properties: Dict[str, Any]
+    # (price, volatility_30d, change_7d, volume_7d) from item_trends, None until a history was seen
+    stats: Optional[Tuple[float, Optional[float], Optional[float], float]]
+    from_schema: bool
+
+
+def _numeric(stats) -> List[Optional[float]]:
+    if stats is None:
+        return [None] * len(NUMERIC_FIELDS)
+    price, volatility, change_7d, volume_7d = stats
+    return [math.log10(max(price, 0.01)), volatility, change_7d, math.log1p(max(volume_7d, 0.0))]
+
+
+class FeatureSpace:
+    """One-hot item properties plus standardized trend stats, weighted by ``FEATURE_WEIGHTS``.
+
+    Vocabulary and scaling are fixed when the index is built; values first seen
+    later simply get no column until the next rebuild.
+    """
+
+    def __init__(self, items: Iterable[CatalogItem]):
+        items = list(items)
+        values = sorted({(field, value) for item in items for field in CATEGORICAL_FIELDS
+                         for value in self._values(item.properties, field)})
+        self.columns = {column: index for index, column in enumerate(values)}
+        self.numeric_offset = len(values)
+        self.dimensions = len(values) + len(NUMERIC_FIELDS)
+
+        numeric = np.array([[np.nan if value is None else value for value in _numeric(item.stats)]
+                            for item in items if item.stats is not None], dtype=float)
+        numeric = numeric.reshape(-1, len(NUMERIC_FIELDS))
+        with np.errstate(invalid="ignore"), warnings.catch_warnings():
+            # All-missing columns (e.g. no volatility yet) fall back to mean 0, std 1.
+            warnings.simplefilter("ignore", RuntimeWarning)
+            means = np.nanmean(numeric, axis=0)
+            stds = np.nanstd(numeric, axis=0)
+        self.means = np.where(np.isfinite(means), means, 0.0)
+        self.stds = np.where(np.isfinite(stds) & (stds > 0), stds, 1.0)
+
+    @staticmethod
+    def _values(properties: Dict[str, Any], field: str) -> List[str]:
+        value = properties.get(field) or []
+        return [value] if isinstance(value, str) else [str(item) for item in value if item]
+
+    def encode(self, item: CatalogItem) -> np.ndarray:
+        vector = np.zeros(self.dimensions)
+        for field in CATEGORICAL_FIELDS:
+            for value in self._values(item.properties, field):
+                column = self.columns.get((field, value))
+                if column is not None:
+                    # Two one-hot columns differ on a mismatch, so each carries weight / sqrt(2).
+                    vector[column] = FEATURE_WEIGHTS[field] / math.sqrt(2)
+        # Missing stats stay at the catalog mean.
+        for offset, (field, value) in enumerate(zip(NUMERIC_FIELDS, _numeric(item.stats))):
+            if value is not None:
+                vector[self.numeric_offset + offset] = ((value - self.means[offset]) / self.stds[offset]
+                                                        * FEATURE_WEIGHTS[field])
+        return vector
+
+
+class AppidIndex:
+    """Ball tree over one appid's catalog, plus a brute-force delta of items changed since it was built."""
+
+    def __init__(self, records: Dict[str, CatalogItem], seen_trends: float, seen_properties: float):
+        self.records = records
+        self.keys = list(records)
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+        self.space = FeatureSpace(records.values())
+        self.matrix = np.array([self.space.encode(item) for item in records.values()])
+        self.matrix = self.matrix.reshape(-1, self.space.dimensions)
+        self.tree = BallTree(self.matrix, leaf_size=LEAF_SIZE) if len(self.keys) else None
+        self.removed: Set[int] = set()
+        self.delta: Dict[str, np.ndarray] = {}
+        self._delta_matrix: Optional[Tuple[List[str], np.ndarray]] = None
+        self.seen_trends = seen_trends
+        self.seen_properties = seen_properties
+        self.properties_synced_at = time.monotonic()
+
+    def apply(self, keys: Iterable[str]):
+        for key in keys:
+            row = self.rows.get(key)
+            if row is not None:
+                self.removed.add(row)
+            self.delta[key] = self.space.encode(self.records[key])
+        self._delta_matrix = None
+
+    def needs_rebuild(self) -> bool:
+        return len(self.delta) > max(REBUILD_MIN_CHANGES, REBUILD_FRACTION * len(self.keys))
+
+    def vector(self, key: str, fallback: CatalogItem) -> np.ndarray:
+        if key in self.delta:
+            return self.delta[key]
+        if key in self.rows:
+            return self.matrix[self.rows[key]]
+        return self.space.encode(fallback)
+
+    def nearest(self, vector: np.ndarray, exclude: str, limit: int) -> List[Tuple[float, str]]:
+        candidates: List[Tuple[float, str]] = []
+        if self.tree is not None:
+            size = len(self.keys)
+            k = min(size, limit + 1)
+            while True:
+                distances, rows = self.tree.query(vector[None, :], k=k)
+                found = [(float(distance), self.keys[row]) for distance, row in zip(distances[0], rows[0])
+                         if row not in self.removed and self.keys[row] != exclude]
+                if len(found) >= limit or k == size:
+                    break
+                k = min(size, k * 2)
+            candidates += found[:limit]
+
+        if self.delta:
+            if self._delta_matrix is None:
+                self._delta_matrix = (list(self.delta), np.array(list(self.delta.values())))
+            keys, matrix = self._delta_matrix
+            distances = np.sqrt(((matrix - vector) ** 2).sum(axis=1))
+            candidates += [(float(distance), key) for distance, key in zip(distances, keys) if key != exclude]
+        return heapq.nsmallest(limit, candidates)
+
+
+class SimilarityIndex:
+    """Nearest neighbours among catalog items by properties and price/volatility stats.
+
+    The catalog of an appid is every item in the properties map plus every item
+    with trend stats. It is indexed once; newer trend rows are picked up on
+    every read with one indexed query, property rows at most every
+    ``PROPERTIES_SYNC_INTERVAL``, and changed items go into the delta. Items
+    known only from the properties map are named as in the stored schema.
+    Indexes are only ever built in the background and swapped in, so a read
+    before the first build finishes gets None from ``similar``.
+    """
+
+    def __init__(self, database: str):
+        self.bus = get_bus(database)
+        self._indexes: Dict[str, AppidIndex] = {}
+        self._lock = threading.Lock()
+
+    def _schema_names(self, appid: str) -> Dict[str, str]:
+        """Normalized name -> name as spelled in the stored schema of ``appid``."""
+        names = {}
+        rows = self.bus.connection().execute("SELECT item_data FROM schema_items WHERE appid = ?", (appid,))
+        for (stored,) in rows:
+            item = decode_value(stored)
+            name = item.get("market_hash_name", item.get("name", ""))
+            if name:
+                names[normalize_market_hash_name(name)] = name
+        return names
+
+    def _changes(self, appid: str, records: Dict[str, CatalogItem], seen_trends: float,
+                 seen_properties: Optional[float]) -> Tuple[Set[str], float, Optional[float]]:
+        """Merge trend rows, and property rows unless ``seen_properties`` is None, newer than the marks."""
+        conn = self.bus.connection()
+        changed = set()
+        rows = []
+        if seen_properties is not None:
+            # Range instead of LIKE so the primary key index is used.
+            rows = conn.execute(
+                "SELECT cache_key, properties, updated_at FROM item_properties "
+                "WHERE cache_key >= ? AND cache_key < ? AND updated_at > ?",
+                (f"{appid}:", f"{appid};", seen_properties)).fetchall()
+        schema_names = self._schema_names(appid) if rows else {}
+        for cache_key, stored, updated_at in rows:
+            key = cache_key[len(appid) + 1:]
+            current = records.get(key)
+            if current is not None and current.stats is not None:
+                market_hash_name = current.market_hash_name
+            else:
+                market_hash_name = schema_names.get(key, key)
+            records[key] = CatalogItem(market_hash_name, decode_value(stored),
+                                       current.stats if current else None, True)
+            changed.add(key)
+            seen_properties = max(seen_properties, updated_at or 0.0)
+
+        rows = conn.execute(
+            "SELECT market_hash_name, price, volatility_30d, change_7d, volume_7d, updated_at FROM item_trends "
+            "WHERE appid = ? AND updated_at > ?", (appid, seen_trends)).fetchall()
+        for market_hash_name, price, volatility, change_7d, volume_7d, updated_at in rows:
+            key = normalize_market_hash_name(market_hash_name)
+            current = records.get(key)
+            if current is not None and current.from_schema:
+                properties = current.properties
+            else:
+                properties = build_item_properties({"market_hash_name": market_hash_name}, appid)[1]
+            records[key] = CatalogItem(market_hash_name, properties, (price, volatility, change_7d, volume_7d),
+                                       current.from_schema if current else False)
+            changed.add(key)
+            seen_trends = max(seen_trends, updated_at)
+        return changed, seen_trends, seen_properties
+
+    def build(self, appid: str) -> AppidIndex:
+        started = time.perf_counter()
+        records: Dict[str, CatalogItem] = {}
+        _, seen_trends, seen_properties = self._changes(appid, records, 0.0, 0.0)
+        index = AppidIndex(records, seen_trends, seen_properties)
+        logger.info(f"Similarity index for appid {appid} built with {len(records)} items "
+                    f"and {index.space.dimensions} features in {time.perf_counter() - started:.2f}s")
+        return index
+
+    def rebuild(self, appid: str):
+        index = self.build(appid)
+        with self._lock:
+            self._indexes[appid] = index
+
+    def _index(self, appid: str) -> Optional[AppidIndex]:
+        """Current index of ``appid`` with recent changes applied; caller holds the lock."""
+        index = self._indexes.get(appid)
+        if index is None:
+            run_in_background(("similarity", appid), lambda: self.rebuild(appid))
+            return None
+        sync_properties = time.monotonic() - index.properties_synced_at >= PROPERTIES_SYNC_INTERVAL
+        changed, index.seen_trends, seen_properties = self._changes(
+            appid, index.records, index.seen_trends, index.seen_properties if sync_properties else None)
+        if sync_properties:
+            index.seen_properties = seen_properties
+            index.properties_synced_at = time.monotonic()
+        if changed:
+            index.apply(changed)
+            if index.needs_rebuild():
+                run_in_background(("similarity", appid), lambda: self.rebuild(appid))
+        return index
+
+    def similar(self, appid: str, market_hash_name: str, limit: int = 10) -> Optional[List[Dict[str, Any]]]:
+        """Nearest catalog items, or None while the index of ``appid`` is still being built."""
+        key = normalize_market_hash_name(market_hash_name)
+        with self._lock:
+            index = self._index(appid)
+            if index is None:
+                return None
+            item = index.records.get(key)
+            if item is None:
+                item = CatalogItem(market_hash_name, build_item_properties({"market_hash_name": market_hash_name},
+                                                                           appid)[1], None, False)
+            neighbours = index.nearest(index.vector(key, item), key, limit)
+            records = index.records
+
+        result = []
+        for distance, neighbour_key in neighbours:
+            neighbour = records[neighbour_key]
+            price, volatility, change_7d, volume_7d = neighbour.stats or (None, None, None, None)
+            result.append({
+                "market_hash_name": neighbour.market_hash_name,
+                "distance": round(distance, 4),
+                "price": price,
+                "volatility_30d": volatility,
+                "change_7d": change_7d,
+                "volume_7d": volume_7d,
+                "properties": neighbour.properties,
+            })
+        return result
@@ -0,0 +1,259 @@
+"""Export and import of the shared cache tables, to bootstrap a new node warm.
+
+Run from the ``backend`` directory::
+
+    python -m auth.snapshot export cache-snapshot.db.gz              # from favorites.db
+    python -m auth.snapshot export history.db.gz --only history
+    python -m auth.snapshot info cache-snapshot.db.gz
+    python -m auth.snapshot import cache-snapshot.db.gz              # before the node starts serving
+
+A snapshot is a gzip-compressed SQLite file holding copies of the selected
+tables plus a ``snapshot_meta`` table with the format version, the tables'
+DDL and row counts. Export copies every table inside one read transaction,
+so the snapshot is consistent even while the source node is serving. Import
+is a bulk ``INSERT ... SELECT`` per table from the attached snapshot: rows
+the node already has are kept unless ``--overwrite`` is given, tables and
+columns the node lacks are created, and history rollups are re-keyed to the
+node's own item ids. Imported rows keep their ``updated_at``, so stale
+entries are served and refreshed in the background as usual.
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from auth.cache import get_bus, init_shared_state
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+# Groups of tables that can be exported, in import order.
+SNAPSHOT_TABLES = {
+    "schema": ["schema_items"],
+    "properties": ["item_properties"],
+    "price_books": ["price_book_versions", "market_prices", "steam_prices"],
+    "history": ["history_cache", "history_items", "history_daily", "item_trends"],
+}
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+def _columns(conn: sqlite3.Connection, schema: str, table: str) -> List[tuple]:
+    return conn.execute(f"PRAGMA {schema}.table_info({table})").fetchall()
+
+
+def _read_meta(conn: sqlite3.Connection, schema: str = "main") -> Dict[str, Any]:
+    meta = {key: json.loads(value) for key, value in conn.execute(f"SELECT key, value FROM {schema}.snapshot_meta")}
+    if meta.get("format_version", 0) > FORMAT_VERSION:
+        raise ValueError(f"Snapshot format {meta['format_version']} is newer than supported ({FORMAT_VERSION})")
+    return meta
+
+
+def export_snapshot(database: str, path: str, groups: List[str], level: int = 6) -> Dict[str, Any]:
+    """Write the tables of ``groups`` that exist in ``database`` to a compressed snapshot at ``path``."""
+    started = time.perf_counter()
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, raw_path = tempfile.mkstemp(suffix=".db", dir=directory)
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(database, timeout=30, isolation_level=None)
+        try:
+            conn.execute("ATTACH DATABASE ? AS snapshot", (raw_path,))
+            conn.execute("PRAGMA snapshot.journal_mode=OFF")
+            conn.execute("PRAGMA snapshot.synchronous=OFF")
+            existing = {name: sql for name, sql in conn.execute(
+                "SELECT name, sql FROM main.sqlite_master WHERE type = 'table'")}
+            tables = [table for group in groups for table in SNAPSHOT_TABLES[group] if table in existing]
+
+            counts = {}
+            conn.execute("BEGIN")
+            for table in tables:
+                conn.execute(existing[table].replace(f"CREATE TABLE {table}", f"CREATE TABLE snapshot.{table}", 1))
+                counts[table] = conn.execute(f"INSERT INTO snapshot.{table} SELECT * FROM main.{table}").rowcount
+            indexes = dict(conn.execute(
+                "SELECT name, sql FROM main.sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN "
+                f"({','.join('?' * len(tables))})", tables).fetchall()) if tables else {}
+            meta = {
+                "format_version": FORMAT_VERSION,
+                "created_at": time.time(),
+                "source": socket.gethostname(),
+                "groups": groups,
+                "tables": tables,
+                "rows": counts,
+                "ddl": {table: existing[table] for table in tables},
+                "indexes": indexes,
+            }
+            conn.execute("CREATE TABLE snapshot.snapshot_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.executemany("INSERT INTO snapshot.snapshot_meta (key, value) VALUES (?, ?)",
+                             [(key, json.dumps(value)) for key, value in meta.items()])
+            conn.execute("COMMIT")
+            conn.execute("DETACH DATABASE snapshot")
+        finally:
+            conn.close()
+
+        partial_path = f"{path}.partial"
+        with open(raw_path, "rb") as source, gzip.open(partial_path, "wb", compresslevel=level) as target:
+            shutil.copyfileobj(source, target, COPY_CHUNK_BYTES)
+        os.replace(partial_path, path)
+        meta["raw_bytes"] = os.path.getsize(raw_path)
+    finally:
+        os.remove(raw_path)
+
+    meta["bytes"] = os.path.getsize(path)
+    meta["seconds"] = round(time.perf_counter() - started, 3)
+    logger.info(f"Snapshot {path} written: {sum(counts.values())} rows from {len(tables)} tables, "
+                f"{meta['bytes']} bytes ({meta['raw_bytes']} uncompressed) in {meta['seconds']}s")
+    return meta
+
+
+def _ensure_table(conn: sqlite3.Connection, table: str, ddl: str):
+    """Create ``table`` from the snapshot's DDL, or add the snapshot's columns the node does not have yet."""
+    existing = _columns(conn, "main", table)
+    if not existing:
+        conn.execute(ddl)
+        return
+    names = {column[1] for column in existing}
+    for _, name, declared_type, not_null, default, _ in _columns(conn, "snapshot", table):
+        if name in names:
+            continue
+        definition = f"{name} {declared_type}"
+        if default is not None:
+            definition += f" NOT NULL DEFAULT {default}" if not_null else f" DEFAULT {default}"
+        conn.execute(f"ALTER TABLE main.{table} ADD COLUMN {definition}")
+
+
+def _import_table(conn: sqlite3.Connection, table: str, verb: str) -> int:
+    if table == "history_items":
+        # Ids are local to a database; rollups are re-keyed through cache_key below.
+        columns = [column[1] for column in _columns(conn, "snapshot", table) if column[1] != "id"]
+        column_list = ", ".join(columns)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns if column != "cache_key")
+        # The raw day range describes the raw entry, so it follows history_cache: replaced only with --overwrite.
+        conflict = f"DO UPDATE SET {updates}" if verb == "INSERT OR REPLACE" and updates else "DO NOTHING"
+        return conn.execute(f"INSERT INTO main.history_items ({column_list}) "
+                            f"SELECT {column_list} FROM snapshot.history_items WHERE true "
+                            f"ON CONFLICT(cache_key) {conflict}").rowcount
+    if table == "history_daily":
+        return conn.execute(f"""
+            {verb} INTO main.history_daily (item_id, day, open, high, low, close, volume, close_hour)
+            SELECT m.id, d.day, d.open, d.high, d.low, d.close, d.volume, d.close_hour
+            FROM snapshot.history_daily d
+            JOIN snapshot.history_items s ON s.id = d.item_id
+            JOIN main.history_items m ON m.cache_key = s.cache_key
+        """).rowcount
+    columns = [column[1] for column in _columns(conn, "snapshot", table)]
+    column_list = ", ".join(columns)
+    return conn.execute(f"{verb} INTO main.{table} ({column_list}) SELECT {column_list} FROM snapshot.{table}").rowcount
+
+
+def import_snapshot(database: str, path: str, overwrite: bool = False) -> Dict[str, Any]:
+    """Bulk-load a snapshot into ``database``; existing rows win unless ``overwrite``."""
+    started = time.perf_counter()
+    init_shared_state(database)
+    directory = os.path.dirname(os.path.abspath(database))
+    fd, raw_path = tempfile.mkstemp(suffix=".db", dir=directory)
+    os.close(fd)
+    try:
+        with gzip.open(path, "rb") as source, open(raw_path, "wb") as target:
+            shutil.copyfileobj(source, target, COPY_CHUNK_BYTES)
+
+        conn = sqlite3.connect(database, timeout=30, isolation_level=None)
+        try:
+            conn.execute("ATTACH DATABASE ? AS snapshot", (raw_path,))
+            meta = _read_meta(conn, "snapshot")
+            verb = "INSERT OR REPLACE" if overwrite else "INSERT OR IGNORE"
+            bus = get_bus(database)
+            imported = {}
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for table in meta["tables"]:
+                    _ensure_table(conn, table, meta["ddl"][table])
+                    imported[table] = _import_table(conn, table, verb)
+                existing_indexes = {name for (name,) in conn.execute(
+                    "SELECT name FROM main.sqlite_master WHERE type = 'index'")}
+                for name, sql in meta["indexes"].items():
+                    if name not in existing_indexes:
+                        conn.execute(sql)
+                # Workers that are already running drop what they hold in memory for these tables.
+                for table in meta["tables"]:
+                    bus.publish(conn, table)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("DETACH DATABASE snapshot")
+        finally:
+            conn.close()
+    finally:
+        os.remove(raw_path)
+
+    seconds = round(time.perf_counter() - started, 3)
+    logger.info(f"Snapshot {path} imported into {database}: {sum(imported.values())} rows "
+                f"from {len(imported)} tables in {seconds}s")
+    return {"meta": meta, "imported": imported, "seconds": seconds}
+
+
+def snapshot_info(path: str) -> Dict[str, Any]:
+    with tempfile.NamedTemporaryFile(suffix=".db") as raw:
+        with gzip.open(path, "rb") as source:
+            shutil.copyfileobj(source, raw, COPY_CHUNK_BYTES)
+        raw.flush()
+        conn = sqlite3.connect(raw.name)
+        try:
+            return _read_meta(conn)
+        finally:
+            conn.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export or import a snapshot of the shared cache tables")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="write a snapshot of the cache tables")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--database", default="favorites.db")
+    export_parser.add_argument("--only", nargs="+", choices=list(SNAPSHOT_TABLES), default=list(SNAPSHOT_TABLES),
+                               help="table groups to include")
+    export_parser.add_argument("--level", type=int, default=6, choices=range(1, 10), help="gzip compression level")
+
+    import_parser = commands.add_parser("import", help="load a snapshot into the database")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--database", default="favorites.db")
+    import_parser.add_argument("--overwrite", action="store_true", help="replace rows the database already has")
+
+    info_parser = commands.add_parser("info", help="show what a snapshot contains")
+    info_parser.add_argument("path")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        if args.command == "export":
+            export_snapshot(args.database, args.path, args.only, args.level)
+        elif args.command == "import":
+            if not os.path.exists(args.path):
+                print(f"Snapshot not found: {args.path}", file=sys.stderr)
+                return 2
+            result = import_snapshot(args.database, args.path, args.overwrite)
+            for table, rows in result["imported"].items():
+                print(f"{table:<22} {rows:>10} rows")
+        else:
+            meta = snapshot_info(args.path)
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(meta["created_at"]))
+            print(f"format {meta['format_version']}, created {created} on {meta['source']}")
+            for table in meta["tables"]:
+                print(f"{table:<22} {meta['rows'][table]:>10} rows")
+    except (sqlite3.Error, OSError, ValueError) as e:
+        print(f"Snapshot {args.command} failed: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,4 @@
-from fastapi import HTTPException, APIRouter, Request
+from fastapi import HTTPException, APIRouter, Query, Request, Response
 from fastapi.responses import RedirectResponse
 import os
 from dotenv import load_dotenv
@@ -9,19 +9,42 @@ from urllib.parse import urlencode, quote
 import logging
 import json
 import re
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import time
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-from datetime import datetime, timedelta
+import math
+from datetime import datetime, timedelta, timezone
 import sqlite3
-import pandas as pd
-import numpy as np
 import joblib
 import random
-
-
-logging.basicConfig(level=logging.DEBUG)
+import asyncio
+import contextvars
+from cachetools import LRUCache, TTLCache
+from fastapi.concurrency import run_in_threadpool
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from auth.cache import (SharedCache, PropertiesMap, init_shared_state, refresh_in_background, run_in_background,
+                        start_periodic_job)
+from auth.upstream import upstream_get, upstream_post
+from auth.ingest import stream_json_array, StreamFormatError
+from auth.price_books import PriceBookStore, init_price_books, parse_price_book_rows, parse_price_text
+from auth.metrics import cache_requests, flush as flush_metrics, init_metrics_store, model_inference_duration
+from auth.logging_setup import configure_logging
+from auth.items import normalize_market_hash_name, build_item_properties, classify_inventory
+from auth.prediction import prepare_prediction_data, predict_price
+from auth.arbitrage import APPID_SOURCES, ArbitrageScanner
+from auth.valuation import price_frame, value_inventory
+from auth.portfolio import PortfolioStore, init_portfolio, update_portfolio
+from auth.analytics import analyze_history, summarize
+from auth.trending import TrendingEngine, init_trending
+from auth.history_store import TieredHistory, init_history_tiers
+from auth.alerts import ALERT_KINDS, AlertEngine
+from auth.similarity import SimilarityIndex
+from auth.downsampling import downsample_history
+from auth.conditional import PRIVATE_REVALIDATE, make_etag, not_modified, tag
+from auth.serialization import decode_value, encode_value, loads, negotiated_media_type, negotiated_response
+import threading
+
+
+configure_logging()
 logger = logging.getLogger(__name__)
 
 load_dotenv()
@@ -66,6 +89,35 @@ def init_db():
         )
     """)
 
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS price_alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            steam_id TEXT NOT NULL,
+            appid TEXT NOT NULL,
+            market_hash_name TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            threshold REAL NOT NULL,
+            percent REAL,
+            base_price REAL,
+            created_at REAL NOT NULL,
+            triggered_at REAL
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS alert_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            alert_id INTEGER NOT NULL,
+            steam_id TEXT NOT NULL,
+            appid TEXT NOT NULL,
+            market_hash_name TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            threshold REAL NOT NULL,
+            price REAL NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS price_cache (
             cache_key TEXT PRIMARY KEY,
@@ -88,9 +140,11 @@ def init_db():
     """)
 
     cursor.execute("""
-        CREATE TABLE IF NOT EXISTS schema_cache (
-            appid TEXT PRIMARY KEY,
-            schema_data TEXT NOT NULL
+        CREATE TABLE IF NOT EXISTS schema_items (
+            appid TEXT NOT NULL,
+            item_index INTEGER NOT NULL,
+            item_data TEXT NOT NULL,
+            PRIMARY KEY (appid, item_index)
         )
     """)
     cursor.execute("""
@@ -101,135 +155,128 @@ def init_db():
         )
     """)
 
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS search_cache (
+            cache_key TEXT PRIMARY KEY,
+            items_data TEXT NOT NULL,
+            updated_at REAL NOT NULL DEFAULT 0
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS inventory_cache (
+            cache_key TEXT PRIMARY KEY,
+            items_data TEXT NOT NULL,
+            updated_at REAL NOT NULL DEFAULT 0
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_cache (
+            cache_key TEXT PRIMARY KEY,
+            analytics_data TEXT NOT NULL,
+            updated_at REAL NOT NULL DEFAULT 0
+        )
+    """)
+
+    cursor.execute("""
+        DELETE FROM price_cache
+        WHERE cache_key IN ('market_csgo_prices', 'market_dota2_prices', 'lis_skins_prices_730', 'lis_skins_prices_570')
+    """)
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_price_alerts_steam_id ON price_alerts(steam_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_alert_events_steam_id ON alert_events(steam_id, id)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_recommendations_steam_id ON recommendations_cache(steam_id)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_price_cache_key ON price_cache(cache_key)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_cache_key ON history_cache(cache_key)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_popular_items_cache_key ON popular_items_cache(cache_key)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_schema_cache_appid ON schema_cache(appid)")
 
     conn.commit()
     conn.close()
 
 
 init_db()
+init_shared_state(DATABASE)
+init_price_books(DATABASE)
+init_portfolio(DATABASE)
+init_trending(DATABASE)
+init_history_tiers(DATABASE)
+init_metrics_store(DATABASE)
+
+price_cache = SharedCache(DATABASE, "price_cache", "cache_key", "price_data")
+# Raw points for the recent window plus daily rollups, read back as one merged history.
+history_cache = TieredHistory(SharedCache(DATABASE, "history_cache", "cache_key", "history_data"))
+popular_items_cache = SharedCache(DATABASE, "popular_items_cache", "cache_key", "items_data")
+item_properties_cache = SharedCache(DATABASE, "item_properties", "cache_key", "properties", max_local_entries=20000)
+
+search_cache = SharedCache(DATABASE, "search_cache", "cache_key", "items_data")
+inventory_cache = SharedCache(DATABASE, "inventory_cache", "cache_key", "items_data")
+analytics_cache = SharedCache(DATABASE, "analytics_cache", "cache_key", "analytics_data")
+price_books = PriceBookStore(DATABASE)
+portfolio_store = PortfolioStore(DATABASE)
+trending_engine = TrendingEngine(DATABASE)
+alert_engine = AlertEngine(DATABASE)
+similarity_index = SimilarityIndex(DATABASE)
+
+PRICE_TTL = 30 * 60
+PRICE_BOOK_TTL = 60 * 60
+HISTORY_TTL = 6 * 60 * 60
+POPULAR_ITEMS_TTL = 60 * 60
+SEARCH_TTL = 10 * 60
+INVENTORY_TTL = 10 * 60
+ALERT_EVENTS_MAX_WAIT = 25
+PORTFOLIO_UPDATE_INTERVAL = 60 * 60
+HISTORY_COMPACTION_INTERVAL = 24 * 60 * 60
+# Must stay well under metrics.GAUGE_STALE_SECONDS so live workers' gauges are counted.
+METRICS_FLUSH_INTERVAL = 15
+RECOMMENDATIONS_TTL = 24 * 60 * 60
+
+HISTORY_CACHE_CONTROL = "private, max-age=300"
+POPULAR_ITEMS_CACHE_CONTROL = "public, max-age=60"
+
+PRICE_SOURCE_DEADLINES = {
+    "steam": 6,
+    "lis_skins": 8,
+    "market_csgo": 8,
+    "market_dota2": 8,
+}
+price_source_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="price-source")
+
+PLAYER_SUMMARY_TTL = 15 * 60
+PLAYER_SUMMARY_BATCH_SIZE = 100
+PLAYER_SUMMARY_BATCH_WINDOW = 0.02
+
+player_summary_cache: TTLCache = TTLCache(maxsize=10000, ttl=PLAYER_SUMMARY_TTL)
 
-price_cache: Dict[str, Dict] = {}
-history_cache: Dict[str, List] = {}
-popular_items_cache: Dict[str, List] = {}
-
-session = requests.Session()
-retries = Retry(total=3, backoff_factor=2, status_forcelist=[429, 500, 502, 503, 504])
-session.mount("https://", HTTPAdapter(max_retries=retries))
-
-
-
-
-def convert_numpy_types(obj: Any) -> Any:
-    if isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        return {key: convert_numpy_types(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_numpy_types(item) for item in obj]
-    return obj
-
-def load_price_cache() -> Dict[str, Dict]:
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT cache_key, price_data FROM price_cache")
-    rows = cursor.fetchall()
-    conn.close()
-
-    cache = {}
-    for row in rows:
-        cache[row[0]] = json.loads(row[1])
-    return cache
-
-
-def save_price_cache(cache: Dict[str, Dict]):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    for key, value in cache.items():
-        cursor.execute("""
-            INSERT OR REPLACE INTO price_cache (cache_key, price_data)
-            VALUES (?, ?)
-        """, (key, json.dumps(value)))
-    conn.commit()
-    conn.close()
-
-
-def load_history_cache() -> Dict[str, List]:
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT cache_key, history_data FROM history_cache")
-    rows = cursor.fetchall()
-    conn.close()
-
-    cache = {}
-    for row in rows:
-        cache[row[0]] = json.loads(row[1])
-    return cache
-
-
-def save_history_cache(cache: Dict[str, List]):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    for key, value in cache.items():
-        cursor.execute("""
-            INSERT OR REPLACE INTO history_cache (cache_key, history_data)
-            VALUES (?, ?)
-        """, (key, json.dumps(value)))
-    conn.commit()
-    conn.close()
 
 
-def load_popular_items_cache() -> Dict[str, List]:
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT cache_key, items_data FROM popular_items_cache")
-    rows = cursor.fetchall()
-    conn.close()
-
-    cache = {}
-    for row in rows:
-        cache[row[0]] = json.loads(row[1])
-    return cache
-
-
-def save_popular_items_cache(cache: Dict[str, List]):
+def load_recommendations_cache(steam_id: str) -> Optional[Dict]:
     conn = sqlite3.connect(DATABASE)
     cursor = conn.cursor()
-    for key, value in cache.items():
-        cursor.execute("""
-            INSERT OR REPLACE INTO popular_items_cache (cache_key, items_data)
-            VALUES (?, ?)
-        """, (key, json.dumps(value)))
-    conn.commit()
+    cursor.execute("SELECT recommendations_data, timestamp FROM recommendations_cache WHERE steam_id = ?", (steam_id,))
+    row = cursor.fetchone()
     conn.close()
 
-
-price_cache = load_price_cache()
-history_cache = load_history_cache()
-popular_items_cache = load_popular_items_cache()
+    if row:
+        data = decode_value(row[0])
+        timestamp = datetime.fromisoformat(row[1])
+        if (datetime.now() - timestamp).total_seconds() < RECOMMENDATIONS_TTL:
+            cache_requests.inc(namespace="recommendations_cache", result="hit")
+            return data
+    cache_requests.inc(namespace="recommendations_cache", result="miss")
+    return None
 
 
-def load_recommendations_cache(steam_id: str) -> Optional[Dict]:
+def recommendations_version(steam_id: str) -> Optional[str]:
+    """Timestamp of the user's cached recommendations while they are still served."""
     conn = sqlite3.connect(DATABASE)
     cursor = conn.cursor()
-    cursor.execute("SELECT recommendations_data, timestamp FROM recommendations_cache WHERE steam_id = ?", (steam_id,))
+    cursor.execute("SELECT timestamp FROM recommendations_cache WHERE steam_id = ?", (steam_id,))
     row = cursor.fetchone()
     conn.close()
 
-    if row:
-        data = json.loads(row[0])
-        timestamp = datetime.fromisoformat(row[1])
-        cache_age_hours = (datetime.now() - timestamp).total_seconds() / 3600
-        if cache_age_hours < 24:
-            return data
+    if row and (datetime.now() - datetime.fromisoformat(row[0])).total_seconds() < RECOMMENDATIONS_TTL:
+        return row[0]
     return None
 
 
@@ -239,166 +286,65 @@ def save_recommendations_cache(steam_id: str, recommendations_data: Dict):
     cursor.execute("""
         INSERT OR REPLACE INTO recommendations_cache (steam_id, recommendations_data, timestamp)
         VALUES (?, ?, ?)
-    """, (steam_id, json.dumps(recommendations_data), datetime.now().isoformat()))
+    """, (steam_id, encode_value(recommendations_data), datetime.now().isoformat()))
     conn.commit()
     conn.close()
 
-def fetch_item_schema(appid: str) -> List[Dict[str, Any]]:
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT schema_data FROM schema_cache WHERE appid = ?", (appid,))
-    row = cursor.fetchone()
-    conn.close()
-
-    if row:
-        logger.info(f"Loading cached schema for appid {appid} from SQLite")
-        return json.loads(row[0])
-
+def ingest_item_schema(appid: str) -> int:
     logger.info(f"Fetching schema for appid {appid} from Steam API")
+    time.sleep(1)
+    url = f"https://api.steampowered.com/IEconItems_{appid}/GetSchema/v2/"
+    properties_map = PropertiesMap(item_properties_cache, appid)
+    count = 0
+    conn = sqlite3.connect(DATABASE)
     try:
-        time.sleep(1)
-        url = f"https://api.steampowered.com/IEconItems_{appid}/GetSchema/v2/?key={STEAM_API_KEY}&language=en"
-        response = session.get(url, timeout=10)
-        response.raise_for_status()
-
-        schema_data = response.json().get("result", {}).get("items", [])
-
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT OR REPLACE INTO schema_cache (appid, schema_data)
-            VALUES (?, ?)
-        """, (appid, json.dumps(schema_data)))
-        conn.commit()
-        conn.close()
+        for batch in stream_json_array(url, "items", params={"key": STEAM_API_KEY, "language": "en"}):
+            conn.executemany("""
+                INSERT OR REPLACE INTO schema_items (appid, item_index, item_data)
+                VALUES (?, ?, ?)
+            """, [(appid, count + index, encode_value(item)) for index, item in enumerate(batch)])
+            conn.commit()
 
-        logger.info(f"Schema for appid {appid} cached successfully in SQLite")
-        return schema_data
-    except requests.exceptions.RequestException as e:
+            batch_properties = {}
+            for item in batch:
+                entry = build_item_properties(item, appid)
+                if entry:
+                    batch_properties[entry[0]] = entry[1]
+            properties_map.replace(batch_properties)
+            count += len(batch)
+        logger.info(f"Schema for appid {appid} stored in SQLite: {count} items")
+    except (requests.exceptions.RequestException, StreamFormatError) as e:
         logger.error(f"Failed to fetch schema for appid {appid}: {str(e)}")
-        return []
-
-
-def normalize_market_hash_name(name: str) -> str:
-    return re.sub(r'\s+', ' ', name.strip().lower())
-
+    finally:
+        conn.close()
+    return count
 
-def build_properties_map(schema_data: List[Dict[str, Any]], appid: str) -> Dict[str, Dict[str, Any]]:
-    properties_map = {}
 
-    for item in schema_data:
-        market_hash_name = item.get("market_hash_name", item.get("name", ""))
-        if not market_hash_name:
-            continue
-
-        normalized_key = normalize_market_hash_name(market_hash_name)
-        properties = {}
-
-        if appid == "730":
-            item_type = item.get("item_type", "")
-            if "weapon_" in item.get("defindex", ""):
-                if "knife" in item_type.lower():
-                    item_type = "Knife"
-                elif "pistol" in item_type.lower():
-                    item_type = "Pistol"
-                elif "rifle" in item_type.lower():
-                    item_type = "Rifle"
-                elif "smg" in item_type.lower():
-                    item_type = "SMG"
-                elif "sniper" in item_type.lower():
-                    item_type = "Sniper Rifle"
-                elif "shotgun" in item_type.lower():
-                    item_type = "Shotgun"
-                elif "machinegun" in item_type.lower():
-                    item_type = "Machine Gun"
-            elif "gloves" in item_type.lower():
-                item_type = "Gloves"
-            properties["type"] = item_type
-
-            rarity = item.get("rarity", "")
-            if rarity:
-                if "common" in rarity.lower():
-                    rarity = "Consumer Grade"
-                elif "uncommon" in rarity.lower():
-                    rarity = "Industrial Grade"
-                elif "rare" in rarity.lower():
-                    rarity = "Mil-Spec"
-                elif "mythical" in rarity.lower():
-                    rarity = "Restricted"
-                elif "legendary" in rarity.lower():
-                    rarity = "Classified"
-                elif "ancient" in rarity.lower():
-                    rarity = "Covert"
-            properties["rarity"] = rarity
-
-            wear = []
-            if "wear" in item:
-                wear = item["wear"]
-            elif "Factory New" in market_hash_name:
-                wear = ["Factory New"]
-            elif "Minimal Wear" in market_hash_name:
-                wear = ["Minimal Wear"]
-            elif "Field-Tested" in market_hash_name:
-                wear = ["Field-Tested"]
-            elif "Well-Worn" in market_hash_name:
-                wear = ["Well-Worn"]
-            elif "Battle-Scarred" in market_hash_name:
-                wear = ["Battle-Scarred"]
-            properties["wear"] = wear
-
-            attributes = []
-            if "StatTrak" in market_hash_name or any(
-                    attr.get("name", "").lower() == "stattrak" for attr in item.get("attributes", [])):
-                attributes.append("stattrak_available")
-            properties["attributes"] = attributes
-
-        elif appid == "570":
-            properties["rarity"] = ""
-
-            slot = item.get("slot", "")
-            properties["slot"] = slot if slot else ""
-
-            quality = item.get("quality", "")
-            if quality:
-                if "normal" in quality.lower():
-                    quality = "Normal"
-                elif "inscribed" in quality.lower():
-                    quality = "Inscribed"
-                elif "autographed" in quality.lower():
-                    quality = "Autographed"
-                elif "genuine" in quality.lower():
-                    quality = "Genuine"
-            properties["quality"] = quality
-
-            hero = item.get("hero", "")
-            for attr in item.get("attributes", []):
-                if "hero" in attr.get("name", "").lower():
-                    hero = attr.get("value", "")
-                    break
-            properties["hero"] = hero if hero else ""
-
-        properties_map[normalized_key] = properties
-
-    logger.info(f"Properties map for appid {appid} built with {len(properties_map)} items")
+def load_properties_map(appid: str) -> PropertiesMap:
+    properties_map = PropertiesMap(item_properties_cache, appid)
+    if not len(properties_map):
+        cache_requests.inc(namespace="schema_cache", result="miss")
+        schema_items = ingest_item_schema(appid)
+        logger.info(f"Properties map for appid {appid} built with {len(properties_map)} items "
+                    f"from {schema_items} schema items")
+    else:
+        cache_requests.inc(namespace="schema_cache", result="hit")
+        logger.info(f"Using shared properties map for appid {appid} with {len(properties_map)} items")
     return properties_map
 
 
-cs2_properties_map = {}
-dota2_properties_map = {}
+cs2_properties_map = PropertiesMap(item_properties_cache, "730")
+dota2_properties_map = PropertiesMap(item_properties_cache, "570")
 
 try:
-    cs2_schema = fetch_item_schema("730")
-    cs2_properties_map = build_properties_map(cs2_schema, "730")
+    cs2_properties_map = load_properties_map("730")
 except Exception as e:
     logger.error(f"Failed to load schema for appid 730: {str(e)}. Proceeding without schema.")
-    cs2_properties_map = {}
 
 try:
-    dota2_schema = fetch_item_schema("570")
-    dota2_properties_map = build_properties_map(dota2_schema, "570")
+    dota2_properties_map = load_properties_map("570")
 except Exception as e:
     logger.error(f"Failed to load schema for appid 570: {str(e)}. Proceeding without schema.")
-    dota2_properties_map = {}
 
 
 @router.get("/steam/login")
@@ -418,7 +364,7 @@ async def steam_login():
 @router.get("/steam/callback")
 async def steam_callback(request: Request):
     params = dict(request.query_params)
-    logger.debug(f"All query params: {params}")
+    logger.debug(f"Steam callback with openid.mode={params.get('openid.mode')}")
 
     openid_mode = params.get("openid.mode")
     openid_ns = params.get("openid.ns")
@@ -447,7 +393,7 @@ async def steam_callback(request: Request):
         "openid.signed": openid_signed,
         "openid.sig": openid_sig,
     }
-    response = session.post("https://steamcommunity.com/openid/login", data=validation_params, timeout=10)
+    response = upstream_post("https://steamcommunity.com/openid/login", data=validation_params, timeout=10)
     if "is_valid:true" not in response.text:
         logger.error("Invalid Steam authentication")
         raise HTTPException(status_code=401, detail="Invalid Steam authentication")
@@ -466,6 +412,72 @@ async def steam_callback(request: Request):
     return RedirectResponse(f"http://localhost:5173/callback?token={token}")
 
 
+def fetch_player_summaries(steam_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    response = upstream_get(
+        "https://api.steampowered.com/ISteamUser/GetPlayerSummaries/v0002/",
+        params={"key": STEAM_API_KEY, "steamids": ",".join(steam_ids)},
+        timeout=10)
+    response.raise_for_status()
+    players = response.json().get("response", {}).get("players", [])
+    return {player["steamid"]: player for player in players if "steamid" in player}
+
+
+class PlayerSummaryBatcher:
+    def __init__(self, batch_size: int = PLAYER_SUMMARY_BATCH_SIZE, window: float = PLAYER_SUMMARY_BATCH_WINDOW):
+        self.batch_size = batch_size
+        self.window = window
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    async def get(self, steam_id: str) -> Dict[str, Any]:
+        cached = player_summary_cache.get(steam_id)
+        if cached is not None:
+            return cached
+
+        future = self._pending.get(steam_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[steam_id] = future
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.window, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch_ids = list(self._pending)[:self.batch_size]
+        batch = {steam_id: self._pending.pop(steam_id) for steam_id in batch_ids}
+        if batch:
+            asyncio.get_running_loop().create_task(self._resolve(batch))
+        if self._pending:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+    async def _resolve(self, batch: Dict[str, asyncio.Future]):
+        try:
+            players = await run_in_threadpool(fetch_player_summaries, list(batch))
+        except Exception as e:
+            logger.error(f"Failed to fetch player summaries for {len(batch)} users: {e}")
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        logger.debug(f"Fetched player summaries for {len(batch)} users in one request")
+        for steam_id, future in batch.items():
+            player = players.get(steam_id, {})
+            player_summary_cache[steam_id] = player
+            if not future.done():
+                future.set_result(player)
+
+
+player_summary_batcher = PlayerSummaryBatcher()
+
+
 @router.get("/verify")
 async def verify_token(token: str):
     try:
@@ -474,10 +486,7 @@ async def verify_token(token: str):
         if not steam_id:
             raise HTTPException(status_code=401, detail="Invalid token payload")
 
-        response = session.get(
-            f"https://api.steampowered.com/ISteamUser/GetPlayerSummaries/v0002/?key={STEAM_API_KEY}&steamids={steam_id}",
-            timeout=10)
-        player = response.json()['response']['players'][0] if response.json()['response']['players'] else {}
+        player = await player_summary_batcher.get(steam_id)
 
         return {
             "steam_id": steam_id,
@@ -491,8 +500,29 @@ async def verify_token(token: str):
         raise HTTPException(status_code=500, detail="Failed to fetch user info")
 
 
+def fetch_inventory(steam_id: str, appid: str) -> Optional[List[Dict[str, Any]]]:
+    """Classified inventory, also kept as the user's latest snapshot; None when Steam did not answer."""
+    url = f"https://steamcommunity.com/inventory/{steam_id}/{appid}/2"
+    response = upstream_get(url, params={"l": "english"}, timeout=10)
+    if response.status_code != 200:
+        logger.warning(f"Failed to fetch inventory for appid {appid}: HTTP {response.status_code}")
+        return None
+
+    items = []
+    data = response.json()
+    if 'assets' not in data or 'descriptions' not in data:
+        logger.info(f"No inventory items found for appid {appid}")
+    else:
+        properties_map = cs2_properties_map if appid == "730" else dota2_properties_map
+        items = classify_inventory(data, appid, properties_map)
+
+    inventory_cache[f"{steam_id}:{appid}"] = items
+    run_in_background(("portfolio", steam_id, appid), lambda: update_portfolio_snapshot(steam_id, appid))
+    return items
+
+
 @router.get("/inventory")
-async def get_inventory(token: str, appid: str):
+async def get_inventory(token: str, appid: str, request: Request, response: Response):
     try:
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
         steam_id = payload.get("steam_id")
@@ -503,187 +533,20 @@ async def get_inventory(token: str, appid: str):
         if appid not in valid_appids:
             raise HTTPException(status_code=400, detail="Invalid appid. Use 730 for CS2 or 570 for Dota 2")
 
-        games = [{"appid": appid, "contextid": "2"}]
-        items = []
-
-        for game in games:
-            url = f"https://steamcommunity.com/inventory/{steam_id}/{game['appid']}/{game['contextid']}"
-            response = session.get(url, params={"l": "english"}, timeout=10)
-            if response.status_code != 200:
-                logger.warning(f"Failed to fetch inventory for appid {game['appid']}: HTTP {response.status_code}")
-                continue
-
-            data = response.json()
-            if 'assets' not in data or 'descriptions' not in data:
-                logger.info(f"No inventory items found for appid {game['appid']}")
-                continue
-
-            properties_map = cs2_properties_map if appid == "730" else dota2_properties_map
-
-            for asset in data['assets']:
-                for desc in data['descriptions']:
-                    if desc['classid'] == asset['classid']:
-                        market_hash_name = desc.get('market_hash_name', desc.get('name', ''))
-                        if "Graffiti" in desc.get('name', '') and "Sealed" not in market_hash_name:
-                            market_hash_name = f"Sealed {market_hash_name}"
-
-                        normalized_key = normalize_market_hash_name(market_hash_name)
-                        properties = properties_map.get(normalized_key, {
-                            "type": "",
-                            "rarity": "",
-                            "wear": [],
-                            "attributes": [],
-                            "slot": "",
-                            "quality": "",
-                            "hero": ""
-                        })
-
-                        if appid == "730":
-                            if not properties["wear"]:
-                                if "Factory New" in market_hash_name:
-                                    properties["wear"] = ["Factory New"]
-                                elif "Minimal Wear" in market_hash_name:
-                                    properties["wear"] = ["Minimal Wear"]
-                                elif "Field-Tested" in market_hash_name:
-                                    properties["wear"] = ["Field-Tested"]
-                                elif "Well-Worn" in market_hash_name:
-                                    properties["wear"] = ["Well-Worn"]
-                                elif "Battle-Scarred" in market_hash_name:
-                                    properties["wear"] = ["Battle-Scarred"]
-                            if "StatTrak" in market_hash_name:
-                                properties["attributes"] = ["stattrak_available"]
-                            if not properties["type"]:
-                                name_lower = market_hash_name.lower()
-                                if any(w in name_lower for w in [
-                                    "glock", "usp-s", "usp", "p2000", "p250", "cz75", "cz75-auto", "cz75a", "deagle",
-                                    "desert eagle",
-                                    "tec-9", "tec9", "five-seven", "fiveseven", "dual berettas", "dual beretta",
-                                    "berettas", "r8 revolver", "revolver"
-                                ]):
-                                    properties["type"] = "Pistol"
-                                elif any(w in name_lower for w in [
-                                    "ak-47", "ak47", "m4a1-s", "m4a1", "m4a4", "aug", "famas", "galil ar", "galilar",
-                                    "sg 553", "sg553"
-                                ]):
-                                    properties["type"] = "Rifle"
-                                elif any(w in name_lower for w in [
-                                    "ssg 08", "ssg08", "g3sg1", "scar-20", "awp"
-                                ]):
-                                    properties["type"] = "Sniper Rifle"
-                                elif any(w in name_lower for w in [
-                                    "mp7", "mp9", "mp5-sd", "mp5", "mac-10", "mac10", "ump-45", "ump45", "p90",
-                                    "pp-bizon", "bizon"
-                                ]):
-                                    properties["type"] = "SMG"
-                                elif any(w in name_lower for w in [
-                                    "nova", "xm1014", "mag-7", "mag7", "sawed-off", "sawedoff"
-                                ]):
-                                    properties["type"] = "Shotgun"
-                                elif any(w in name_lower for w in [
-                                    "negev", "m249"
-                                ]):
-                                    properties["type"] = "Machine Gun"
-                                elif any(w in name_lower for w in [
-                                    "knife", "karambit", "bayonet", "bowie", "butterfly", "classic knife", "falchion",
-                                    "flip knife", "gut knife",
-                                    "huntsman", "kukri", "m9 bayonet", "navaja", "nomad", "paracord", "shadow daggers",
-                                    "skeleton", "stiletto",
-                                    "survival", "talon", "ursus", "canis", "widowmaker", "gypsy", "outdoor", "push"
-                                ]) or "★" in market_hash_name:
-                                    properties["type"] = "Knife"
-                                elif "zeus" in name_lower:
-                                    properties["type"] = "Zeus"
-                                elif "gloves" in name_lower:
-                                    properties["type"] = "Gloves"
-
-                            if not properties["rarity"]:
-                                for tag in desc.get("tags", []):
-                                    if tag.get("category") == "Rarity":
-                                        rarity_value = tag.get("internal_name", "").lower()
-                                        rarity_mapping = {
-                                            "rarity_common_weapon": "Consumer Grade",
-                                            "rarity_uncommon_weapon": "Industrial Grade",
-                                            "rarity_rare_weapon": "Mil-Spec",
-                                            "rarity_mythical_weapon": "Restricted",
-                                            "rarity_legendary_weapon": "Classified",
-                                            "rarity_ancient_weapon": "Covert",
-                                            "rarity_contraband": "Contraband"
-                                        }
-                                        mapped_rarity = rarity_mapping.get(rarity_value, "")
-                                        if mapped_rarity:
-                                            properties["rarity"] = mapped_rarity
-                                            break
-                                        rarity_value = tag.get("localized_tag_name", "").lower()
-                                        rarity_mapping_localized = {
-                                            "consumer grade": "Consumer Grade",
-                                            "industrial grade": "Industrial Grade",
-                                            "mil-spec": "Mil-Spec",
-                                            "restricted": "Restricted",
-                                            "classified": "Classified",
-                                            "covert": "Covert",
-                                            "contraband": "Contraband"
-                                        }
-                                        mapped_rarity = rarity_mapping_localized.get(rarity_value, rarity_value.title())
-                                        properties["rarity"] = mapped_rarity
-                                        break
-
-                        if appid == "570":
-                            for tag in desc.get("tags", []):
-                                category = tag.get("category")
-                                if category == "Rarity" and not properties["rarity"]:
-                                    rarity_value = tag.get("internal_name", "").lower()
-                                    rarity_mapping = {
-                                        "rarity_common": "Common",
-                                        "rarity_uncommon": "Uncommon",
-                                        "rarity_rare": "Rare",
-                                        "rarity_mythical": "Mythical",
-                                        "rarity_legendary": "Legendary",
-                                        "rarity_immortal": "Immortal",
-                                        "rarity_arcana": "Arcana",
-                                        "rarity_ancient": "Ancient",
-                                        "common": "Common",
-                                        "uncommon": "Uncommon",
-                                        "rare": "Rare",
-                                        "mythical": "Mythical",
-                                        "legendary": "Legendary",
-                                        "immortal": "Immortal",
-                                        "arcana": "Arcana",
-                                        "ancient": "Ancient"
-                                    }
-                                    mapped_rarity = rarity_mapping.get(rarity_value,
-                                                                       tag.get("localized_tag_name", "").title())
-                                    properties["rarity"] = mapped_rarity.title()
-                            if not properties["hero"]:
-                                for desc_item in desc.get("descriptions", []):
-                                    if "Used By:" in desc_item.get("value", ""):
-                                        hero = desc_item["value"].replace("Used By: ", "").strip()
-                                        properties["hero"] = hero
-                                        break
-                            if not properties["slot"]:
-                                name_lower = market_hash_name.lower()
-                                if "head" in name_lower:
-                                    properties["slot"] = "Head"
-                                elif "arms" in name_lower:
-                                    properties["slot"] = "Arms"
-                                elif "legs" in name_lower:
-                                    properties["slot"] = "Legs"
-                                elif "weapon" in name_lower:
-                                    properties["slot"] = "Weapon"
-                                elif "shoulders" in name_lower:
-                                    properties["slot"] = "Shoulders"
-                            logger.info(
-                                f"Dota 2 item: {market_hash_name}, Rarity: {properties['rarity']}, Hero: {properties['hero']}")
-
-                        items.append({
-                            "name": desc.get('name', 'Unknown Item'),
-                            "appid": game['appid'],
-                            "icon_url": f"https://steamcommunity-a.akamaihd.net/economy/image/{desc.get('icon_url', '')}",
-                            "price": None,
-                            "classid": desc['classid'],
-                            "market_hash_name": market_hash_name,
-                            "properties": properties
-                        })
-                        break
+        # A client revalidating a snapshot that is still fresh is answered without calling Steam.
+        cache_key = f"{steam_id}:{appid}"
+        snapshot = inventory_cache.get_entry(cache_key)
+        if snapshot is not None and not snapshot.is_stale(INVENTORY_TTL):
+            unchanged = not_modified(request, response, make_etag("inventory", cache_key, snapshot.updated_at),
+                                     PRIVATE_REVALIDATE)
+            if unchanged is not None:
+                return unchanged
+
+        items = await run_in_threadpool(fetch_inventory, steam_id, appid)
+        snapshot = inventory_cache.get_entry(cache_key) if items is not None else None
+        if snapshot is not None:
+            tag(response, make_etag("inventory", cache_key, snapshot.updated_at), PRIVATE_REVALIDATE)
+        items = items or []
 
         if not items:
             logger.info(f"No inventory items found for SteamID: {steam_id} and appid: {appid}")
@@ -697,96 +560,203 @@ async def get_inventory(token: str, appid: str):
         raise HTTPException(status_code=500, detail=f"Failed to fetch inventory: {str(e)}")
 
 
-def fetch_market_csgo_prices():
+def load_inventory_snapshot(steam_id: str, appid: str, refresh: bool = False) -> List[Dict[str, Any]]:
+    entry = inventory_cache.get_entry(f"{steam_id}:{appid}")
+    if entry is not None and not refresh and not entry.is_stale(INVENTORY_TTL):
+        return entry.value
+
     try:
-        response = session.get("https://market.csgo.com/api/v2/prices/USD.json", timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        if not data.get("success"):
-            raise HTTPException(status_code=500, detail="Ошибка получения цен с Market.CSGO")
-        return {item["market_hash_name"]: item["price"] for item in data["items"]}
-    except requests.RequestException as e:
-        logger.error(f"Ошибка запроса к Market.CSGO: {e}")
-        return {}
+        items = fetch_inventory(steam_id, appid)
+    except requests.exceptions.RequestException as e:
+        if entry is None:
+            raise
+        logger.warning(f"Serving stale inventory snapshot for {steam_id}:{appid}: {e}")
+        return entry.value
+    if items is None:
+        if entry is None:
+            raise HTTPException(status_code=502, detail="Failed to fetch inventory from Steam")
+        return entry.value
+    return items
+
+
+def compute_inventory_value(steam_id: str, appid: str, top: int, refresh: bool) -> Dict[str, Any]:
+    items = load_inventory_snapshot(steam_id, appid, refresh)
+    names = list({item["market_hash_name"] for item in items})
+    book_prices = {}
+    for source in APPID_SOURCES[appid]:
+        ensure_price_book(source)
+        book_prices[source] = price_books.get_prices(source, names)
+    steam_prices = price_books.get_steam_prices(appid, names)
+
+    result = value_inventory(items, book_prices, steam_prices, top)
+    result["appid"] = appid
+    return result
+
+
+PRICE_BOOK_SOURCES = {
+    "market_csgo": {
+        "url": "https://market.csgo.com/api/v2/prices/USD.json",
+        "array_key": "items",
+        "name_field": "market_hash_name",
+    },
+    "market_dota2": {
+        "url": "https://market.dota2.net/api/v2/prices/USD.json",
+        "array_key": "items",
+        "name_field": "market_hash_name",
+    },
+    "lis_skins_730": {
+        "url": "https://lis-skins.com/market_export_json/csgo.json",
+        "array_key": None,
+        "name_field": "name",
+    },
+    "lis_skins_570": {
+        "url": "https://lis-skins.com/market_export_json/dota2.json",
+        "array_key": None,
+        "name_field": "name",
+    },
+}
+price_book_locks = {source: threading.Lock() for source in PRICE_BOOK_SOURCES}
+arbitrage_scanner = ArbitrageScanner(price_books)
+
+
+def refresh_price_book(source: str) -> int:
+    config = PRICE_BOOK_SOURCES[source]
+    try:
+        batches = stream_json_array(config["url"], config["array_key"])
+        return price_books.ingest(
+            source, (parse_price_book_rows(batch, config["name_field"]) for batch in batches))
+    except (requests.RequestException, StreamFormatError) as e:
+        logger.error(f"Ошибка загрузки цен {source}: {e}")
+        return 0
 
 
-def get_market_csgo_price(market_hash_name: str):
-    cache_key = "market_csgo_prices"
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT price_data FROM price_cache WHERE cache_key = ?", (cache_key,))
-    row = cursor.fetchone()
-    conn.close()
+class PriceBookMissingError(Exception):
+    pass
 
-    if row:
-        prices = json.loads(row[0])
-    else:
-        prices = fetch_market_csgo_prices()
-        price_cache[cache_key] = prices
-        save_price_cache({cache_key: prices})
 
-    return prices.get(market_hash_name, "N/A")
+def load_price_book(source: str):
+    with price_book_locks[source]:
+        info = price_books.info(source)
+        if info is None or info.is_stale(PRICE_BOOK_TTL):
+            refresh_price_book(source)
 
 
-def fetch_market_dota2_prices():
-    try:
-        response = session.get("https://market.dota2.net/api/v2/prices/USD.json", timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        if not data.get("success"):
-            raise HTTPException(status_code=500, detail="Ошибка получения цен с Market.Dota2")
-        return {item["market_hash_name"]: item["price"] for item in data["items"]}
-    except requests.RequestException as e:
-        logger.error(f"Ошибка запроса к Market.Dota2: {e}")
-        return {}
+def ensure_price_book(source: str, wait: bool = True) -> bool:
+    """Whether ``source`` has a price book; a missing one is downloaded in place only when ``wait``."""
+    info = price_books.info(source)
+    if info is None and wait:
+        load_price_book(source)
+        return True
+    if info is None or info.is_stale(PRICE_BOOK_TTL):
+        run_in_background(("price_book", source), lambda: load_price_book(source))
+    return info is not None
 
 
-def get_market_dota2_price(market_hash_name: str):
-    cache_key = "market_dota2_prices"
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT price_data FROM price_cache WHERE cache_key = ?", (cache_key,))
-    row = cursor.fetchone()
-    conn.close()
+def get_book_price(source: str, market_hash_name: str):
+    # Per-item lookups never wait for a bulk download, which would hold a price source thread.
+    if not ensure_price_book(source, wait=False):
+        raise PriceBookMissingError(f"Price book {source} is still loading")
+    price = price_books.get_price(source, market_hash_name)
+    return "N/A" if price is None else price
 
-    if row:
-        prices = json.loads(row[0])
-    else:
-        prices = fetch_market_dota2_prices()
-        price_cache[cache_key] = prices
-        save_price_cache({cache_key: prices})
 
-    return prices.get(market_hash_name, "N/A")
+def fetch_market_csgo_prices() -> int:
+    return refresh_price_book("market_csgo")
 
 
-def fetch_lis_skins_prices(appid: str):
-    try:
-        url = "https://lis-skins.com/market_export_json/csgo.json" if appid == "730" else "https://lis-skins.com/market_export_json/dota2.json"
-        response = session.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        return {item["name"]: item["price"] for item in data}
-    except requests.RequestException as e:
-        logger.error(f"Ошибка запроса к Lis-Skins для appid {appid}: {e}")
-        return {}
+def get_market_csgo_price(market_hash_name: str):
+    return get_book_price("market_csgo", market_hash_name)
+
+
+def fetch_market_dota2_prices() -> int:
+    return refresh_price_book("market_dota2")
+
+
+def get_market_dota2_price(market_hash_name: str):
+    return get_book_price("market_dota2", market_hash_name)
+
+
+def fetch_lis_skins_prices(appid: str) -> int:
+    return refresh_price_book(f"lis_skins_{appid}")
 
 
 def get_lis_skins_price(market_hash_name: str, appid: str):
-    cache_key = f"lis_skins_prices_{appid}"
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT price_data FROM price_cache WHERE cache_key = ?", (cache_key,))
-    row = cursor.fetchone()
-    conn.close()
+    return get_book_price(f"lis_skins_{appid}", market_hash_name)
 
-    if row:
-        prices = json.loads(row[0])
+
+def fetch_steam_price(market_hash_name: str, appid: str) -> str:
+    price_url = f"https://steamcommunity.com/market/priceoverview/?appid={appid}&currency=1&market_hash_name={quote(market_hash_name)}"
+    price_response = upstream_get(price_url, timeout=10)
+    logger.debug("Price response for %s: %s", market_hash_name, price_response.status_code)
+
+    price_data = price_response.json() if price_response.status_code == 200 else {}
+    return price_data.get('lowest_price', 'N/A')
+
+
+def fetch_price(market_hash_name: str, appid: str) -> Dict[str, Any]:
+    logger.debug(f"Fetching price for {market_hash_name} (appid: {appid})")
+    sources = {
+        "steam": lambda: fetch_steam_price(market_hash_name, appid),
+        "lis_skins": lambda: get_lis_skins_price(market_hash_name, appid),
+    }
+    if appid == "730":
+        sources["market_csgo"] = lambda: get_market_csgo_price(market_hash_name)
     else:
-        prices = fetch_lis_skins_prices(appid)
-        price_cache[cache_key] = prices
-        save_price_cache({cache_key: prices})
+        sources["market_dota2"] = lambda: get_market_dota2_price(market_hash_name)
+
+    started = time.monotonic()
+    # Source threads inherit the caller's upstream priority (interactive request or background refresh).
+    futures = {source: price_source_executor.submit(contextvars.copy_context().run, fetch)
+               for source, fetch in sources.items()}
+    values = {}
+    missing_sources = []
+    for source, future in futures.items():
+        remaining = started + PRICE_SOURCE_DEADLINES[source] - time.monotonic()
+        try:
+            values[source] = future.result(timeout=max(remaining, 0))
+        except FutureTimeoutError:
+            logger.warning(f"Price source {source} missed its deadline for {market_hash_name}")
+            missing_sources.append(source)
+        except PriceBookMissingError as e:
+            logger.info(f"Price source {source} skipped for {market_hash_name}: {e}")
+            missing_sources.append(source)
+        except Exception as e:
+            logger.warning(f"Price source {source} failed for {market_hash_name}: {e}")
+            missing_sources.append(source)
+
+    if len(missing_sources) == len(futures):
+        raise requests.exceptions.RequestException(f"No price source answered for {market_hash_name}")
+
+    lis_skins_price = values.get("lis_skins", "N/A")
+    result = {"steam_price": values.get("steam", "N/A")}
+    if appid == "730":
+        result["market_csgo_price"] = values.get("market_csgo", "N/A")
+    else:
+        result["market_dota2_price"] = values.get("market_dota2", "N/A")
+    result["lis_skins_price"] = f"${lis_skins_price}" if lis_skins_price != "N/A" else "N/A"
+    if missing_sources:
+        result["missing_sources"] = missing_sources
+
+    logger.info(f"Price fetched: {result}")
+    return result
+
 
-    return prices.get(market_hash_name, "N/A")
+def record_steam_prices(appid: str, prices: List[Tuple[str, float]]):
+    price_books.set_steam_prices(appid, prices)
+    alert_engine.evaluate(appid, prices)
+
+
+def store_price(cache_key: str, result: Dict[str, Any]):
+    appid, market_hash_name = cache_key.split(":", 1)
+    steam_price = parse_price_text(result.get("steam_price"))
+    if steam_price is not None:
+        record_steam_prices(appid, [(market_hash_name, steam_price)])
+
+    # Partial results are kept but marked stale so the next read revalidates them.
+    if result.get("missing_sources"):
+        price_cache.set(cache_key, result, updated_at=0)
+    else:
+        price_cache.set(cache_key, result)
 
 
 @router.get("/price")
@@ -797,74 +767,258 @@ async def get_price(token: str, market_hash_name: str, appid: str, force_refresh
             raise HTTPException(status_code=401, detail="Invalid token payload")
 
         cache_key = f"{appid}:{market_hash_name}"
-        if not force_refresh:
-            conn = sqlite3.connect(DATABASE)
-            cursor = conn.cursor()
-            cursor.execute("SELECT price_data FROM price_cache WHERE cache_key = ?", (cache_key,))
-            row = cursor.fetchone()
-            conn.close()
-            if row:
-                logger.debug(f"Returning cached price for {cache_key}")
-                return json.loads(row[0])
+        entry = price_cache.get_entry(cache_key)
+        if entry is not None and not force_refresh:
+            if entry.is_stale(PRICE_TTL):
+                refresh_in_background(price_cache, cache_key,
+                                      lambda: store_price(cache_key, fetch_price(market_hash_name, appid)))
+            logger.debug(f"Returning cached price for {cache_key}")
+            return entry.value
+
+        try:
+            result = await run_in_threadpool(fetch_price, market_hash_name, appid)
+        except requests.exceptions.RequestException as e:
+            if entry is None:
+                raise
+            logger.warning(f"Serving stale price for {cache_key}: {e}")
+            return entry.value
+
+        store_price(cache_key, result)
+        return result
+    except jwt.JWTError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    except Exception as e:
+        logger.error(f"Failed to fetch price: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch price: {str(e)}")
 
-        logger.debug(f"Fetching price for {market_hash_name} (appid: {appid})")
-        price_url = f"https://steamcommunity.com/market/priceoverview/?appid={appid}&currency=1&market_hash_name={quote(market_hash_name)}"
-        price_response = session.get(price_url, timeout=10)
-        logger.debug(f"Price URL: {price_url}")
-        logger.debug(f"Price response: {price_response.status_code} - {price_response.text}")
 
-        price_data = price_response.json() if price_response.status_code == 200 else {}
-        steam_price = price_data.get('lowest_price', 'N/A')
+def scan_arbitrage(appid: str, min_price: float, min_volume: int, min_spread: float, limit: int) -> Dict[str, Any]:
+    for source in APPID_SOURCES[appid]:
+        ensure_price_book(source)
+    total, matches = arbitrage_scanner.scan(appid, min_price, min_volume, min_spread, limit=limit)
+    items = [{
+        "market_hash_name": row.market_hash_name,
+        "buy_source": row.buy_source,
+        "sell_source": row.sell_source,
+        "buy_price": round(row.buy_price, 3),
+        "sell_price": round(row.sell_price, 3),
+        "profit": round(row.profit, 3),
+        "spread": round(row.spread, 4),
+        "buy_volume": int(row.buy_volume),
+        "sell_volume": int(row.sell_volume),
+    } for row in matches.itertuples(index=False)]
+    return {"appid": appid, "total": total, "items": items}
+
+
+@router.get("/arbitrage")
+async def get_arbitrage(token: str, appid: str, min_price: float = 0.0, min_volume: int = 1,
+                        min_spread: float = 0.0, limit: int = 50):
+    try:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
+        if not payload.get("steam_id"):
+            raise HTTPException(status_code=401, detail="Invalid token payload")
 
-        lis_skins_price = get_lis_skins_price(market_hash_name, appid)
+        valid_appids = ["730", "570"]
+        if appid not in valid_appids:
+            raise HTTPException(status_code=400, detail="Invalid appid. Use 730 for CS2 or 570 for Dota 2")
 
-        if appid == "730":
-            market_csgo_price = get_market_csgo_price(market_hash_name)
-            result = {
-                "steam_price": steam_price,
-                "market_csgo_price": market_csgo_price,
-                "lis_skins_price": f"${lis_skins_price}" if lis_skins_price != "N/A" else "N/A"
-            }
-        else:
-            market_dota2_price = get_market_dota2_price(market_hash_name)
-            result = {
-                "steam_price": steam_price,
-                "market_dota2_price": market_dota2_price,
-                "lis_skins_price": f"${lis_skins_price}" if lis_skins_price != "N/A" else "N/A"
-            }
+        if limit <= 0 or limit > 500:
+            raise HTTPException(status_code=400, detail="Limit must be between 1 and 500")
 
-        price_cache[cache_key] = result
-        save_price_cache({cache_key: result})
-        logger.info(f"Price fetched: {result}")
-        return result
+        return await run_in_threadpool(scan_arbitrage, appid, min_price, min_volume, min_spread, limit)
     except jwt.JWTError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     except Exception as e:
-        logger.error(f"Failed to fetch price: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to fetch price: {str(e)}")
+        logger.error(f"Failed to scan arbitrage: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to scan arbitrage: {str(e)}")
+
+
+def update_portfolio_snapshot(steam_id: str, appid: str) -> int:
+    items = inventory_cache.get(f"{steam_id}:{appid}")
+    if items is None:
+        return 0
+    names = list({item["market_hash_name"] for item in items})
+    histories = history_cache.get_many([f"{appid}:{name}" for name in names])
+    histories = {key.split(":", 1)[1]: history for key, history in histories.items()}
+
+    book_prices = {source: price_books.get_prices(source, names) for source in APPID_SOURCES[appid]}
+    current_prices = price_frame(names, book_prices, price_books.get_steam_prices(appid, names))["reference"]
+    return update_portfolio(portfolio_store, steam_id, appid, items, histories, current_prices.dropna().to_dict())
+
+
+def update_all_portfolios():
+    keys = inventory_cache.keys()
+    for key in keys:
+        steam_id, appid = key.split(":", 1)
+        try:
+            update_portfolio_snapshot(steam_id, appid)
+        except Exception as e:
+            logger.error(f"Failed to update portfolio {key}: {e}")
+    logger.info(f"Portfolio snapshots updated for {len(keys)} inventories")
+
+
+start_periodic_job("portfolio-updater", PORTFOLIO_UPDATE_INTERVAL, update_all_portfolios)
+start_periodic_job("metrics-flush", METRICS_FLUSH_INTERVAL, flush_metrics)
+
+
+@router.get("/portfolio/history")
+async def get_portfolio_history(token: str, appid: str, days: int = 90):
+    try:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
+        steam_id = payload.get("steam_id")
+        if not steam_id:
+            raise HTTPException(status_code=401, detail="Invalid token payload")
+
+        valid_appids = ["730", "570"]
+        if appid not in valid_appids:
+            raise HTTPException(status_code=400, detail="Invalid appid. Use 730 for CS2 or 570 for Dota 2")
+
+        last = portfolio_store.last_snapshot(steam_id, appid)
+        if last is None or time.time() - last[1] > PORTFOLIO_UPDATE_INTERVAL:
+            run_in_background(("portfolio", steam_id, appid), lambda: update_portfolio_snapshot(steam_id, appid))
+
+        since = (datetime.now(timezone.utc).date() - timedelta(days=max(days, 1) - 1)).isoformat()
+        return {
+            "appid": appid,
+            "series": portfolio_store.series(steam_id, appid, since),
+            "updated_at": last[1] if last else None,
+        }
+    except jwt.JWTError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    except Exception as e:
+        logger.error(f"Failed to fetch portfolio history: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch portfolio history: {str(e)}")
+
+
+@router.get("/inventory/value")
+async def get_inventory_value(token: str, appid: str, top: int = 10, refresh: bool = False):
+    try:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
+        steam_id = payload.get("steam_id")
+        if not steam_id:
+            raise HTTPException(status_code=401, detail="Invalid token payload")
+
+        valid_appids = ["730", "570"]
+        if appid not in valid_appids:
+            raise HTTPException(status_code=400, detail="Invalid appid. Use 730 for CS2 or 570 for Dota 2")
+
+        return await run_in_threadpool(compute_inventory_value, steam_id, appid, max(0, min(top, 100)), refresh)
+    except jwt.JWTError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    except Exception as e:
+        logger.error(f"Failed to value inventory: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to value inventory: {str(e)}")
+
+
+INVALIDATION_REFRESH_LIMIT = 100
+
+
+def caller_item_keys(steam_id: str) -> List[str]:
+    """``appid:market_hash_name`` keys of the caller's favorites and inventory snapshots."""
+    conn = sqlite3.connect(DATABASE)
+    cursor = conn.cursor()
+    cursor.execute("SELECT appid, market_hash_name FROM favorites WHERE steam_id = ?", (steam_id,))
+    keys = {f"{appid}:{market_hash_name}" for appid, market_hash_name in cursor.fetchall()}
+    conn.close()
+
+    for appid in ("730", "570"):
+        for item in inventory_cache.get(f"{steam_id}:{appid}") or []:
+            keys.add(f"{appid}:{item['market_hash_name']}")
+    return sorted(keys)
+
+
+def refresh_invalidated(namespace: str, cache_key: str) -> bool:
+    if namespace == "price":
+        appid, market_hash_name = cache_key.split(":", 1)
+        return refresh_in_background(price_cache, cache_key,
+                                     lambda: store_price(cache_key, fetch_price(market_hash_name, appid)))
+    if namespace == "history":
+        appid, market_hash_name = cache_key.split(":", 1)
+        return refresh_in_background(history_cache, cache_key,
+                                     lambda: load_history(market_hash_name, appid) or None)
+    if namespace == "search":
+        appid, query = cache_key.split(":", 1)
+        return refresh_in_background(search_cache, cache_key, lambda: fetch_search_items(appid, query))
+    appid = cache_key[len("popular_items_"):]
+    return refresh_in_background(popular_items_cache, cache_key, lambda: fetch_popular_items(appid))
+
+
+def invalidate_caches(steam_id: str, namespaces: List[str], appid: Optional[str], key: Optional[str],
+                      prefix: Optional[str]) -> Dict[str, Any]:
+    """Mark matching entries stale and refresh them in the background.
+
+    Without ``key``/``prefix``/``appid`` the scope is the caller's own items
+    (favorites and inventory) and their recommendations; popular items and
+    searches are not per user and need an explicit scope. Entries keep serving
+    their old value until the refresh lands; past INVALIDATION_REFRESH_LIMIT
+    keys the rest revalidate lazily on their next read.
+    """
+    caches = {"price": price_cache, "history": history_cache, "popular_items": popular_items_cache,
+              "search": search_cache}
+    own_items = key is None and prefix is None and appid is None
+    item_keys = caller_item_keys(steam_id) if own_items else None
+
+    invalidated = {}
+    refreshing = 0
+    for namespace in namespaces:
+        if namespace == "recommendations":
+            if not own_items:
+                continue
+            # Recommendations are generated by the client, so the caller's row is dropped for it to rebuild.
+            conn = sqlite3.connect(DATABASE)
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM recommendations_cache WHERE steam_id = ?", (steam_id,))
+            invalidated[namespace] = cursor.rowcount
+            conn.commit()
+            conn.close()
+            continue
+
+        cache = caches[namespace]
+        if namespace == "popular_items":
+            if own_items:
+                continue
+            if key is not None:
+                keys = cache.invalidate(keys=[key])
+            else:
+                keys = cache.invalidate(prefix=f"popular_items_{appid}" if appid else prefix)
+        elif namespace == "search" and own_items:
+            continue
+        elif own_items:
+            keys = cache.invalidate(keys=item_keys)
+        elif key is not None:
+            keys = cache.invalidate(keys=[key])
+        else:
+            keys = cache.invalidate(prefix=f"{appid}:{prefix or ''}" if appid else prefix)
+
+        invalidated[namespace] = len(keys)
+        for cache_key in keys[:max(INVALIDATION_REFRESH_LIMIT - refreshing, 0)]:
+            refreshing += refresh_invalidated(namespace, cache_key)
+
+    logger.info(f"Cache invalidated for SteamID {steam_id}: {invalidated}, {refreshing} background refreshes")
+    return {"invalidated": invalidated, "refreshing": refreshing}
 
 
 @router.get("/reset_cache")
-async def reset_cache(token: str):
+async def reset_cache(token: str, namespace: Optional[str] = None, appid: Optional[str] = None,
+                      key: Optional[str] = None, prefix: Optional[str] = None):
     try:
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
-        if not payload.get("steam_id"):
+        steam_id = payload.get("steam_id")
+        if not steam_id:
             raise HTTPException(status_code=401, detail="Invalid token payload")
 
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM price_cache")
-        cursor.execute("DELETE FROM history_cache")
-        cursor.execute("DELETE FROM popular_items_cache")
-        cursor.execute("DELETE FROM recommendations_cache")
-        conn.commit()
-        conn.close()
+        namespaces = ["price", "history", "popular_items", "search", "recommendations"]
+        if namespace is not None:
+            if namespace not in namespaces:
+                raise HTTPException(status_code=400, detail=f"Invalid namespace. Use one of: {', '.join(namespaces)}")
+            namespaces = [namespace]
+        if appid is not None and appid not in ["730", "570"]:
+            raise HTTPException(status_code=400, detail="Invalid appid. Use 730 for CS2 or 570 for Dota 2")
+        if prefix == "" and appid is None:
+            raise HTTPException(status_code=400, detail="Empty prefix. Pass appid to invalidate a whole game")
 
-        price_cache.clear()
-        history_cache.clear()
-        popular_items_cache.clear()
-        logger.info("Server price, history, popular items, and recommendations cache cleared")
-        return {"message": "Cache cleared"}
+        result = await run_in_threadpool(invalidate_caches, steam_id, namespaces, appid, key, prefix)
+        return {"message": "Cache invalidated", **result}
     except jwt.JWTError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     except Exception as e:
@@ -872,46 +1026,169 @@ async def reset_cache(token: str):
         raise HTTPException(status_code=500, detail=f"Failed to reset cache: {str(e)}")
 
 
+def fetch_history(market_hash_name: str, appid: str) -> List:
+    logger.debug(f"Fetching history for {market_hash_name} (appid: {appid})")
+    history_url = f"https://steamcommunity.com/market/listings/{appid}/{quote(market_hash_name)}"
+    history_response = upstream_get(history_url, timeout=10)
+    logger.debug("History response for %s: %s (%d bytes)",
+                 market_hash_name, history_response.status_code, len(history_response.content))
+
+    history_match = re.search(r'var line1=(.+?);', history_response.text)
+    history_data = loads(history_match.group(1)) if history_match else []
+
+    if not history_data:
+        logger.warning(f"No history data found for {market_hash_name}")
+        price_url = f"https://steamcommunity.com/market/priceoverview/?appid={appid}&currency=1&market_hash_name={quote(market_hash_name)}"
+        price_response = upstream_get(price_url, timeout=10)
+        price_data = price_response.json() if price_response.status_code == 200 else {}
+        if price_data.get('lowest_price'):
+            current_time = datetime.utcnow().strftime("%b %d %Y %H: +0")
+            price = float(price_data['lowest_price'].replace('$', ''))
+            history_data = [[current_time, price, "1"]]
+
+    logger.info(f"History fetched: {len(history_data)} entries")
+    return history_data
+
+
+def load_history(market_hash_name: str, appid: str) -> List:
+    history_data = fetch_history(market_hash_name, appid)
+    if history_data:
+        trending_engine.update(appid, market_hash_name, history_data)
+    return history_data
+
+
+def backfill_trends():
+    count = 0
+    for cache_key in history_cache.keys():
+        appid, market_hash_name = cache_key.split(":", 1)
+        if trending_engine.has(appid, market_hash_name):
+            continue
+        history_data = history_cache.get(cache_key)
+        if history_data and trending_engine.update(appid, market_hash_name, history_data):
+            count += 1
+    if count:
+        logger.info(f"Trend stats backfilled for {count} items with cached history")
+
+
+run_in_background(("trending", "backfill"), backfill_trends)
+run_in_background(("similarity", "730"), lambda: similarity_index.rebuild("730"))
+run_in_background(("similarity", "570"), lambda: similarity_index.rebuild("570"))
+# Raw points age out of the window as days pass, also for items nobody refreshes.
+run_in_background(("history", "compaction"), history_cache.compact_all)
+start_periodic_job("history-compaction", HISTORY_COMPACTION_INTERVAL, history_cache.compact_all)
+
+
+MAX_BATCH_HISTORY_ITEMS = 50
+MAX_HISTORY_POINTS = 2000
+DEFAULT_HISTORY_POINTS = 500
+
+downsampled_history_cache: LRUCache = LRUCache(maxsize=5000)
+downsampled_history_lock = threading.Lock()
+history_fetch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="history-fetch")
+
+
+def downsampled_history(cache_key: str, points: int, start: Optional[float], end: Optional[float]) -> Optional[List]:
+    entry = history_cache.get_entry(cache_key)
+    if entry is None:
+        return None
+    memo_key = (cache_key, entry.updated_at, points, start, end)
+    with downsampled_history_lock:
+        series = downsampled_history_cache.get(memo_key)
+    if series is None:
+        series = downsample_history(entry.value, points, start, end)
+        with downsampled_history_lock:
+            downsampled_history_cache[memo_key] = series
+    return series
+
+
+def fetch_history_batch(items: List[Dict[str, str]], points: int, start: Optional[float],
+                        end: Optional[float]) -> Dict[str, Any]:
+    keys = list(dict.fromkeys(f"{item['appid']}:{item['market_hash_name']}" for item in items))
+    missing = [key for key in keys if history_cache.get_entry(key) is None]
+
+    def load(cache_key: str):
+        appid, market_hash_name = cache_key.split(":", 1)
+        history_data = load_history(market_hash_name, appid)
+        history_cache[cache_key] = history_data
+
+    failed = set()
+    futures = [(key, history_fetch_executor.submit(contextvars.copy_context().run, load, key)) for key in missing]
+    for cache_key, future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            logger.warning(f"Failed to fetch history for {cache_key}: {e}")
+            failed.add(cache_key)
+
+    series = {}
+    for cache_key in keys:
+        if cache_key not in failed:
+            series[cache_key] = downsampled_history(cache_key, points, start, end) or []
+    return {"series": series, "failed": sorted(failed)}
+
+
+@router.post("/history/batch")
+async def get_history_batch(token: str, request_data: Dict[str, Any], request: Request):
+    """Many items' histories in one call, downsampled to ``points`` per series.
+
+    Body: ``{"items": [{"appid", "market_hash_name"}], "points": 500, "start": unix, "end": unix}``;
+    series are keyed by ``appid:market_hash_name`` and keep the ``line1`` row format.
+    """
+    try:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
+        if not payload.get("steam_id"):
+            raise HTTPException(status_code=401, detail="Invalid token payload")
+
+        items = request_data.get("items") or []
+        if not items or len(items) > MAX_BATCH_HISTORY_ITEMS:
+            raise HTTPException(status_code=400,
+                                detail=f"Between 1 and {MAX_BATCH_HISTORY_ITEMS} items are required")
+        if any(str(item.get("appid")) not in ["730", "570"] or not item.get("market_hash_name") for item in items):
+            raise HTTPException(status_code=400, detail="Every item needs appid (730 or 570) and market_hash_name")
+        items = [{"appid": str(item["appid"]), "market_hash_name": item["market_hash_name"]} for item in items]
+
+        points = max(3, min(int(request_data.get("points", DEFAULT_HISTORY_POINTS)), MAX_HISTORY_POINTS))
+        start = request_data.get("start")
+        end = request_data.get("end")
+        start = float(start) if start is not None else None
+        end = float(end) if end is not None else None
+
+        result = await run_in_threadpool(fetch_history_batch, items, points, start, end)
+        return negotiated_response(request, result)
+    except jwt.JWTError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    except Exception as e:
+        logger.error(f"Failed to fetch history batch: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch history batch: {str(e)}")
+
+
 @router.get("/history")
-async def get_history(token: str, market_hash_name: str, appid: str):
+async def get_history(token: str, market_hash_name: str, appid: str, request: Request, response: Response):
     try:
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
         if not payload.get("steam_id"):
             raise HTTPException(status_code=401, detail="Invalid token payload")
 
         cache_key = f"{appid}:{market_hash_name}"
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT history_data FROM history_cache WHERE cache_key = ?", (cache_key,))
-        row = cursor.fetchone()
-        conn.close()
-
-        if row:
+        entry = history_cache.get_entry(cache_key)
+        if entry is not None:
+            if entry.is_stale(HISTORY_TTL):
+                refresh_in_background(history_cache, cache_key,
+                                      lambda: load_history(market_hash_name, appid) or None)
+            # JSON and MessagePack bodies of one version are different representations.
+            etag = make_etag("history", cache_key, entry.updated_at, negotiated_media_type(request))
+            unchanged = not_modified(request, response, etag, HISTORY_CACHE_CONTROL, vary="Accept")
+            if unchanged is not None:
+                return unchanged
             logger.debug(f"Returning cached history for {cache_key}")
-            return {"history": json.loads(row[0])}
-
-        logger.debug(f"Fetching history for {market_hash_name} (appid: {appid})")
-        history_url = f"https://steamcommunity.com/market/listings/{appid}/{quote(market_hash_name)}"
-        history_response = session.get(history_url, timeout=10)
-        logger.debug(f"History response: {history_response.status_code} - {history_response.text[:200]}")
-
-        history_match = re.search(r'var line1=(.+?);', history_response.text)
-        history_data = json.loads(history_match.group(1)) if history_match else []
-
-        if not history_data:
-            logger.warning(f"No history data found for {market_hash_name}")
-            price_url = f"https://steamcommunity.com/market/priceoverview/?appid={appid}&currency=1&market_hash_name={quote(market_hash_name)}"
-            price_response = session.get(price_url, timeout=10)
-            price_data = price_response.json() if price_response.status_code == 200 else {}
-            if price_data.get('lowest_price'):
-                current_time = datetime.utcnow().strftime("%b %d %Y %H: +0")
-                price = float(price_data['lowest_price'].replace('$', ''))
-                history_data = [[current_time, price, "1"]]
-
-        history_cache[cache_key] = history_data
-        save_history_cache({cache_key: history_data})
-        logger.info(f"History fetched: {len(history_data)} entries")
-        return {"history": history_data}
+            return negotiated_response(request, {"history": entry.value}, response)
+
+        history_data = await run_in_threadpool(load_history, market_hash_name, appid)
+        updated_at = time.time()
+        history_cache.set(cache_key, history_data, updated_at=updated_at)
+        tag(response, make_etag("history", cache_key, updated_at, negotiated_media_type(request)),
+            HISTORY_CACHE_CONTROL)
+        return negotiated_response(request, {"history": history_data}, response)
     except jwt.JWTError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     except Exception as e:
@@ -919,81 +1196,237 @@ async def get_history(token: str, market_hash_name: str, appid: str):
         raise HTTPException(status_code=500, detail=f"Failed to fetch history: {str(e)}")
 
 
-@router.get("/popular_items")
-async def get_popular_items(appid: str, force_refresh: bool = False):
+def record_listing_prices(appid: str, listings: List[Dict[str, Any]]):
+    prices = []
+    for listing in listings:
+        name = listing.get("hash_name") or listing.get("name")
+        price = parse_price_text(listing.get("sell_price_text"))
+        if name and price is not None:
+            prices.append((name, price))
+    record_steam_prices(appid, prices)
+
+
+MAX_ANALYTICS_ITEMS = 50
+
+
+def item_analytics(appid: str, market_hash_name: str) -> Optional[Dict[str, Any]]:
+    cache_key = f"{appid}:{market_hash_name}"
+    entry = history_cache.get_entry(cache_key)
+    if entry is None or not entry.value:
+        return None
+
+    state = analytics_cache.get(cache_key)
+    if state is None or state["version"] != entry.updated_at:
+        state = analyze_history(entry.value, entry.updated_at, state)
+        analytics_cache[cache_key] = state
+        logger.debug(f"Analytics for {cache_key} {'extended' if state['extended'] else 'computed'}")
+    return state
+
+
+def fetch_popular_items(appid: str) -> List[Dict[str, Any]]:
+    logger.debug(f"Fetching popular items for appid {appid} from Steam Market")
+    url = f"https://steamcommunity.com/market/search/render/?appid={appid}&norender=1&count=100"
+    # Добавляем &start=100 в запрос для изменения раздела популярное как временное решение
+    response = upstream_get(url, timeout=10)
+    logger.debug("Popular items response for appid %s: %s", appid, response.status_code)
+
+    if response.status_code != 200:
+        logger.error(f"Failed to fetch popular items for appid {appid}: HTTP {response.status_code}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch popular items: HTTP {response.status_code}")
+
+    data = response.json()
+    if not data.get("success"):
+        logger.error(f"Failed to fetch popular items for appid {appid}: API returned success=false")
+        raise HTTPException(status_code=500, detail="Failed to fetch popular items: API error")
+
+    record_listing_prices(appid, data.get("results", []))
+
+    all_items = []
+    for listing in data.get("results", [])[:100]:
+        name = listing.get("name", "Unknown Item")
+        price = listing.get("sell_price_text", "N/A")
+        icon_url = listing.get("asset_description", {}).get("icon_url", "")
+        icon_url = f"https://steamcommunity-a.akamaihd.net/economy/image/{icon_url}" if icon_url else "https://via.placeholder.com/150"
+        item_url = f"https://steamcommunity.com/market/listings/{appid}/{quote(name)}"
+
+        all_items.append({
+            "name": name,
+            "price": price,
+            "icon_url": icon_url,
+            "item_url": item_url,
+            "appid": appid
+        })
+
+    if not all_items:
+        logger.warning(f"No popular items found for appid {appid}")
+        raise HTTPException(status_code=404, detail="No popular items found")
+
+    items = random.sample(all_items, min(10, len(all_items)))
+    logger.info(f"Popular items fetched for appid {appid}: {len(items)} items (randomly selected from {len(all_items)})")
+    return items
+
+
+@router.get("/analytics")
+async def get_analytics(token: str, appid: str, request: Request, market_hash_name: List[str] = Query(...),
+                        days: int = 90):
     try:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
+        if not payload.get("steam_id"):
+            raise HTTPException(status_code=401, detail="Invalid token payload")
+
         valid_appids = ["730", "570"]
         if appid not in valid_appids:
             raise HTTPException(status_code=400, detail="Invalid appid. Use 730 for CS2 or 570 for Dota 2")
 
-        cache_key = f"popular_items_{appid}"
-        if force_refresh:
-            conn = sqlite3.connect(DATABASE)
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM popular_items_cache WHERE cache_key = ?", (cache_key,))
-            conn.commit()
-            conn.close()
-            if cache_key in popular_items_cache:
-                del popular_items_cache[cache_key]
+        names = list(dict.fromkeys(market_hash_name))
+        if len(names) > MAX_ANALYTICS_ITEMS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_ANALYTICS_ITEMS} items per request")
+
+        def compute() -> Dict[str, Any]:
+            items, missing = {}, []
+            for name in names:
+                state = item_analytics(appid, name)
+                if state is None:
+                    missing.append(name)
+                    refresh_in_background(history_cache, f"{appid}:{name}",
+                                          lambda name=name: load_history(name, appid) or None)
+                else:
+                    items[name] = summarize(state, days)
+            return {"appid": appid, "items": items, "missing": missing}
+
+        return negotiated_response(request, await run_in_threadpool(compute))
+    except jwt.JWTError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    except Exception as e:
+        logger.error(f"Failed to compute analytics: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to compute analytics: {str(e)}")
 
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT items_data FROM popular_items_cache WHERE cache_key = ?", (cache_key,))
-        row = cursor.fetchone()
-        conn.close()
 
-        if not force_refresh and row:
+@router.get("/trending")
+async def get_trending(appid: str, limit: int = 10):
+    try:
+        valid_appids = ["730", "570"]
+        if appid not in valid_appids:
+            raise HTTPException(status_code=400, detail="Invalid appid. Use 730 for CS2 or 570 for Dota 2")
+
+        boards = trending_engine.top(appid, max(1, min(limit, 50)))
+        return {"appid": appid, "tracked_items": trending_engine.tracked(appid), **boards}
+    except Exception as e:
+        logger.error(f"Failed to fetch trending items: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch trending items: {str(e)}")
+
+
+MAX_SIMILAR_ITEMS = 50
+
+
+@router.get("/similar_items")
+async def get_similar_items(token: str, appid: str, market_hash_name: str, limit: int = 10):
+    try:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
+        if not payload.get("steam_id"):
+            raise HTTPException(status_code=401, detail="Invalid token payload")
+
+        valid_appids = ["730", "570"]
+        if appid not in valid_appids:
+            raise HTTPException(status_code=400, detail="Invalid appid. Use 730 for CS2 or 570 for Dota 2")
+
+        items = await run_in_threadpool(similarity_index.similar, appid, market_hash_name,
+                                        max(1, min(limit, MAX_SIMILAR_ITEMS)))
+        if items is None:
+            raise HTTPException(status_code=503, detail="Similarity index is being built, try again shortly",
+                                headers={"Retry-After": "5"})
+        return {"appid": appid, "market_hash_name": market_hash_name, "items": items}
+    except jwt.JWTError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to find similar items for {market_hash_name}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to find similar items: {str(e)}")
+
+
+@router.get("/popular_items")
+async def get_popular_items(appid: str, request: Request, response: Response, force_refresh: bool = False):
+    try:
+        valid_appids = ["730", "570"]
+        if appid not in valid_appids:
+            raise HTTPException(status_code=400, detail="Invalid appid. Use 730 for CS2 or 570 for Dota 2")
+
+        cache_key = f"popular_items_{appid}"
+        entry = popular_items_cache.get_entry(cache_key)
+        if entry is not None and not force_refresh:
+            if entry.is_stale(POPULAR_ITEMS_TTL):
+                refresh_in_background(popular_items_cache, cache_key, lambda: fetch_popular_items(appid))
+            unchanged = not_modified(request, response, make_etag(cache_key, entry.updated_at),
+                                     POPULAR_ITEMS_CACHE_CONTROL)
+            if unchanged is not None:
+                return unchanged
             logger.debug(f"Returning cached popular items for appid {appid}")
-            return {"items": json.loads(row[0])}
+            return {"items": entry.value}
 
-        logger.debug(f"Fetching popular items for appid {appid} from Steam Market")
         if force_refresh:
-            time.sleep(2)
-        url = f"https://steamcommunity.com/market/search/render/?appid={appid}&norender=1&count=100"
-        # Добавляем &start=100 в запрос для изменения раздела популярное как временное решение
-        response = session.get(url, timeout=10)
-        logger.debug(f"Popular items response: {response.status_code} - {response.text[:200]}")
-
-        if response.status_code != 200:
-            logger.error(f"Failed to fetch popular items for appid {appid}: HTTP {response.status_code}")
-            raise HTTPException(status_code=500, detail=f"Failed to fetch popular items: HTTP {response.status_code}")
-
-        data = response.json()
-        if not data.get("success"):
-            logger.error(f"Failed to fetch popular items for appid {appid}: API returned success=false")
-            raise HTTPException(status_code=500, detail="Failed to fetch popular items: API error")
-
-        all_items = []
-        for listing in data.get("results", [])[:100]:
-            name = listing.get("name", "Unknown Item")
-            price = listing.get("sell_price_text", "N/A")
-            icon_url = listing.get("asset_description", {}).get("icon_url", "")
-            icon_url = f"https://steamcommunity-a.akamaihd.net/economy/image/{icon_url}" if icon_url else "https://via.placeholder.com/150"
-            item_url = f"https://steamcommunity.com/market/listings/{appid}/{quote(name)}"
-
-            all_items.append({
-                "name": name,
-                "price": price,
-                "icon_url": icon_url,
-                "item_url": item_url,
-                "appid": appid
-            })
-
-        if not all_items:
-            logger.warning(f"No popular items found for appid {appid}")
-            raise HTTPException(status_code=404, detail="No popular items found")
-
-        items = random.sample(all_items, min(10, len(all_items)))
-
-        popular_items_cache[cache_key] = items
-        save_popular_items_cache({cache_key: items})
-        logger.info(f"Popular items fetched for appid {appid}: {len(items)} items (randomly selected from {len(all_items)})")
+            await asyncio.sleep(2)
+        try:
+            items = await run_in_threadpool(fetch_popular_items, appid)
+        except (HTTPException, requests.exceptions.RequestException) as e:
+            if entry is None:
+                raise
+            logger.warning(f"Serving stale popular items for appid {appid}: {e}")
+            tag(response, make_etag(cache_key, entry.updated_at), POPULAR_ITEMS_CACHE_CONTROL)
+            return {"items": entry.value}
+
+        updated_at = time.time()
+        popular_items_cache.set(cache_key, items, updated_at=updated_at)
+        tag(response, make_etag(cache_key, updated_at), POPULAR_ITEMS_CACHE_CONTROL)
         return {"items": items}
     except Exception as e:
         logger.error(f"Failed to fetch popular items: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch popular items: {str(e)}")
 
 
+def fetch_search_items(appid: str, query: str) -> List[Dict[str, Any]]:
+    logger.debug(f"Searching items for appid {appid} with query '{query}'")
+    url = f"https://steamcommunity.com/market/search/render/?query={quote(query)}&appid={appid}&norender=1"
+    response = upstream_get(url, timeout=10)
+    logger.debug("Search items response for appid %s: %s", appid, response.status_code)
+
+    if response.status_code != 200:
+        error_detail = f"Failed to search items: HTTP {response.status_code}"
+        if response.status_code == 429:
+            error_detail = "Слишком много запросов к Steam Market. Попробуйте снова через несколько минут."
+        logger.error(f"Failed to search items for appid {appid}: HTTP {response.status_code} - {response.text[:200]}")
+        raise HTTPException(status_code=500, detail=error_detail)
+
+    data = response.json()
+    if not data.get("success"):
+        logger.error(f"Failed to search items for appid {appid}: API returned success=false - {data}")
+        raise HTTPException(status_code=500, detail="Steam Market API вернул ошибку. Попробуйте снова позже.")
+
+    record_listing_prices(appid, data.get("results", []))
+
+    items = []
+    for listing in data.get("results", [])[:20]:
+        name = listing.get("name", "Unknown Item")
+        price = listing.get("sell_price_text", "N/A")
+        icon_url = listing.get("asset_description", {}).get("icon_url", "")
+        icon_url = f"https://steamcommunity-a.akamaihd.net/economy/image/{icon_url}" if icon_url else "https://via.placeholder.com/150"
+        item_url = f"https://steamcommunity.com/market/listings/{appid}/{quote(name)}"
+
+        items.append({
+            "name": name,
+            "price": price,
+            "icon_url": icon_url,
+            "item_url": item_url,
+            "appid": appid
+        })
+
+    if not items:
+        logger.warning(f"No items found for appid {appid} with query '{query}'")
+    else:
+        logger.info(f"Found {len(items)} items for appid {appid} with query '{query}'")
+    return items
+
+
 @router.get("/search_items")
 async def search_items(appid: str, query: str):
     try:
@@ -1004,44 +1437,18 @@ async def search_items(appid: str, query: str):
         if not query or len(query.strip()) < 1:
             raise HTTPException(status_code=400, detail="Query must not be empty")
 
-        logger.debug(f"Searching items for appid {appid} with query '{query}'")
-        url = f"https://steamcommunity.com/market/search/render/?query={quote(query)}&appid={appid}&norender=1"
-        response = session.get(url, timeout=10)
-        logger.debug(f"Search items response: {response.status_code} - {response.text[:200]}")
-
-        if response.status_code != 200:
-            error_detail = f"Failed to search items: HTTP {response.status_code}"
-            if response.status_code == 429:
-                error_detail = "Слишком много запросов к Steam Market. Попробуйте снова через несколько минут."
-            logger.error(f"Failed to search items for appid {appid}: HTTP {response.status_code} - {response.text}")
-            raise HTTPException(status_code=500, detail=error_detail)
-
-        data = response.json()
-        if not data.get("success"):
-            logger.error(f"Failed to search items for appid {appid}: API returned success=false - {data}")
-            raise HTTPException(status_code=500, detail="Steam Market API вернул ошибку. Попробуйте снова позже.")
-
-        items = []
-        for listing in data.get("results", [])[:20]:
-            name = listing.get("name", "Unknown Item")
-            price = listing.get("sell_price_text", "N/A")
-            icon_url = listing.get("asset_description", {}).get("icon_url", "")
-            icon_url = f"https://steamcommunity-a.akamaihd.net/economy/image/{icon_url}" if icon_url else "https://via.placeholder.com/150"
-            item_url = f"https://steamcommunity.com/market/listings/{appid}/{quote(name)}"
-
-            items.append({
-                "name": name,
-                "price": price,
-                "icon_url": icon_url,
-                "item_url": item_url,
-                "appid": appid
-            })
-
-        if not items:
-            logger.warning(f"No items found for appid {appid} with query '{query}'")
-            return {"items": []}
-
-        logger.info(f"Found {len(items)} items for appid {appid} with query '{query}'")
+        # Every spelling of a query shares one entry, so it is always fetched in the normalized form.
+        query = normalize_market_hash_name(query)
+        cache_key = f"{appid}:{query}"
+        entry = search_cache.get_entry(cache_key)
+        if entry is not None:
+            if entry.is_stale(SEARCH_TTL):
+                refresh_in_background(search_cache, cache_key, lambda: fetch_search_items(appid, query))
+            logger.debug(f"Returning cached search results for {cache_key}")
+            return {"items": entry.value}
+
+        items = await run_in_threadpool(fetch_search_items, appid, query)
+        search_cache[cache_key] = items
         return {"items": items}
     except requests.exceptions.RequestException as e:
         logger.error(f"Network error while searching items: {str(e)}")
@@ -1086,7 +1493,7 @@ async def add_to_favorites(token: str, item: Dict[str, Any]):
 
 
 @router.get("/favorites")
-async def get_favorites(token: str):
+async def get_favorites(token: str, request: Request, response: Response):
     try:
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
         steam_id = payload.get("steam_id")
@@ -1095,6 +1502,16 @@ async def get_favorites(token: str):
 
         conn = sqlite3.connect(DATABASE)
         cursor = conn.cursor()
+        # Favorite rows are never updated in place and ids are never reused (AUTOINCREMENT),
+        # so the set of ids identifies the list; it is read from the steam_id index alone.
+        cursor.execute("SELECT group_concat(id) FROM (SELECT id FROM favorites WHERE steam_id = ? ORDER BY id)",
+                       (steam_id,))
+        unchanged = not_modified(request, response, make_etag("favorites", steam_id, cursor.fetchone()[0]),
+                                 PRIVATE_REVALIDATE)
+        if unchanged is not None:
+            conn.close()
+            return unchanged
+
         cursor.execute("SELECT * FROM favorites WHERE steam_id = ?", (steam_id,))
         rows = cursor.fetchall()
         conn.close()
@@ -1146,87 +1563,123 @@ async def remove_from_favorites(token: str, appid: str, market_hash_name: str):
         raise HTTPException(status_code=500, detail=f"Failed to remove item from favorites: {str(e)}")
 
 
-def prepare_prediction_data(history_data: List[List]) -> pd.DataFrame:
-    if not history_data or len(history_data) < 50:
-        logger.error(f"Insufficient history data: {len(history_data)} entries")
-        return None
-
-    df = pd.DataFrame(history_data, columns=["timestamp", "price", "volume"])
-    df["timestamp"] = pd.to_datetime(df["timestamp"], format="%b %d %Y %H: +0")
-    df["price"] = df["price"].astype(float)
-    df["volume"] = df["volume"].str.replace(",", "").astype(int)
-
-    df["date"] = df["timestamp"].dt.date
-    df_daily = df.groupby("date").agg({
-        "timestamp": "last",
-        "price": "last",
-        "volume": "sum"
-    }).reset_index()
-
-    df_daily.set_index("timestamp", inplace=True)
-
-    df_daily = df_daily.asfreq("D", method="ffill").reset_index()
+def alert_number(alert: Dict[str, Any], field: str) -> float:
+    value = alert.get(field)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        number = None
+    if number is None or isinstance(value, bool) or not math.isfinite(number):
+        raise HTTPException(status_code=400, detail=f"{field} must be a number")
+    return number
 
-    df_daily["pct_change_1d"] = df_daily["price"].pct_change(periods=1) * 100
-    df_daily["pct_change_7d"] = df_daily["price"].pct_change(periods=7) * 100
 
-    df_daily["day_of_week"] = df_daily["timestamp"].dt.dayofweek
-    df_daily["hour"] = df_daily["timestamp"].dt.hour
+@router.post("/alerts/add")
+async def add_alert(token: str, alert: Dict[str, Any]):
+    try:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
+        steam_id = payload.get("steam_id")
+        if not steam_id:
+            raise HTTPException(status_code=401, detail="Invalid token payload")
 
-    df_daily["event"] = 0
+        appid = str(alert.get("appid", ""))
+        market_hash_name = alert.get("market_hash_name")
+        kind = alert.get("kind")
+        if appid not in ["730", "570"] or not market_hash_name:
+            raise HTTPException(status_code=400, detail="appid (730 or 570) and market_hash_name are required")
+        if kind not in ALERT_KINDS:
+            raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(ALERT_KINDS)}")
+
+        threshold = percent = base_price = None
+        if kind == "change":
+            percent = alert_number(alert, "percent")
+            if percent <= -100 or percent == 0:
+                raise HTTPException(status_code=400, detail="percent must be non-zero and above -100")
+            if alert.get("base_price") is not None:
+                base_price = alert_number(alert, "base_price")
+            else:
+                base_price = price_books.get_steam_prices(appid, [market_hash_name]).get(market_hash_name)
+            if not base_price or base_price <= 0:
+                raise HTTPException(status_code=400, detail="No known price for this item, pass a positive base_price")
+            base_price = float(base_price)
+        else:
+            threshold = alert_number(alert, "threshold")
+            if threshold <= 0:
+                raise HTTPException(status_code=400, detail="threshold must be positive")
 
-    df_daily = df_daily.dropna()
+        rule = alert_engine.create(steam_id, appid, market_hash_name, kind, threshold, percent, base_price)
+        logger.info(f"Price alert {rule['id']} ({kind} {rule['threshold']}) added for SteamID: {steam_id}")
+        return rule
+    except jwt.JWTError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to add price alert: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to add price alert: {str(e)}")
 
-    if len(df_daily) < 10:
-        logger.error(f"Too few data points after processing: {len(df_daily)} entries")
-        return None
 
-    return df_daily
+@router.get("/alerts")
+async def get_alerts(token: str):
+    try:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
+        steam_id = payload.get("steam_id")
+        if not steam_id:
+            raise HTTPException(status_code=401, detail="Invalid token payload")
 
-def predict_price(model, data: pd.DataFrame, horizon: int) -> Dict:
-    features = ["pct_change_1d", "pct_change_7d", "day_of_week", "hour", "event", "volume"]
+        return {"alerts": alert_engine.rules(steam_id)}
+    except jwt.JWTError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    except Exception as e:
+        logger.error(f"Failed to fetch price alerts: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch price alerts: {str(e)}")
 
-    last_row = data.tail(1).copy()
-    last_price = last_row["price"].iloc[0]
-    last_date = last_row["timestamp"].iloc[0]
 
-    predictions = []
-    current_features = last_row[features].copy()
+@router.delete("/alerts/remove")
+async def remove_alert(token: str, alert_id: int):
+    try:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
+        steam_id = payload.get("steam_id")
+        if not steam_id:
+            raise HTTPException(status_code=401, detail="Invalid token payload")
 
-    for day in range(1, horizon + 1):
-        X = current_features[features].values
-        predicted_pct_change = model.predict(X)[0]
+        if not alert_engine.delete(steam_id, alert_id):
+            raise HTTPException(status_code=404, detail="Alert not found")
 
-        new_price = last_price * (1 + predicted_pct_change / 100)
+        logger.info(f"Price alert {alert_id} removed for SteamID: {steam_id}")
+        return {"message": "Alert removed"}
+    except jwt.JWTError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    except Exception as e:
+        logger.error(f"Failed to remove price alert: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to remove price alert: {str(e)}")
 
-        new_date = last_date + timedelta(days=day)
 
-        predictions.append({
-            "date": new_date.strftime("%Y-%m-%d"),
-            "predicted_price": round(new_price, 2),
-            "predicted_pct_change": round(predicted_pct_change, 3)
-        })
+@router.get("/alerts/events")
+async def get_alert_events(token: str, since_id: int = 0, wait: int = 0):
+    """Triggered alerts after ``since_id``; with ``wait`` the request is held until one arrives (long polling)."""
+    try:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
+        steam_id = payload.get("steam_id")
+        if not steam_id:
+            raise HTTPException(status_code=401, detail="Invalid token payload")
 
-        current_features["pct_change_1d"] = predicted_pct_change
-        current_features["pct_change_7d"] = (
-            (new_price - data["price"].iloc[-7]) / data["price"].iloc[-7] * 100
-            if len(data) >= 7 else predicted_pct_change
-        )
-        current_features["day_of_week"] = new_date.dayofweek
-        current_features["hour"] = new_date.hour
-        current_features["event"] = 0
-        current_features["volume"] = last_row["volume"].iloc[0]
+        deadline = time.monotonic() + max(0, min(wait, ALERT_EVENTS_MAX_WAIT))
+        events = await run_in_threadpool(alert_engine.events, steam_id, since_id)
+        while not events and time.monotonic() < deadline:
+            await asyncio.sleep(1)
+            events = await run_in_threadpool(alert_engine.events, steam_id, since_id)
 
-        last_price = new_price
+        return {"events": events, "last_id": events[-1]["id"] if events else since_id}
+    except jwt.JWTError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    except Exception as e:
+        logger.error(f"Failed to fetch alert events: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch alert events: {str(e)}")
 
-    return {
-        "last_known_price": round(last_row["price"].iloc[0], 2),
-        "last_known_date": last_row["timestamp"].iloc[0].strftime("%Y-%m-%d"),
-        "predictions": predictions
-    }
 
 @router.get("/predict_price")
-async def predict_price_endpoint(token: str, market_hash_name: str, appid: str, horizon: int):
+async def predict_price_endpoint(token: str, market_hash_name: str, appid: str, horizon: int, request: Request):
     try:
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
         if not payload.get("steam_id"):
@@ -1243,17 +1696,12 @@ async def predict_price_endpoint(token: str, market_hash_name: str, appid: str,
         model = MODEL_CS2 if appid == "730" else MODEL_DOTA2
 
         cache_key = f"{appid}:{market_hash_name}"
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT history_data FROM history_cache WHERE cache_key = ?", (cache_key,))
-        row = cursor.fetchone()
-        conn.close()
+        history_data = history_cache.get(cache_key)
 
-        if not row:
+        if history_data is None:
             raise HTTPException(status_code=404,
                                 detail="No historical data found for this item. Please fetch history first.")
 
-        history_data = json.loads(row[0])
         if len(history_data) < 10:
             raise HTTPException(status_code=400,
                                 detail=f"Insufficient historical data: only {len(history_data)} entries available")
@@ -1263,12 +1711,12 @@ async def predict_price_endpoint(token: str, market_hash_name: str, appid: str,
             raise HTTPException(status_code=400,
                                 detail="Failed to prepare data for prediction: insufficient data after processing")
 
-        result = predict_price(model, data, horizon)
-
-        result = convert_numpy_types(result)
+        with model_inference_duration.time(appid=appid):
+            result = predict_price(model, data, horizon)
 
         logger.info(f"Price prediction successful for {market_hash_name} (appid {appid})")
-        return result
+        # NumPy values in the result are encoded by the response itself.
+        return negotiated_response(request, result)
 
     except jwt.JWTError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
@@ -1278,13 +1726,20 @@ async def predict_price_endpoint(token: str, market_hash_name: str, appid: str,
 
 
 @router.get("/recommendations")
-async def get_recommendations(token: str):
+async def get_recommendations(token: str, request: Request, response: Response):
     try:
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
         steam_id = payload.get('steam_id')
         if not steam_id:
             raise HTTPException(status_code=401, detail="Invalid token payload")
 
+        version = recommendations_version(steam_id)
+        if version is not None:
+            unchanged = not_modified(request, response, make_etag("recommendations", steam_id, version),
+                                     PRIVATE_REVALIDATE)
+            if unchanged is not None:
+                return unchanged
+
         cached_data = load_recommendations_cache(steam_id)
         if cached_data:
             logger.debug(f"Returning cached recommendations for steam_id {steam_id}")
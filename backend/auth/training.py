@@ -0,0 +1,312 @@
+"""Offline training of the price models loaded by ``/predict_price``.
+
+Run from the ``backend`` directory::
+
+    python -m auth.training                              # both appids, from favorites.db
+    python -m auth.training --appids 730 --workers 8 --limit 20000
+    python -m auth.training --appids 570 --promote       # also replace auth/xgboost_model_570.joblib
+
+Stored histories (raw points merged with their daily rollups, see
+``auth.history_store``) are streamed from ``history_cache`` in chunks of items. A
+process pool turns every chunk into rows of ``FEATURES`` built by
+``prepare_prediction_data``, so features match inference exactly. The target
+is the next day's ``pct_change_1d``. Chunks are written to a work directory as
+``.npy`` files and fed to XGBoost through a ``DataIter``, so only the quantized
+training matrix is ever held in memory. Each run writes a versioned artifact
+directory under ``auth/models/<appid>/<version>/``.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import joblib
+import numpy as np
+import xgboost as xgb
+
+from auth.history_store import init_history_tiers, load_rollups, merge_history
+from auth.prediction import FEATURES, prepare_prediction_data
+from auth.serialization import decode_value
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(BASE_DIR, "models")
+APPIDS = ("730", "570")
+
+# Same model shape as the original xgboost_model_730/570 artifacts.
+TRAIN_PARAMS = {
+    "objective": "reg:squarederror",
+    "tree_method": "hist",
+    "max_depth": 5,
+    "learning_rate": 0.1,
+    "max_bin": 256,
+    "seed": 42,
+}
+NUM_BOOST_ROUND = 100
+CHUNK_ITEMS = 200
+VALIDATION_DAYS = 14
+
+
+class ExtractionStats(NamedTuple):
+    items: int
+    items_used: int
+    train_rows: int
+    valid_rows: int
+    train_files: List[str]
+    valid_files: List[str]
+    fingerprint: str
+    seconds: float
+
+
+def item_rows(history: List[List], validation_days: int) -> Tuple[np.ndarray, np.ndarray]:
+    """``FEATURES`` plus target rows of one item, split into train and the last ``validation_days`` days."""
+    empty = np.empty((0, len(FEATURES) + 1), dtype=np.float32)
+    data = prepare_prediction_data(history)
+    if data is None:
+        return empty, empty
+    frame = data[FEATURES].assign(target=data["pct_change_1d"].shift(-1))
+    keep = frame.notna().all(axis=1).to_numpy()
+    rows = frame.to_numpy(dtype=np.float32)[keep]
+    timestamps = data["timestamp"].to_numpy()[keep]
+    if not len(rows):
+        return empty, empty
+    validation = timestamps > timestamps[-1] - np.timedelta64(validation_days, "D")
+    return rows[~validation], rows[validation]
+
+
+def _init_worker():
+    # Items with too little history are expected; they are counted, not logged.
+    logging.getLogger("auth.prediction").setLevel(logging.CRITICAL)
+
+
+def extract_chunk(items: List[Tuple[Any, List[tuple]]], validation_days: int) -> Tuple[np.ndarray, np.ndarray, int]:
+    train, valid, used = [], [], 0
+    for stored, rollups in items:
+        item_train, item_valid = item_rows(merge_history(rollups, decode_value(stored)), validation_days)
+        if len(item_train) or len(item_valid):
+            used += 1
+        train.append(item_train)
+        valid.append(item_valid)
+    return np.concatenate(train), np.concatenate(valid), used
+
+
+def iter_history_chunks(database: str, appid: str, chunk_items: int, limit: Optional[int],
+                        fingerprint: Any) -> Iterator[List[Tuple[Any, List[tuple]]]]:
+    """Stored ``history_data`` values and rollup rows of an appid, ``chunk_items`` at a time, in a stable order."""
+    init_history_tiers(database)
+    conn = sqlite3.connect(database)
+    try:
+        query = ("SELECT cache_key, updated_at, history_data FROM history_cache "
+                 "WHERE cache_key LIKE ? ORDER BY cache_key")
+        params: tuple = (f"{appid}:%",)
+        if limit:
+            query += " LIMIT ?"
+            params += (limit,)
+        cursor = conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_items)
+            if not rows:
+                break
+            for cache_key, updated_at, _ in rows:
+                fingerprint.update(f"{cache_key}\x1f{updated_at}\n".encode())
+            rollups = load_rollups(conn, [cache_key for cache_key, _, _ in rows])
+            yield [(stored, rollups.get(cache_key, [])) for cache_key, _, stored in rows]
+    finally:
+        conn.close()
+
+
+def extract_features(database: str, appid: str, work_dir: str, workers: int, chunk_items: int = CHUNK_ITEMS,
+                     validation_days: int = VALIDATION_DAYS, limit: Optional[int] = None) -> ExtractionStats:
+    """Write per-chunk train/validation matrices to ``work_dir`` using a process pool.
+
+    At most ``2 * workers`` chunks are in flight, which bounds memory no matter
+    how large the catalog is.
+    """
+    started = time.perf_counter()
+    fingerprint = hashlib.sha256()
+    train_files, valid_files = [], []
+    counts = {"items": 0, "items_used": 0, "train_rows": 0, "valid_rows": 0}
+
+    def collect(index: int, result: Tuple[np.ndarray, np.ndarray, int]):
+        train, valid, used = result
+        counts["items_used"] += used
+        for rows, files, name in ((train, train_files, "train"), (valid, valid_files, "valid")):
+            if len(rows):
+                path = os.path.join(work_dir, f"{appid}-{index:06d}-{name}.npy")
+                np.save(path, rows)
+                files.append(path)
+                counts[f"{name}_rows"] += len(rows)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        pending = {}
+        for index, items in enumerate(iter_history_chunks(database, appid, chunk_items, limit, fingerprint)):
+            counts["items"] += len(items)
+            pending[executor.submit(extract_chunk, items, validation_days)] = index
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(pending.pop(future), future.result())
+        for future in list(pending):
+            collect(pending.pop(future), future.result())
+
+    # Completion order varies between runs; training always reads chunks in catalog order.
+    return ExtractionStats(train_files=sorted(train_files), valid_files=sorted(valid_files),
+                           fingerprint=fingerprint.hexdigest(), seconds=time.perf_counter() - started, **counts)
+
+
+class ChunkIter(xgb.DataIter):
+    """Feeds saved ``.npy`` chunks to XGBoost one at a time."""
+
+    def __init__(self, files: List[str]):
+        self._files = files
+        self._position = 0
+        super().__init__()
+
+    def next(self, input_data: Callable) -> bool:
+        if self._position == len(self._files):
+            return False
+        rows = np.load(self._files[self._position])
+        input_data(data=rows[:, :-1], label=rows[:, -1])
+        self._position += 1
+        return True
+
+    def reset(self):
+        self._position = 0
+
+
+def _rmse(booster: xgb.Booster, files: List[str]) -> Tuple[float, float]:
+    """RMSE of the model and of a "no change" forecast, streamed chunk by chunk."""
+    squared, naive_squared, count = 0.0, 0.0, 0
+    for path in files:
+        rows = np.load(path)
+        predicted = booster.inplace_predict(rows[:, :-1])
+        squared += float(np.sum((predicted - rows[:, -1]) ** 2))
+        naive_squared += float(np.sum(rows[:, -1].astype(np.float64) ** 2))
+        count += len(rows)
+    if not count:
+        return float("nan"), float("nan")
+    return float(np.sqrt(squared / count)), float(np.sqrt(naive_squared / count))
+
+
+def train_model(stats: ExtractionStats, threads: int,
+                num_boost_round: int = NUM_BOOST_ROUND) -> Tuple[xgb.Booster, Dict[str, Any]]:
+    started = time.perf_counter()
+    params = dict(TRAIN_PARAMS, nthread=threads)
+    dtrain = xgb.QuantileDMatrix(ChunkIter(stats.train_files), max_bin=params["max_bin"], nthread=threads)
+    evals = [(dtrain, "train")]
+    if stats.valid_files:
+        evals.append((xgb.QuantileDMatrix(ChunkIter(stats.valid_files), ref=dtrain, nthread=threads), "valid"))
+    history: Dict[str, Dict[str, List[float]]] = {}
+    booster = xgb.train(params, dtrain, num_boost_round=num_boost_round, evals=evals, evals_result=history,
+                        verbose_eval=False)
+    valid_rmse, naive_valid_rmse = _rmse(booster, stats.valid_files)
+    return booster, {
+        "params": params,
+        "num_boost_round": num_boost_round,
+        "train_rmse": history["train"]["rmse"][-1],
+        "valid_rmse": valid_rmse,
+        "naive_valid_rmse": naive_valid_rmse,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def write_artifact(booster: xgb.Booster, appid: str, metadata: Dict[str, Any], models_dir: str = MODELS_DIR,
+                   promote: bool = False) -> str:
+    """``<models_dir>/<appid>/<version>/`` with the portable JSON model, the joblib file the API loads and metadata."""
+    directory = os.path.join(models_dir, appid, metadata["version"])
+    os.makedirs(directory)
+    json_path = os.path.join(directory, "model.json")
+    booster.save_model(json_path)
+
+    # The API unpickles an XGBRegressor; loading the saved JSON restores one without refitting.
+    model = xgb.XGBRegressor()
+    model.load_model(json_path)
+    joblib_path = os.path.join(directory, f"xgboost_model_{appid}.joblib")
+    joblib.dump(model, joblib_path)
+
+    with open(os.path.join(directory, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
+
+    if promote:
+        active_path = os.path.join(BASE_DIR, f"xgboost_model_{appid}.joblib")
+        staged_path = f"{active_path}.tmp"
+        shutil.copyfile(joblib_path, staged_path)
+        os.replace(staged_path, active_path)
+        logger.info(f"Promoted model {appid} {metadata['version']} to {active_path}")
+    return directory
+
+
+def train_appid(database: str, appid: str, workers: int, threads: int, chunk_items: int, validation_days: int,
+                limit: Optional[int], num_boost_round: int, models_dir: str, promote: bool) -> Optional[str]:
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    with tempfile.TemporaryDirectory(prefix=f"training-{appid}-") as work_dir:
+        stats = extract_features(database, appid, work_dir, workers, chunk_items, validation_days, limit)
+        logger.info(f"Extracted {stats.train_rows} train and {stats.valid_rows} validation rows from "
+                    f"{stats.items_used}/{stats.items} items for appid {appid} in {stats.seconds:.1f}s")
+        if not stats.train_files:
+            logger.error(f"No usable training rows for appid {appid}")
+            return None
+        booster, training = train_model(stats, threads, num_boost_round)
+
+    metadata = {
+        "appid": appid,
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "features": FEATURES,
+        "target": "next day pct_change_1d",
+        "xgboost_version": xgb.__version__,
+        "data": {
+            "database": os.path.abspath(database),
+            "fingerprint": stats.fingerprint,
+            "items": stats.items,
+            "items_used": stats.items_used,
+            "train_rows": stats.train_rows,
+            "valid_rows": stats.valid_rows,
+            "validation_days": validation_days,
+            "limit": limit,
+        },
+        "extract_seconds": round(stats.seconds, 3),
+        "training": training,
+    }
+    directory = write_artifact(booster, appid, metadata, models_dir, promote)
+    logger.info(f"Model {appid} {version}: valid RMSE {training['valid_rmse']:.4f} "
+                f"(no-change {training['naive_valid_rmse']:.4f}), trained in {training['seconds']:.1f}s -> {directory}")
+    return directory
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Train the price models from stored histories")
+    parser.add_argument("--database", default="favorites.db", help="SQLite file with the history_cache table")
+    parser.add_argument("--appids", nargs="+", choices=APPIDS, default=list(APPIDS))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="feature extraction processes")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="XGBoost training threads")
+    parser.add_argument("--chunk-items", type=int, default=CHUNK_ITEMS)
+    parser.add_argument("--validation-days", type=int, default=VALIDATION_DAYS)
+    parser.add_argument("--limit", type=int, help="at most this many items per appid, keeps the run time bounded")
+    parser.add_argument("--num-boost-round", type=int, default=NUM_BOOST_ROUND)
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("--promote", action="store_true", help="install the new model where the API loads it")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    failed = False
+    for appid in args.appids:
+        directory = train_appid(args.database, appid, args.workers, args.threads, args.chunk_items,
+                                args.validation_days, args.limit, args.num_boost_round, args.models_dir,
+                                args.promote)
+        failed |= directory is None
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+import heapq
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from auth.analytics import VOLATILITY_WINDOW, aggregate_daily
+from auth.cache import get_bus, run_in_background
+from auth.history_store import parse_label
+
+logger = logging.getLogger(__name__)
+
+BOARD_SIZE = 50
+# Calendar days aggregated per item: enough for the volatility window and the 7-day comparisons.
+TAIL_DAYS = VOLATILITY_WINDOW
+MIN_PRICE = 0.10
+MIN_VOLUME_7D = 10
+
+
+class ItemTrend(NamedTuple):
+    market_hash_name: str
+    price: float
+    change_1d: Optional[float]
+    change_7d: Optional[float]
+    volume_7d: float
+    volume_change: Optional[float]
+    volatility_30d: Optional[float]
+    updated_at: float
+
+
+def _liquid(trend: "ItemTrend") -> bool:
+    return trend.price >= MIN_PRICE and trend.volume_7d >= MIN_VOLUME_7D
+
+
+BOARDS = {
+    # name: (score, eligible)
+    "gainers": (lambda trend: trend.change_7d,
+                lambda trend: _liquid(trend) and trend.change_7d is not None and trend.change_7d > 0),
+    "losers": (lambda trend: -trend.change_7d,
+               lambda trend: _liquid(trend) and trend.change_7d is not None and trend.change_7d < 0),
+    "most_traded": (lambda trend: trend.volume_7d, _liquid),
+}
+
+
+def init_trending(database: str):
+    conn = sqlite3.connect(database, timeout=30)
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS item_trends (
+            appid TEXT NOT NULL,
+            market_hash_name TEXT NOT NULL,
+            price REAL NOT NULL,
+            change_1d REAL,
+            change_7d REAL,
+            volume_7d REAL NOT NULL,
+            volume_change REAL,
+            volatility_30d REAL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (appid, market_hash_name)
+        )
+    """)
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(item_trends)")}
+    if "volatility_30d" not in columns:
+        cursor.execute("ALTER TABLE item_trends ADD COLUMN volatility_30d REAL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_item_trends_updated_at ON item_trends(appid, updated_at)")
+
+    conn.commit()
+    conn.close()
+
+
+def _ratio(new: float, old: float) -> Optional[float]:
+    return round(new / old - 1, 4) if old else None
+
+
+def recent_points(history: List[List], days: int) -> List[List]:
+    """The points of the last ``days`` days before the latest one, plus the last point before them.
+
+    That point is the close of the day the window starts from, so the daily
+    series of the tail matches the tail of the whole history's daily series.
+    """
+    last_day = None
+    for index in range(len(history) - 1, -1, -1):
+        try:
+            day = parse_label(history[index][0])[0]
+        except (KeyError, ValueError, TypeError, IndexError):
+            continue
+        if last_day is None:
+            last_day = day
+        elif day < last_day - days:
+            return history[index:]
+    return history
+
+
+def compute_trend(market_hash_name: str, history: List[List]) -> Optional[ItemTrend]:
+    daily = aggregate_daily(recent_points(history, TAIL_DAYS))
+    if daily.empty:
+        return None
+    price = daily["price"].to_numpy(dtype=float)
+    volume = daily["volume"].to_numpy(dtype=float)
+    volume_7d = float(volume[-7:].sum())
+    # Same definition as the analytics indicator: std of daily log returns, at least 5 of them.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_returns = np.diff(np.log(price[-(VOLATILITY_WINDOW + 1):]))
+    log_returns = log_returns[np.isfinite(log_returns)]
+    return ItemTrend(
+        market_hash_name=market_hash_name,
+        price=float(price[-1]),
+        change_1d=_ratio(price[-1], price[-2]) if len(price) > 1 else None,
+        change_7d=_ratio(price[-1], price[-8]) if len(price) > 7 else None,
+        volume_7d=volume_7d,
+        volume_change=_ratio(volume_7d, float(volume[-14:-7].sum())) if len(volume) > 7 else None,
+        volatility_30d=round(float(log_returns.std(ddof=1)), 4) if len(log_returns) >= 5 else None,
+        updated_at=time.time(),
+    )
+
+
+class Leaderboard:
+    """Top ``size`` items by one score, kept as a bounded min-heap.
+
+    A new or improved score is applied in place. When an item already on the
+    board gets worse, a better candidate may now be off the board, so the board
+    is marked dirty and its owner rebuilds it from all trends off the read path.
+    ``ranked`` only ever returns the cached ranking.
+    """
+
+    def __init__(self, score, eligible, size: int = BOARD_SIZE):
+        self.score = score
+        self.eligible = eligible
+        self.size = size
+        self._heap: List[Tuple[float, str]] = []
+        self._scores: Dict[str, float] = {}
+        self._dirty = False
+        self._ranked: Optional[List[str]] = None
+
+    def update(self, trend: ItemTrend):
+        name = trend.market_hash_name
+        score = self.score(trend) if self.eligible(trend) else None
+        on_board = self._scores.get(name)
+        if on_board is not None:
+            if score is None or score < on_board:
+                self._dirty = True
+                return
+            self._scores[name] = score
+            self._heap = [(s, n) if n != name else (score, name) for s, n in self._heap]
+            heapq.heapify(self._heap)
+        elif score is not None:
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, (score, name))
+            elif score > self._heap[0][0]:
+                _, evicted = heapq.heapreplace(self._heap, (score, name))
+                del self._scores[evicted]
+            else:
+                return
+            self._scores[name] = score
+        else:
+            return
+        self._ranked = None
+
+    def rebuild(self, trends: Dict[str, ItemTrend]):
+        candidates = ((self.score(trend), name) for name, trend in trends.items() if self.eligible(trend))
+        self._heap = heapq.nlargest(self.size, candidates)
+        heapq.heapify(self._heap)
+        self._scores = {name: score for score, name in self._heap}
+        self._dirty = False
+        self._ranked = None
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def ranked(self) -> List[str]:
+        if self._ranked is None:
+            self._ranked = [name for _, name in sorted(self._heap, reverse=True)]
+        return self._ranked
+
+
+class TrendingEngine:
+    """Per-appid trend stats in SQLite plus in-memory leaderboards.
+
+    Other workers' updates are picked up on read with one indexed query for
+    rows newer than the last one seen. Dirty boards are rebuilt by ``update``,
+    or by a background job when a read finds them, never by ``top`` itself.
+    """
+
+    def __init__(self, database: str, size: int = BOARD_SIZE):
+        self.bus = get_bus(database)
+        self.size = size
+        self._trends: Dict[str, Dict[str, ItemTrend]] = {}
+        self._boards: Dict[str, Dict[str, Leaderboard]] = {}
+        self._seen_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _appid_state(self, appid: str) -> Tuple[Dict[str, ItemTrend], Dict[str, Leaderboard]]:
+        if appid not in self._trends:
+            self._trends[appid] = {}
+            self._boards[appid] = {name: Leaderboard(score, eligible, self.size)
+                                   for name, (score, eligible) in BOARDS.items()}
+            self._seen_at[appid] = 0.0
+        return self._trends[appid], self._boards[appid]
+
+    def _apply(self, appid: str, trend: ItemTrend):
+        trends, boards = self._appid_state(appid)
+        trends[trend.market_hash_name] = trend
+        for board in boards.values():
+            board.update(trend)
+        self._seen_at[appid] = max(self._seen_at[appid], trend.updated_at)
+
+    def _sync(self, appid: str):
+        self._appid_state(appid)
+        conn = self.bus.connection()
+        rows = conn.execute(
+            "SELECT market_hash_name, price, change_1d, change_7d, volume_7d, volume_change, volatility_30d, "
+            "updated_at "
+            "FROM item_trends WHERE appid = ? AND updated_at > ? ORDER BY updated_at",
+            (appid, self._seen_at[appid])).fetchall()
+        for row in rows:
+            self._apply(appid, ItemTrend(*row))
+
+    def update(self, appid: str, market_hash_name: str, history: List[List]) -> Optional[ItemTrend]:
+        trend = compute_trend(market_hash_name, history)
+        if trend is None:
+            return None
+        conn = self.bus.connection()
+        with conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO item_trends
+                    (appid, market_hash_name, price, change_1d, change_7d, volume_7d, volume_change,
+                     volatility_30d, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (appid, *trend[:-1], trend.updated_at))
+        with self._lock:
+            self._sync(appid)
+            self._rebuild_dirty(appid)
+        return trend
+
+    def _rebuild_dirty(self, appid: str):
+        trends, boards = self._appid_state(appid)
+        for board in boards.values():
+            if board.dirty:
+                board.rebuild(trends)
+
+    def rebuild(self, appid: str):
+        with self._lock:
+            self._rebuild_dirty(appid)
+
+    def has(self, appid: str, market_hash_name: str) -> bool:
+        with self._lock:
+            self._sync(appid)
+            return market_hash_name in self._trends[appid]
+
+    def top(self, appid: str, limit: int = 10) -> Dict[str, Any]:
+        with self._lock:
+            self._sync(appid)
+            trends, boards = self._appid_state(appid)
+            dirty = any(board.dirty for board in boards.values())
+            result = {
+                board_name: [trends[name]._asdict() for name in board.ranked()[:limit]]
+                for board_name, board in boards.items()
+            }
+        if dirty:
+            # Another worker's update pushed an item down; serve the cached ranking meanwhile.
+            run_in_background(("trending", appid), lambda: self.rebuild(appid))
+        return result
+
+    def tracked(self, appid: str) -> int:
+        with self._lock:
+            return len(self._trends.get(appid, {}))
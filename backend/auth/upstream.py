@@ -0,0 +1,334 @@
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, NamedTuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from auth.metrics import (upstream_requests, upstream_request_duration, upstream_queue_depth, upstream_in_flight,
+                          upstream_queue_wait)
+
+logger = logging.getLogger(__name__)
+
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_COOLDOWN_SECONDS = 60
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+
+class PriorityBudget(NamedTuple):
+    max_in_flight: int
+    rate: float  # requests per second
+    burst: int
+
+
+# Classes in pre-emption order: queued calls of an earlier class always start first.
+PRIORITY_BUDGETS = {
+    INTERACTIVE: PriorityBudget(max_in_flight=16, rate=20.0, burst=20),
+    BACKGROUND: PriorityBudget(max_in_flight=4, rate=4.0, burst=4),
+}
+MAX_IN_FLIGHT = 16
+QUEUE_TIMEOUT_SECONDS = 30
+
+# Sends every upstream call to a local stand-in (benchmarks/fake_upstream.py)
+# as <override>/<original host><path>, e.g. for load tests.
+UPSTREAM_OVERRIDE_URL = os.getenv("UPSTREAM_OVERRIDE_URL")
+
+session = requests.Session()
+# One immediate retry when the connection could not be opened, nothing else:
+# 429/5xx go back to the caller, so the breaker counts every one of them and the
+# stale cache entry is served instead of holding a scheduler slot through backoff.
+# raise_on_status=False: a response is never turned into RetryError, so its real
+# status code is what upstream_requests_total records.
+retries = Retry(total=1, connect=1, read=0, status=0, other=0, backoff_factor=0, raise_on_status=False)
+session.mount("https://", HTTPAdapter(max_retries=retries))
+session.mount("http://", HTTPAdapter(max_retries=retries))
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    pass
+
+
+class UpstreamBusyError(requests.exceptions.RequestException):
+    pass
+
+
+_priority: ContextVar[str] = ContextVar("upstream_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def upstream_priority(priority: str):
+    """Run upstream calls made in this context (and thread) under ``priority``."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class UpstreamScheduler:
+    """Admission control for upstream calls by priority class.
+
+    Each class has its own concurrency cap and token-bucket rate, and all
+    classes share ``max_in_flight``. Calls start in FIFO order within a class,
+    and a lower class never starts while a higher one has calls queued, so
+    background work only gets the capacity interactive traffic leaves over.
+    """
+
+    def __init__(self, budgets: Dict[str, PriorityBudget], max_in_flight: int):
+        self.budgets = budgets
+        self.max_in_flight = max_in_flight
+        self._order = list(budgets)
+        self._cond = threading.Condition()
+        self._queues: Dict[str, deque] = {priority: deque() for priority in budgets}
+        self._in_flight = {priority: 0 for priority in budgets}
+        self._started = {priority: 0 for priority in budgets}
+        self._rejected = {priority: 0 for priority in budgets}
+        now = time.monotonic()
+        self._tokens = {priority: float(budget.burst) for priority, budget in budgets.items()}
+        self._refilled_at = {priority: now for priority in budgets}
+
+    def _refill(self, priority: str, now: float):
+        budget = self.budgets[priority]
+        elapsed = now - self._refilled_at[priority]
+        self._tokens[priority] = min(float(budget.burst), self._tokens[priority] + elapsed * budget.rate)
+        self._refilled_at[priority] = now
+
+    def _wait_time(self, priority: str, ticket: object, now: float):
+        """0 when ``ticket`` may start, seconds until the next rate token, or None while it waits for a slot."""
+        if self._queues[priority][0] is not ticket:
+            return None
+        if any(self._queues[higher] for higher in self._order[:self._order.index(priority)]):
+            return None
+        if (sum(self._in_flight.values()) >= self.max_in_flight
+                or self._in_flight[priority] >= self.budgets[priority].max_in_flight):
+            return None
+        self._refill(priority, now)
+        if self._tokens[priority] < 1:
+            return (1 - self._tokens[priority]) / self.budgets[priority].rate
+        return 0
+
+    def _publish(self, priority: str):
+        upstream_queue_depth.set(len(self._queues[priority]), priority=priority)
+        upstream_in_flight.set(self._in_flight[priority], priority=priority)
+
+    def acquire(self, priority: str, timeout: float = QUEUE_TIMEOUT_SECONDS) -> float:
+        """Block until a call of ``priority`` may start; returns the time spent queued."""
+        ticket = object()
+        started = time.monotonic()
+        with self._cond:
+            queue = self._queues[priority]
+            queue.append(ticket)
+            self._publish(priority)
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(priority, ticket, now)
+                if wait == 0:
+                    break
+                remaining = started + timeout - now
+                if remaining <= 0:
+                    queue.remove(ticket)
+                    self._rejected[priority] += 1
+                    self._publish(priority)
+                    self._cond.notify_all()
+                    raise UpstreamBusyError(f"No {priority} upstream slot within {timeout}s")
+                self._cond.wait(remaining if wait is None else min(wait, remaining))
+
+            queue.popleft()
+            self._tokens[priority] -= 1
+            self._in_flight[priority] += 1
+            self._started[priority] += 1
+            self._publish(priority)
+            # The next queued call may be able to start as well.
+            self._cond.notify_all()
+        waited = time.monotonic() - started
+        upstream_queue_wait.observe(waited, priority=priority)
+        return waited
+
+    def release(self, priority: str):
+        with self._cond:
+            self._in_flight[priority] -= 1
+            self._publish(priority)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: str):
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._cond:
+            return {priority: {
+                "queued": len(self._queues[priority]),
+                "in_flight": self._in_flight[priority],
+                "started": self._started[priority],
+                "rejected": self._rejected[priority],
+                "max_in_flight": budget.max_in_flight,
+                "rate": budget.rate,
+            } for priority, budget in self.budgets.items()}
+
+
+scheduler = UpstreamScheduler(PRIORITY_BUDGETS, MAX_IN_FLIGHT)
+
+
+class CircuitBreaker:
+    """Stops calling an upstream host after repeated failures for a cool-down period.
+
+    After the cool-down a single trial request is let through (half-open); its
+    outcome either closes the circuit again or restarts the cool-down.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 cooldown: float = BREAKER_COOLDOWN_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+        raise CircuitOpenError(f"Circuit for {self.name} is open, skipping upstream call")
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"Circuit for {self.name} closed")
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._trial_in_flight:
+                    logger.warning(f"Circuit for {self.name} opened for {self.cooldown}s after {self.failures} failures")
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(host: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = breakers.get(host)
+        if breaker is None:
+            breaker = breakers[host] = CircuitBreaker(host)
+        return breaker
+
+
+def is_failure_status(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+def resolve_url(url: str) -> str:
+    if not UPSTREAM_OVERRIDE_URL:
+        return url
+    parts = urlsplit(url)
+    resolved = f"{UPSTREAM_OVERRIDE_URL.rstrip('/')}/{parts.hostname}{parts.path}"
+    return f"{resolved}?{parts.query}" if parts.query else resolved
+
+
+def _release_on_close(response: requests.Response, priority: str):
+    # The body of a streamed response is still being downloaded, so the slot is held until
+    # the caller closes it (``with`` does), or until the response is garbage collected.
+    release = weakref.finalize(response, scheduler.release, priority)
+    close = response.close
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            release()
+
+    response.close = close_and_release
+
+
+def upstream_request(method: str, url: str, **kwargs) -> requests.Response:
+    host = urlsplit(url).hostname or url
+    priority = _priority.get()
+    try:
+        scheduler.acquire(priority)
+    except UpstreamBusyError:
+        upstream_requests.inc(host=host, status="queue_timeout")
+        raise
+
+    try:
+        breaker = get_breaker(host)
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            upstream_requests.inc(host=host, status="circuit_open")
+            raise
+
+        started = time.perf_counter()
+        try:
+            response = session.request(method, resolve_url(url), **kwargs)
+        except requests.exceptions.RequestException:
+            upstream_request_duration.observe(time.perf_counter() - started, host=host)
+            upstream_requests.inc(host=host, status="error")
+            breaker.record_failure()
+            raise
+    except BaseException:
+        scheduler.release(priority)
+        raise
+    if kwargs.get("stream"):
+        _release_on_close(response, priority)
+    else:
+        scheduler.release(priority)
+    upstream_request_duration.observe(time.perf_counter() - started, host=host)
+    upstream_requests.inc(host=host, status=response.status_code)
+
+    if is_failure_status(response.status_code):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+def upstream_get(url: str, **kwargs) -> requests.Response:
+    return upstream_request("GET", url, **kwargs)
+
+
+def upstream_post(url: str, **kwargs) -> requests.Response:
+    return upstream_request("POST", url, **kwargs)
+
+
+def breaker_states() -> Dict[str, str]:
+    with _breakers_lock:
+        return {host: breaker.state for host, breaker in breakers.items()}
+
+
+def scheduler_stats() -> Dict[str, Dict[str, Any]]:
+    return scheduler.stats()
@@ -0,0 +1,90 @@
+import warnings
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+
+def item_type(properties: Dict[str, Any]) -> str:
+    return properties.get("type") or properties.get("slot") or "Other"
+
+
+def price_frame(names: Iterable[str], book_prices: Dict[str, Dict[str, float]],
+                steam_prices: Dict[str, float]) -> pd.DataFrame:
+    """One column per source plus ``reference``: Steam if known, else the median of the marketplaces."""
+    names = pd.Index(names)
+    series = names.to_series()
+    prices = pd.DataFrame({"steam": series.map(steam_prices)}, index=names)
+    for source, source_prices in book_prices.items():
+        prices[source] = series.map(source_prices)
+    prices = prices.astype(float)
+
+    books = prices.drop(columns="steam").to_numpy()
+    with np.errstate(all="ignore"), warnings.catch_warnings():
+        # Items without book prices are all-NaN rows; their median is NaN.
+        warnings.simplefilter("ignore", RuntimeWarning)
+        book_median = np.nanmedian(books, axis=1) if books.shape[1] else np.full(len(names), np.nan)
+    prices["reference"] = prices["steam"].fillna(pd.Series(book_median, index=names))
+    return prices
+
+
+def value_inventory(items: List[Dict[str, Any]], book_prices: Dict[str, Dict[str, float]],
+                    steam_prices: Dict[str, float], top: int = 10) -> Dict[str, Any]:
+    """Prices a classified inventory against every source at once.
+
+    Identical items are grouped first, each source is one dict lookup over the
+    grouped names (see ``price_frame`` for the reference price).
+    """
+    if not items:
+        return {"item_count": 0, "priced_count": 0, "total_value": 0.0, "by_source": {},
+                "by_rarity": [], "by_type": [], "top_holdings": []}
+
+    frame = pd.DataFrame({
+        "market_hash_name": [item["market_hash_name"] for item in items],
+        "name": [item["name"] for item in items],
+        "icon_url": [item["icon_url"] for item in items],
+        "rarity": [item["properties"].get("rarity") or "Other" for item in items],
+        "type": [item_type(item["properties"]) for item in items],
+    })
+    grouped = frame.groupby("market_hash_name", sort=False).agg(
+        name=("name", "first"), icon_url=("icon_url", "first"), rarity=("rarity", "first"),
+        type=("type", "first"), count=("name", "size"))
+
+    prices = price_frame(grouped.index, book_prices, steam_prices)
+    grouped["price"] = prices.pop("reference")
+    grouped["value"] = grouped["price"] * grouped["count"]
+
+    counts = grouped["count"]
+    by_source = {}
+    for source in prices.columns:
+        priced = prices[source].notna()
+        by_source[source] = {
+            "total": round(float((prices[source] * counts).sum()), 2),
+            "priced_items": int(counts[priced].sum()),
+        }
+
+    def breakdown(column: str) -> List[Dict[str, Any]]:
+        totals = grouped.groupby(column).agg(value=("value", "sum"), count=("count", "sum"))
+        totals = totals.sort_values("value", ascending=False)
+        return [{column: key, "value": round(float(value), 2), "count": int(count)}
+                for key, value, count in totals.itertuples()]
+
+    holdings = grouped[grouped["value"].notna()].nlargest(top, "value")
+    top_holdings = [{
+        "market_hash_name": market_hash_name,
+        "name": row["name"],
+        "icon_url": row["icon_url"],
+        "count": int(row["count"]),
+        "price": round(float(row["price"]), 2),
+        "value": round(float(row["value"]), 2),
+    } for market_hash_name, row in holdings.iterrows()]
+
+    return {
+        "item_count": int(counts.sum()),
+        "priced_count": int(counts[grouped["price"].notna()].sum()),
+        "total_value": round(float(grouped["value"].sum()), 2),
+        "by_source": by_source,
+        "by_rarity": breakdown("rarity"),
+        "by_type": breakdown("type"),
+        "top_holdings": top_holdings,
+    }
@@ -0,0 +1,249 @@
+"""Offline backtest of the price models over stored item histories.
+
+Run from the ``backend`` directory::
+
+    python -m benchmarks.backtest                                # histories in favorites.db
+    python -m benchmarks.backtest --synthetic 200 --workers 4    # seeded fixture catalog
+    python -m benchmarks.backtest --horizons 1 7 --step 3 --save backtest.json
+
+Every item is replayed at rolling cut-off days: the history up to the cut-off
+goes through ``prepare_prediction_data`` and ``predict_price`` exactly as
+``/predict_price`` does, and each forecast horizon is scored against the
+daily price that was actually recorded. Items are spread over a process pool.
+Errors are reported per appid, horizon and price bucket next to a naive
+"price stays the same" forecast, together with items/sec throughput.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import fixtures
+from auth.analytics import HISTORY_DATE_FORMAT, aggregate_daily
+from auth.history_store import init_history_tiers, load_rollups, merge_history
+from auth.prediction import predict_price, prepare_prediction_data
+from auth.serialization import decode_value
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "auth")
+APPIDS = ("730", "570")
+PRICE_BUCKETS = [0, 1, 10, 100, float("inf")]
+PRICE_BUCKET_LABELS = ["<1", "1-10", "10-100", "100+"]
+
+# (appid, horizon, last known price, predicted price, actual price)
+Record = Tuple[str, int, float, float, float]
+
+_models: Dict[str, Any] = {}
+
+
+def _init_worker(model_dir: str, appids: List[str]):
+    import joblib
+    # Cut-offs with too little history are expected and counted as skipped.
+    logging.getLogger("auth.prediction").setLevel(logging.CRITICAL)
+    for appid in appids:
+        _models[appid] = joblib.load(os.path.join(model_dir, f"xgboost_model_{appid}.joblib"))
+
+
+def load_histories(database: str, appids: List[str], limit: Optional[int]) -> List[Tuple[str, str, List[List]]]:
+    init_history_tiers(database)
+    conn = sqlite3.connect(database)
+    items = []
+    for appid in appids:
+        query = "SELECT cache_key, history_data FROM history_cache WHERE cache_key LIKE ? ORDER BY cache_key"
+        params: tuple = (f"{appid}:%",)
+        if limit:
+            query += " LIMIT ?"
+            params += (limit,)
+        rows = conn.execute(query, params).fetchall()
+        rollups = load_rollups(conn, [cache_key for cache_key, _ in rows])
+        for cache_key, stored in rows:
+            history = merge_history(rollups.get(cache_key, []), decode_value(stored))
+            if history:
+                items.append((appid, cache_key.split(":", 1)[1], history))
+    conn.close()
+    return items
+
+
+def synthetic_histories(appids: List[str], count: int, points: int) -> List[Tuple[str, str, List[List]]]:
+    """Seeded fixture walks rescaled across price levels so every bucket is populated."""
+    items = []
+    for appid in appids:
+        for index in range(count):
+            seed = int(appid) * 100000 + index
+            scale = 10 ** random.Random(seed).uniform(-1.8, 1.2)
+            history = [[timestamp, round(price * scale, 3), volume]
+                       for timestamp, price, volume in fixtures.history(points, seed=seed)]
+            items.append((appid, f"synthetic #{index}", history))
+    return items
+
+
+def cutoff_days(daily: pd.Series, horizons: List[int], warmup: int, step: int,
+                max_cutoffs: Optional[int]) -> pd.DatetimeIndex:
+    if daily.empty:
+        return pd.DatetimeIndex([])
+    first = daily.index[0] + pd.Timedelta(days=warmup)
+    last = daily.index[-1] - pd.Timedelta(days=max(horizons))
+    if first > last:
+        return pd.DatetimeIndex([])
+    # Anchored on the last usable day so the most recent cut-off is always scored.
+    cutoffs = pd.DatetimeIndex(sorted(last - pd.Timedelta(days=offset)
+                                      for offset in range(0, (last - first).days + 1, step)))
+    return cutoffs[-max_cutoffs:] if max_cutoffs else cutoffs
+
+
+def backtest_item(item: Tuple[str, str, List[List]], horizons: List[int], warmup: int, step: int,
+                  max_cutoffs: Optional[int]) -> Tuple[List[Record], int, float]:
+    """Scored forecasts of one item, the number of skipped cut-offs and the CPU time spent."""
+    started = time.process_time()
+    appid, _, history = item
+    model = _models[appid]
+    daily = aggregate_daily(history)["price"]
+    days = pd.to_datetime([point[0] for point in history], format=HISTORY_DATE_FORMAT, errors="coerce").normalize()
+
+    records: List[Record] = []
+    skipped = 0
+    horizon = max(horizons)
+    for cutoff in cutoff_days(daily, horizons, warmup, step, max_cutoffs):
+        prefix = [point for point, day in zip(history, days) if day <= cutoff]
+        data = prepare_prediction_data(prefix)
+        if data is None:
+            skipped += 1
+            continue
+        forecast = predict_price(model, data, horizon)
+
+        # predicted_price is rounded to cents for display; compounding the daily
+        # changes keeps sub-dollar items comparable.
+        last_price = float(data["price"].iloc[-1])
+        path = last_price * np.cumprod([1 + point["predicted_pct_change"] / 100
+                                        for point in forecast["predictions"]])
+        for h in horizons:
+            actual = daily.get(cutoff + pd.Timedelta(days=h))
+            if actual is not None and not np.isnan(actual) and actual > 0:
+                records.append((appid, h, last_price, float(path[h - 1]), float(actual)))
+    return records, skipped, time.process_time() - started
+
+
+def summarize(records: List[Record]) -> pd.DataFrame:
+    frame = pd.DataFrame(records, columns=["appid", "horizon", "last_price", "predicted", "actual"])
+    frame["bucket"] = pd.cut(frame["last_price"], PRICE_BUCKETS, labels=PRICE_BUCKET_LABELS, right=False)
+    error = frame["predicted"] - frame["actual"]
+    frame["abs_error"] = error.abs()
+    frame["squared_error"] = error ** 2
+    frame["error_pct"] = error / frame["actual"] * 100
+    frame["ape"] = frame["abs_error"] / frame["actual"] * 100
+    frame["naive_ape"] = (frame["last_price"] - frame["actual"]).abs() / frame["actual"] * 100
+    frame["direction_hit"] = (np.sign(frame["predicted"] - frame["last_price"])
+                              == np.sign(frame["actual"] - frame["last_price"]))
+
+    overall = frame.assign(bucket="all")
+    combined = pd.concat([frame.assign(bucket=frame["bucket"].astype(str)), overall])
+    summary = combined.groupby(["appid", "horizon", "bucket"]).agg(
+        n=("ape", "size"),
+        mae=("abs_error", "mean"),
+        rmse=("squared_error", lambda values: float(np.sqrt(values.mean()))),
+        mape=("ape", "mean"),
+        bias_pct=("error_pct", "mean"),
+        direction_hit=("direction_hit", "mean"),
+        naive_mape=("naive_ape", "mean"),
+    )
+    order = {label: index for index, label in enumerate(PRICE_BUCKET_LABELS + ["all"])}
+    return summary.reset_index().sort_values(
+        ["appid", "horizon", "bucket"], key=lambda column: column.map(order) if column.name == "bucket" else column)
+
+
+def print_summary(summary: pd.DataFrame):
+    header = (f"{'appid':<6} {'horizon':>7} {'bucket':>7} {'n':>7} {'MAE':>9} {'RMSE':>9} {'MAPE %':>8} "
+              f"{'naive %':>8} {'bias %':>8} {'dir hit':>8}")
+    print(header)
+    print("-" * len(header))
+    for row in summary.itertuples(index=False):
+        print(f"{row.appid:<6} {row.horizon:>7} {row.bucket:>7} {row.n:>7} {row.mae:>9.3f} {row.rmse:>9.3f} "
+              f"{row.mape:>8.2f} {row.naive_mape:>8.2f} {row.bias_pct:>+8.2f} {row.direction_hit:>8.1%}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Backtest the price models over stored histories")
+    parser.add_argument("--database", default="favorites.db", help="SQLite file with the history_cache table")
+    parser.add_argument("--synthetic", type=int, help="backtest this many seeded fixture items per appid instead")
+    parser.add_argument("--points", type=int, default=2000, help="hourly points per synthetic history")
+    parser.add_argument("--appids", nargs="+", choices=APPIDS, default=list(APPIDS))
+    parser.add_argument("--limit", type=int, help="at most this many stored items per appid")
+    parser.add_argument("--horizons", nargs="+", type=int, default=[1, 7, 14])
+    parser.add_argument("--warmup", type=int, default=14, help="days of history before the first cut-off")
+    parser.add_argument("--step", type=int, default=7, help="days between cut-offs")
+    parser.add_argument("--max-cutoffs", type=int, help="only the most recent N cut-offs per item")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunksize", type=int, default=4)
+    parser.add_argument("--model-dir", default=MODELS_DIR)
+    parser.add_argument("--save", help="write the summary and throughput to this JSON file")
+    args = parser.parse_args(argv)
+
+    for appid in args.appids:
+        path = os.path.join(args.model_dir, f"xgboost_model_{appid}.joblib")
+        if not os.path.exists(path):
+            print(f"Model not found: {path}", file=sys.stderr)
+            return 2
+
+    if args.synthetic:
+        items = synthetic_histories(args.appids, args.synthetic, args.points)
+    else:
+        items = load_histories(args.database, args.appids, args.limit)
+    if not items:
+        print(f"No histories to backtest in {args.database}; use --synthetic N for fixture data", file=sys.stderr)
+        return 1
+
+    horizons = sorted(set(args.horizons))
+    job = partial(backtest_item, horizons=horizons, warmup=args.warmup, step=args.step,
+                  max_cutoffs=args.max_cutoffs)
+    records: List[Record] = []
+    skipped = 0
+    cpu_seconds = 0.0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.model_dir, args.appids)) as executor:
+        for item_records, item_skipped, item_cpu in executor.map(job, items, chunksize=args.chunksize):
+            records += item_records
+            skipped += item_skipped
+            cpu_seconds += item_cpu
+    elapsed = time.perf_counter() - started
+
+    forecasts = len(records) // len(horizons)
+    throughput = {
+        "items": len(items),
+        "forecasts": forecasts,
+        "skipped_cutoffs": skipped,
+        "workers": args.workers,
+        "wall_seconds": round(elapsed, 3),
+        "cpu_seconds": round(cpu_seconds, 3),
+        "items_per_sec": round(len(items) / elapsed, 2),
+        "forecasts_per_sec": round(forecasts / elapsed, 2),
+    }
+    if not records:
+        print("No cut-off produced a scored forecast; try a smaller --warmup or more history", file=sys.stderr)
+        return 1
+
+    summary = summarize(records)
+    print_summary(summary)
+    print(f"\n{len(items)} items, {forecasts} forecasts ({skipped} cut-offs skipped) in {elapsed:.2f}s "
+          f"on {args.workers} workers: {throughput['items_per_sec']} items/sec, "
+          f"{throughput['forecasts_per_sec']} forecasts/sec, {cpu_seconds:.2f} CPU s")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "throughput": throughput,
+                       "summary": json.loads(summary.to_json(orient="records"))}, f, indent=2)
+        print(f"Results written to {args.save}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
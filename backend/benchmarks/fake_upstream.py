@@ -0,0 +1,245 @@
+"""Local stand-in for the Steam and marketplace APIs, used by the load test.
+
+Start it, then run the API with ``UPSTREAM_OVERRIDE_URL`` pointing at it::
+
+    python -m benchmarks.fake_upstream --port 9100 --latency 80 --jitter 40 --rate-429 0.02
+    UPSTREAM_OVERRIDE_URL=http://127.0.0.1:9100 fastapi run
+
+Requests arrive as ``/<original host>/<original path>``. Responses are built
+from the recorded fixtures, scaled to ``--size``.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from benchmarks import fixtures
+
+ICON_URL = "-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpot7HxfDhjxszJemkV09-5lpKKqPrxN7LEmyVQ7MEpiLuSrYmnjQO3-UdsZGHyd4_Bd1RvNQ7T_FDrw-_ng5Pu75iY1zI97bhLsvQz"
+
+
+class FakeUpstreamConfig:
+    def __init__(self, size: str = "medium", latency: float = 50.0, jitter: float = 20.0,
+                 dump_latency: float = 500.0, rate_429: float = 0.0, retry_after: Optional[int] = None,
+                 seed: int = 0):
+        self.sizes = fixtures.SIZES[size]
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.dump_latency = dump_latency / 1000
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.stats: Dict[str, int] = {}
+        self.stats_lock = threading.Lock()
+
+    def delay(self, base: float) -> float:
+        with self.rng_lock:
+            return max(0.0, self.rng.gauss(base, self.jitter))
+
+    def throttled(self) -> bool:
+        with self.rng_lock:
+            return self.rng.random() < self.rate_429
+
+    def count(self, key: str):
+        with self.stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+
+def item_price(name: str) -> float:
+    digest = hashlib.blake2b(name.encode("utf-8"), digest_size=4).digest()
+    return round(0.03 + int.from_bytes(digest, "big") % 500000 / 100, 2)
+
+
+@lru_cache(maxsize=None)
+def catalog(appid: str, size: int) -> Tuple[str, ...]:
+    names = [desc["market_hash_name"] for desc in fixtures.inventory(appid, size)["descriptions"]]
+    return tuple(dict.fromkeys(names))
+
+
+@lru_cache(maxsize=None)
+def inventory_body(appid: str, size: int) -> bytes:
+    return json.dumps(fixtures.inventory(appid, size), ensure_ascii=False).encode("utf-8")
+
+
+@lru_cache(maxsize=None)
+def schema_body(appid: str, size: int) -> bytes:
+    payload = {"result": {"status": 1, "items": fixtures.schema_items(appid, size)}}
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+@lru_cache(maxsize=None)
+def market_dump_body(appid: str, size: int) -> bytes:
+    items = [{"market_hash_name": name, "volume": str(1 + index % 300), "price": f"{item_price(name) * 0.93:.3f}"}
+             for index, name in enumerate(catalog(appid, size))]
+    return json.dumps({"success": True, "time": int(time.time()), "currency": "USD", "items": items},
+                      ensure_ascii=False).encode("utf-8")
+
+
+@lru_cache(maxsize=None)
+def lis_skins_body(appid: str, size: int) -> bytes:
+    items = [{"name": name, "price": round(item_price(name) * 0.9, 2), "count": 1 + index % 50}
+             for index, name in enumerate(catalog(appid, size))]
+    return json.dumps(items, ensure_ascii=False).encode("utf-8")
+
+
+@lru_cache(maxsize=4096)
+def listings_body(name: str, points: int) -> bytes:
+    history = fixtures.history(points)
+    scale = item_price(name) / history[-1][1]
+    line1 = [[date, round(price * scale, 3), volume] for date, price, volume in history]
+    return (f"<html><script>var line1={json.dumps(line1)};</script></html>").encode("utf-8")
+
+
+def search_results(appid: str, size: int, query: str, count: int) -> List[Dict[str, Any]]:
+    query = query.lower()
+    names = [name for name in catalog(appid, size) if query in name.lower()] if query else list(catalog(appid, size))
+    return [{
+        "name": name,
+        "hash_name": name,
+        "sell_listings": 1 + len(name) * 7,
+        "sell_price_text": f"${item_price(name):,.2f}",
+        "asset_description": {"appid": int(appid), "icon_url": ICON_URL, "market_hash_name": name},
+    } for name in names[:count]]
+
+
+ROUTES = [
+    ("inventory", re.compile(r"^/steamcommunity\.com/inventory/(\d+)/(\d+)/\d+$")),
+    ("search", re.compile(r"^/steamcommunity\.com/market/search/render/?$")),
+    ("listings", re.compile(r"^/steamcommunity\.com/market/listings/(\d+)/(.+)$")),
+    ("priceoverview", re.compile(r"^/steamcommunity\.com/market/priceoverview/?$")),
+    ("openid", re.compile(r"^/steamcommunity\.com/openid/login$")),
+    ("player_summaries", re.compile(r"^/api\.steampowered\.com/ISteamUser/GetPlayerSummaries/v0002/?$")),
+    ("schema", re.compile(r"^/api\.steampowered\.com/IEconItems_(\d+)/GetSchema/v2/?$")),
+    ("market_csgo", re.compile(r"^/market\.csgo\.com/api/v2/prices/USD\.json$")),
+    ("market_dota2", re.compile(r"^/market\.dota2\.net/api/v2/prices/USD\.json$")),
+    ("lis_skins", re.compile(r"^/lis-skins\.com/market_export_json/(csgo|dota2)\.json$")),
+]
+
+DUMP_ROUTES = {"schema", "market_csgo", "market_dota2", "lis_skins"}
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    config: FakeUpstreamConfig
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429 and self.config.retry_after is not None:
+            self.send_header("Retry-After", str(self.config.retry_after))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.handle_route()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        self.handle_route()
+
+    def handle_route(self):
+        parts = urlsplit(self.path)
+        path = unquote(parts.path)
+        params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+
+        for name, pattern in ROUTES:
+            match = pattern.match(path)
+            if match:
+                break
+        else:
+            self.config.count("not_found")
+            self.send_body(404, b'{"success": false}')
+            return
+
+        config = self.config
+        time.sleep(config.delay(config.dump_latency if name in DUMP_ROUTES else config.latency))
+        if name not in DUMP_ROUTES and config.throttled():
+            config.count(f"{name}:429")
+            self.send_body(429, b"null")
+            return
+        config.count(name)
+
+        sizes = config.sizes
+        if name == "inventory":
+            body = inventory_body(match.group(2), sizes["inventory"])
+        elif name == "search":
+            appid = params.get("appid", "730")
+            count = int(params.get("count", 10))
+            results = search_results(appid, sizes["inventory"], params.get("query", ""), count)
+            body = json.dumps({"success": True, "start": 0, "pagesize": count, "total_count": len(results),
+                               "results": results}, ensure_ascii=False).encode("utf-8")
+        elif name == "listings":
+            self.send_body(200, listings_body(match.group(2), sizes["history"]), "text/html; charset=utf-8")
+            return
+        elif name == "priceoverview":
+            price = item_price(params.get("market_hash_name", ""))
+            body = json.dumps({"success": True, "lowest_price": f"${price:.2f}", "volume": "42",
+                               "median_price": f"${price * 1.02:.2f}"}).encode("utf-8")
+        elif name == "openid":
+            self.send_body(200, b"ns:http://specs.openid.net/auth/2.0\nis_valid:true\n", "text/plain")
+            return
+        elif name == "player_summaries":
+            players = [{"steamid": steam_id, "personaname": f"player_{steam_id[-4:]}",
+                        "avatarfull": "https://via.placeholder.com/184"}
+                       for steam_id in params.get("steamids", "").split(",") if steam_id]
+            body = json.dumps({"response": {"players": players}}).encode("utf-8")
+        elif name == "schema":
+            body = schema_body(match.group(1), sizes["schema"])
+        elif name == "market_csgo":
+            body = market_dump_body("730", sizes["inventory"])
+        elif name == "market_dota2":
+            body = market_dump_body("570", sizes["inventory"])
+        else:
+            body = lis_skins_body("730" if match.group(1) == "csgo" else "570", sizes["inventory"])
+        self.send_body(200, body)
+
+
+def create_server(host: str, port: int, config: FakeUpstreamConfig) -> ThreadingHTTPServer:
+    handler = type("ConfiguredFakeUpstreamHandler", (FakeUpstreamHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Serve recorded Steam and marketplace responses locally")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--size", choices=list(fixtures.SIZES), default="medium")
+    parser.add_argument("--latency", type=float, default=50.0, help="mean latency of API calls, ms")
+    parser.add_argument("--jitter", type=float, default=20.0, help="latency standard deviation, ms")
+    parser.add_argument("--dump-latency", type=float, default=500.0, help="mean latency of bulk dumps, ms")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share of API calls answered with 429")
+    parser.add_argument("--retry-after", type=int, help="Retry-After seconds sent with 429 responses")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    config = FakeUpstreamConfig(args.size, args.latency, args.jitter, args.dump_latency,
+                                args.rate_429, args.retry_after, args.seed)
+    server = create_server(args.host, args.port, config)
+    print(f"Fake upstream listening on http://{args.host}:{args.port} (size={args.size})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(dict(sorted(config.stats.items())), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import copy
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Recorded payloads are a handful of real-shaped entries; larger sizes are
+# produced by replicating them with distinct names and classids so lookups
+# behave like a real catalog instead of hitting one key over and over.
+SIZES = {
+    "small": {"inventory": 50, "schema": 500, "dump": 1000, "history": 500},
+    "medium": {"inventory": 500, "schema": 5000, "dump": 20000, "history": 2000},
+    "large": {"inventory": 2000, "schema": 30000, "dump": 200000, "history": 8000},
+}
+
+
+@lru_cache(maxsize=None)
+def load_recorded(name: str) -> Any:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _variant_name(name: str, index: int) -> str:
+    return name if index == 0 else f"{name} #{index}"
+
+
+def inventory(appid: str, size: int) -> Dict[str, Any]:
+    recorded = load_recorded(f"inventory_{appid}.json")
+    assets, descriptions = [], []
+    base_assets = recorded["assets"]
+    base_descriptions = {desc["classid"]: desc for desc in recorded["descriptions"]}
+    for index in range(size):
+        asset = dict(base_assets[index % len(base_assets)])
+        desc = copy.deepcopy(base_descriptions[asset["classid"]])
+        copy_index = index // len(base_assets)
+        classid = f"{asset['classid']}{copy_index:05d}"
+        asset["classid"] = desc["classid"] = classid
+        asset["assetid"] = str(int(asset["assetid"]) + index)
+        desc["name"] = _variant_name(desc["name"], copy_index)
+        desc["market_hash_name"] = _variant_name(desc["market_hash_name"], copy_index)
+        assets.append(asset)
+        descriptions.append(desc)
+    return {"assets": assets, "descriptions": descriptions, "total_inventory_count": size, "success": 1}
+
+
+def schema_items(appid: str, size: int) -> List[Dict[str, Any]]:
+    base = load_recorded(f"schema_{appid}.json")["result"]["items"]
+    items = []
+    for index in range(size):
+        item = copy.deepcopy(base[index % len(base)])
+        item["name"] = _variant_name(item["name"], index // len(base))
+        items.append(item)
+    return items
+
+
+def market_dump_bytes(size: int) -> bytes:
+    recorded = load_recorded("market_csgo_prices.json")
+    base = recorded["items"]
+    rng = random.Random(size)
+    items = []
+    for index in range(size):
+        item = dict(base[index % len(base)])
+        item["market_hash_name"] = _variant_name(item["market_hash_name"], index // len(base))
+        item["price"] = f"{float(item['price']) * rng.uniform(0.8, 1.2):.3f}"
+        items.append(item)
+    payload = dict(recorded, items=items)
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def history(points: int, seed: Optional[int] = None) -> List[List]:
+    """Hourly ``line1`` points continuing the recorded series with a seeded random walk."""
+    recorded = load_recorded("history.json")
+    rng = random.Random(points if seed is None else seed)
+    start = datetime.strptime(recorded[0][0], "%b %d %Y %H: +0")
+    price = recorded[0][1]
+    series = []
+    for index in range(points):
+        timestamp = start + timedelta(hours=index)
+        price = max(0.03, price * (1 + rng.gauss(0, 0.01)))
+        volume = rng.randint(1, 1500)
+        series.append([timestamp.strftime("%b %d %Y %H: +0"), round(price, 3), f"{volume:,}"])
+    return series
@@ -0,0 +1,179 @@
+"""Load generator for the API, meant to run against ``benchmarks.fake_upstream``.
+
+    python -m benchmarks.fake_upstream --port 9100 &
+    UPSTREAM_OVERRIDE_URL=http://127.0.0.1:9100 uvicorn main:app --port 8000 &
+    python -m benchmarks.load --base-url http://127.0.0.1:8000 --duration 30 --concurrency 32
+
+Each worker picks an endpoint by the weights of ``--mix`` and an item from a
+working set of ``--items`` names, so the cache hit ratio follows from the
+working-set size. ``/predict_price`` only runs for items whose history was
+warmed up first, as the frontend does.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+from jose import jwt
+
+from benchmarks import fixtures
+
+DEFAULT_MIX = "inventory=1,price=6,history=3,predict_price=2,search_items=2"
+SEARCH_QUERIES = ["AK-47", "Redline", "Case", "Doppler", "Arcana", "Inscribed", "Sticker", "M4A1", "Hook", "Set"]
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class LoadRun:
+    def __init__(self, client: httpx.AsyncClient, token: str, names: Dict[str, List[str]], mix: Dict[str, float],
+                 seed: int):
+        self.client = client
+        self.token = token
+        self.names = names
+        self.endpoints = list(mix)
+        self.weights = list(mix.values())
+        self.rng = random.Random(seed)
+        self.latencies: Dict[str, List[float]] = {endpoint: [] for endpoint in self.endpoints}
+        self.statuses: Dict[Tuple[str, str], int] = {}
+
+    def request_for(self, endpoint: str) -> Tuple[str, Dict[str, str]]:
+        appid = self.rng.choice(["730", "570"])
+        name = self.rng.choice(self.names[appid])
+        if endpoint == "inventory":
+            return "/auth/inventory", {"token": self.token, "appid": appid}
+        if endpoint == "price":
+            return "/auth/price", {"token": self.token, "market_hash_name": name, "appid": appid}
+        if endpoint == "history":
+            return "/auth/history", {"token": self.token, "market_hash_name": name, "appid": appid}
+        if endpoint == "predict_price":
+            return "/auth/predict_price", {"token": self.token, "market_hash_name": name, "appid": appid,
+                                           "horizon": str(self.rng.randint(1, 14))}
+        if endpoint == "search_items":
+            return "/auth/search_items", {"appid": appid, "query": self.rng.choice(SEARCH_QUERIES)}
+        raise ValueError(f"Unknown endpoint {endpoint}")
+
+    async def call(self, endpoint: str, path: str, params: Dict[str, str]):
+        started = time.perf_counter()
+        try:
+            response = await self.client.get(path, params=params)
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.latencies[endpoint].append(time.perf_counter() - started)
+        self.statuses[(endpoint, status)] = self.statuses.get((endpoint, status), 0) + 1
+
+    async def warm_up(self, concurrency: int):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def warm(appid: str, name: str):
+            async with semaphore:
+                await self.client.get("/auth/history", params={
+                    "token": self.token, "market_hash_name": name, "appid": appid})
+
+        await asyncio.gather(*(warm(appid, name) for appid, names in self.names.items() for name in names))
+
+    async def worker(self, deadline: float):
+        while time.perf_counter() < deadline:
+            endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+            path, params = self.request_for(endpoint)
+            await self.call(endpoint, path, params)
+
+
+def report(run: LoadRun, elapsed: float) -> Dict[str, Dict]:
+    summary = {}
+    for endpoint, latencies in run.latencies.items():
+        if not latencies:
+            continue
+        summary[endpoint] = {
+            "requests": len(latencies),
+            "rps": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "mean_ms": statistics.fmean(latencies) * 1000,
+            "statuses": {status: count for (name, status), count in sorted(run.statuses.items()) if name == endpoint},
+        }
+    everything = [latency for latencies in run.latencies.values() for latency in latencies]
+    summary["total"] = {
+        "requests": len(everything),
+        "rps": len(everything) / elapsed,
+        "p50_ms": percentile(everything, 0.50) * 1000,
+        "p99_ms": percentile(everything, 0.99) * 1000,
+        "mean_ms": statistics.fmean(everything) * 1000 if everything else 0.0,
+    }
+    return summary
+
+
+def print_report(summary: Dict[str, Dict]):
+    header = f"{'endpoint':<16} {'requests':>9} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}  statuses"
+    print(header)
+    print("-" * len(header))
+    for endpoint, row in summary.items():
+        statuses = " ".join(f"{status}:{count}" for status, count in row.get("statuses", {}).items())
+        print(f"{endpoint:<16} {row['requests']:>9} {row['rps']:>9.1f} {row['p50_ms']:>9.1f} {row['p99_ms']:>9.1f}"
+              f"  {statuses}")
+
+
+async def run_load(args) -> Dict[str, Dict]:
+    token = jwt.encode({"steam_id": args.steam_id}, args.secret, algorithm="HS256")
+    names = {appid: [desc["market_hash_name"] for desc in fixtures.inventory(appid, args.items)["descriptions"]]
+             for appid in ("730", "570")}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        run = LoadRun(client, token, names, parse_mix(args.mix), args.seed)
+        if "predict_price" in run.endpoints and not args.skip_warm_up:
+            print(f"Warming up history for {sum(len(n) for n in names.values())} items...")
+            await run.warm_up(args.concurrency)
+
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(run.worker(deadline) for _ in range(args.concurrency)))
+        return report(run, time.perf_counter() - started)
+
+
+def main(argv: Optional[List[str]] = None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Drive the API with a realistic request mix")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint weights, e.g. price=6,history=3")
+    parser.add_argument("--items", type=int, default=200, help="working set of item names per appid")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--steam-id", default="76561198000000000")
+    parser.add_argument("--secret", default=os.getenv("JWT_SECRET_KEY"), help="defaults to JWT_SECRET_KEY")
+    parser.add_argument("--skip-warm-up", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the report as JSON")
+    args = parser.parse_args(argv)
+    if not args.secret:
+        parser.error("JWT secret is required (--secret or JWT_SECRET_KEY)")
+
+    summary = asyncio.run(run_load(args))
+    print_report(summary)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Micro-benchmarks for the backend hot paths.
+
+Run from the ``backend`` directory::
+
+    python -m benchmarks.run                              # all benchmarks, all sizes
+    python -m benchmarks.run --sizes small -k inventory   # subset
+    python -m benchmarks.run --save benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json --tolerance 0.15
+
+With ``--compare`` the exit code is 1 when any benchmark lost more than
+``--tolerance`` of its throughput or grew its peak memory by more than that.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from benchmarks import fixtures
+from auth.arbitrage import SELL_FEES, book_frame, compute_spreads
+from auth.ingest import iter_json_array
+from auth.items import build_properties_map, classify_inventory, normalize_market_hash_name
+from auth.prediction import predict_price, prepare_prediction_data
+from auth.price_books import parse_price_book_rows
+from auth.serialization import decode_value, dumps, encode_value
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "auth")
+
+
+class Benchmark(NamedTuple):
+    name: str
+    size: str
+    setup: Callable[[], Callable[[], Any]]
+
+
+def _load_model(appid: str):
+    import joblib
+    return joblib.load(os.path.join(MODELS_DIR, f"xgboost_model_{appid}.joblib"))
+
+
+def _bench_build_properties_map(appid: str, size: int):
+    schema = fixtures.schema_items(appid, size)
+    return lambda: build_properties_map(schema, appid)
+
+
+def _bench_classify_inventory(appid: str, schema_size: int, size: int):
+    properties_map = build_properties_map(fixtures.schema_items(appid, schema_size), appid)
+    data = fixtures.inventory(appid, size)
+    return lambda: classify_inventory(data, appid, properties_map)
+
+
+def _bench_normalize(size: int):
+    names = [item["name"] for item in fixtures.schema_items("730", size)]
+    return lambda: [normalize_market_hash_name(name) for name in names]
+
+
+def _bench_prepare(points: int):
+    history = fixtures.history(points)
+    return lambda: prepare_prediction_data(history)
+
+
+def _bench_predict(points: int):
+    model = _load_model("730")
+    data = prepare_prediction_data(fixtures.history(points))
+    return lambda: predict_price(model, data, 14)
+
+
+def _bench_serialize_prediction(points: int):
+    model = _load_model("730")
+    result = predict_price(model, prepare_prediction_data(fixtures.history(points)), 14)
+    payload = {"items": [result] * max(1, points // 100)}
+    return lambda: dumps(payload)
+
+
+def _bench_encode_history(points: int):
+    history = fixtures.history(points)
+    return lambda: encode_value(history)
+
+
+def _bench_decode_history(points: int):
+    stored = encode_value(fixtures.history(points))
+    return lambda: decode_value(stored)
+
+
+def _bench_dump_parse(size: int):
+    payload = fixtures.market_dump_bytes(size)
+    chunks = [payload[i:i + 65536] for i in range(0, len(payload), 65536)]
+    return lambda: parse_price_book_rows(list(iter_json_array(chunks, "items")), "market_hash_name")
+
+
+def _bench_arbitrage(size: int):
+    rows = parse_price_book_rows(list(iter_json_array([fixtures.market_dump_bytes(size)], "items")), "market_hash_name")
+    books = {
+        "market_csgo": book_frame(rows),
+        "lis_skins_730": book_frame([(name, price * 0.97, volume) for name, price, volume in rows[::-1]]),
+    }
+    return lambda: compute_spreads(books, SELL_FEES)
+
+
+def build_benchmarks() -> List[Benchmark]:
+    benchmarks = []
+    for size_name, size in fixtures.SIZES.items():
+        benchmarks += [
+            Benchmark("build_properties_map[730]", size_name,
+                      lambda s=size: _bench_build_properties_map("730", s["schema"])),
+            Benchmark("build_properties_map[570]", size_name,
+                      lambda s=size: _bench_build_properties_map("570", s["schema"])),
+            Benchmark("classify_inventory[730]", size_name,
+                      lambda s=size: _bench_classify_inventory("730", s["schema"], s["inventory"])),
+            Benchmark("classify_inventory[570]", size_name,
+                      lambda s=size: _bench_classify_inventory("570", s["schema"], s["inventory"])),
+            Benchmark("normalize_market_hash_name", size_name, lambda s=size: _bench_normalize(s["schema"])),
+            Benchmark("prepare_prediction_data", size_name, lambda s=size: _bench_prepare(s["history"])),
+            Benchmark("predict_price[14d]", size_name, lambda s=size: _bench_predict(s["history"])),
+            Benchmark("serialize_prediction", size_name, lambda s=size: _bench_serialize_prediction(s["history"])),
+            Benchmark("cache_encode_history", size_name, lambda s=size: _bench_encode_history(s["history"])),
+            Benchmark("cache_decode_history", size_name, lambda s=size: _bench_decode_history(s["history"])),
+            Benchmark("price_dump_stream_parse", size_name, lambda s=size: _bench_dump_parse(s["dump"])),
+            Benchmark("arbitrage_compute_spreads", size_name, lambda s=size: _bench_arbitrage(s["dump"])),
+        ]
+    return benchmarks
+
+
+def measure(fn: Callable[[], Any], repeats: int, min_time: float) -> Dict[str, float]:
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    timings = [t / number for t in timer.repeat(repeat=repeats, number=number)]
+
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(timings)
+    return {
+        "ops_per_sec": 1 / median if median else float("inf"),
+        "median_ms": median * 1000,
+        "best_ms": min(timings) * 1000,
+        "peak_kib": peak / 1024,
+    }
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float) -> List[str]:
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if not previous:
+            continue
+        speed = result["ops_per_sec"] / previous["ops_per_sec"] - 1
+        memory = result["peak_kib"] / previous["peak_kib"] - 1 if previous["peak_kib"] else 0
+        result["ops_change"] = speed
+        result["memory_change"] = memory
+        if speed < -tolerance:
+            regressions.append(f"{key}: throughput {speed:+.1%}")
+        if memory > tolerance:
+            regressions.append(f"{key}: peak memory {memory:+.1%}")
+    return regressions
+
+
+def print_table(results: Dict[str, Dict[str, float]]):
+    header = f"{'benchmark':<42} {'ops/sec':>12} {'median ms':>11} {'peak KiB':>11} {'vs base':>9} {'mem vs':>8}"
+    print(header)
+    print("-" * len(header))
+    for key, result in results.items():
+        ops_change = f"{result['ops_change']:+.1%}" if "ops_change" in result else ""
+        memory_change = f"{result['memory_change']:+.1%}" if "memory_change" in result else ""
+        print(f"{key:<42} {result['ops_per_sec']:>12.1f} {result['median_ms']:>11.3f} "
+              f"{result['peak_kib']:>11.1f} {ops_change:>9} {memory_change:>8}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run backend micro-benchmarks")
+    parser.add_argument("--sizes", nargs="+", choices=list(fixtures.SIZES), default=list(fixtures.SIZES))
+    parser.add_argument("-k", dest="keyword", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timing repeat")
+    parser.add_argument("--save", help="write results to this JSON file as a new baseline")
+    parser.add_argument("--compare", help="compare against a baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Dict[str, float]] = {}
+    for benchmark in build_benchmarks():
+        if benchmark.size not in args.sizes:
+            continue
+        if args.keyword and args.keyword not in benchmark.name:
+            continue
+        key = f"{benchmark.name}/{benchmark.size}"
+        try:
+            fn = benchmark.setup()
+        except (ImportError, FileNotFoundError) as e:
+            print(f"skipping {key}: {e}", file=sys.stderr)
+            continue
+        results[key] = measure(fn, args.repeats, args.min_time)
+        print(f"{key}: {results[key]['ops_per_sec']:.1f} ops/sec", file=sys.stderr)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+
+    print_table(results)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "results": results},
+                      f, indent=2)
+        print(f"Baseline written to {args.save}")
+
+    if regressions:
+        print("\nRegressions beyond tolerance:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -613,10 +613,12 @@ const FavoritesPage = () => {
     setHistoryLoading(true);
     try {
       const token = localStorage.getItem('auth_token');
-      const response = await axios.get(`http://localhost:8000/auth/history`, {
-        params: { token, market_hash_name: item.market_hash_name, appid: item.appid }
-      });
-      const convertedHistory = response.data.history.map(data => {
+      const response = await axios.post(`http://localhost:8000/auth/history/batch`, {
+        items: [{ appid: item.appid, market_hash_name: item.market_hash_name }],
+        points: 500
+      }, { params: { token } });
+      const history = response.data.series[`${item.appid}:${item.market_hash_name}`] || [];
+      const convertedHistory = history.map(data => {
         const price = parseFloat(data[1]);
         const convertedPrice = currency === '$' ? price : price * exchangeRate[currency];
         return [data[0], convertedPrice.toString()];